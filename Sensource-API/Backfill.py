@@ -0,0 +1,220 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from YearToDate import GateCountFetcher, logger
+from Rollups import refresh_rollups, touch_range
+from Coverage import REPAIR_STATUSES, default_range, find_gaps
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from ApiClient import backoff_delay
+from ZooStore import connect_store, rollback, store_cursor
+from GateWeather import refresh_gate_weather
+from PipelineRuns import PipelineRun
+
+WINDOW_SIZES = {'day': timedelta(days=1), 'week': timedelta(days=7)}
+
+
+def split_windows(start, end, window='week'):
+    """Split the inclusive date range start..end into consecutive (first_day, last_day) windows"""
+    step = WINDOW_SIZES[window]
+    windows = []
+    current = start
+    while current <= end:
+        last = min(current + step - timedelta(days=1), end)
+        windows.append((current, last))
+        current = last + timedelta(days=1)
+    return windows
+
+
+def gap_windows(days, window='week'):
+    """Group sorted days into runs of consecutive days, split into (first_day, last_day) windows of at most window"""
+    windows = []
+    run_start = previous = None
+    for day in days + [None]:
+        if previous is not None and (day is None or day - previous > timedelta(days=1)):
+            windows.extend(split_windows(run_start, previous, window))
+            run_start = None
+        if run_start is None:
+            run_start = day
+        previous = day
+    return windows
+
+
+def ensure_progress_table(con):
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS BackfillProgress (
+            WindowStart DATE PRIMARY KEY,
+            WindowEnd DATE,
+            Rows INTEGER,
+            CompletedAt TIMESTAMP
+        );
+    """)
+
+
+def completed_windows(con):
+    return {row[0] for row in con.execute("SELECT WindowStart FROM BackfillProgress;").fetchall()}
+
+
+def load_with_retry(fetcher, con, window, retries=3, backoff=2.0, run=None, refresh=False, progress=True):
+    """Stream one window into DuckDB on its own cursor, retrying it with exponential backoff and jitter.
+
+    refresh=True fetches past the response cache; progress=False leaves BackfillProgress alone.
+    """
+    first, last = window
+    startDate, endDate = first.strftime('%m-%d-%Y'), last.strftime('%m-%d-%Y')
+    cursor = store_cursor(con)  # each worker gets its own connection to the same database
+    fetched = False
+    try:
+        for attempt in range(1, retries + 1):
+            try:
+                if not fetched:  # a window that was fetched but failed to write is not requested again
+                    fetcher.fetch_window(cursor, startDate, endDate, run, refresh)
+                    fetched = True
+                # New sensors are committed before the window's transaction, so workers never race to insert them
+                fetcher.add_new_sensors(cursor)
+                cursor.execute("BEGIN TRANSACTION;")
+                rows = fetcher.store_window(cursor, startDate, endDate, run)
+                if progress:
+                    cursor.execute(
+                        "INSERT OR REPLACE INTO BackfillProgress VALUES (?, ?, ?, ?);",
+                        [first, last, rows, datetime.now()]
+                    )
+                cursor.execute("COMMIT;")
+                return rows
+            except Exception as e:
+                rollback(cursor)
+                if attempt == retries:
+                    raise
+                delay = backoff_delay(attempt, backoff)
+                if run is not None:
+                    run.add('retry_wait', delay)
+                logger.warning(f"Window {first}..{last} failed ({e}), retry {attempt}/{retries - 1} in {delay:.1f}s")
+                time.sleep(delay)
+    finally:
+        cursor.close()
+
+
+def load_windows(fetcher, con, windows, workers, retries, run, refresh=False, progress=True):
+    """Load windows on a pool of workers, adding their rows to run.rows; returns the windows that failed"""
+    failed = []
+    run.rows = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(load_with_retry, fetcher, con, w, retries, run=run, refresh=refresh, progress=progress): w
+            for w in windows
+        }
+        for future in as_completed(futures):
+            first, last = futures[future]
+            try:
+                rows = future.result()
+            except Exception as e:
+                logger.warning(f"Failure! Window {first}..{last}: {e}")
+                failed.append((first, last))
+                continue
+            run.rows += rows
+            logger.info(f"Window {first}..{last} written ({rows:,} rows)")
+    return failed
+
+
+def backfill(start, end, window='week', workers=4, retries=3, resume=True):
+    """Fetch start..end in parallel windows, writing each window to DuckDB as soon as it arrives.
+
+    Finished windows are recorded in BackfillProgress, so re-running the same range after a
+    failure only fetches the windows that are still missing.
+    """
+    fetcher = GateCountFetcher()
+    # Stage times are summed over the workers, so they can add up to more than the run's wall time
+    with PipelineRun('backfill', logger) as run:
+        con = connect_store('gate')
+        try:
+            ensure_progress_table(con)
+            fetcher.ensure_table(con)
+            done = completed_windows(con) if resume else set()
+            pending = [w for w in split_windows(start, end, window) if w[0] not in done]
+            logger.info(f"Backfilling {start}..{end}: {len(pending)} {window} windows pending, {len(done)} already done")
+
+            # Each worker streams its window into the database and commits it together with its progress row
+            failed = load_windows(fetcher, con, pending, workers, retries, run)
+            # Refresh the whole range (so an interrupted earlier run is covered too), plus a day either
+            # side because UTC records near midnight can land on a neighbouring local day
+            touch_range(con, start - timedelta(days=1), end + timedelta(days=1))
+            with run.stage('rollups') as counts:
+                counts.rows = refresh_rollups(con)
+            logger.info(f"Rollups refreshed for {counts.rows:,} days")
+            with run.stage('gate_weather') as counts:
+                counts.rows = refresh_gate_weather(con)
+            logger.info(f"Gate x weather intervals refreshed: {counts.rows:,}")
+        finally:
+            con.close()
+        if failed:
+            run.status = 'partial'
+
+    if failed:
+        logger.warning(f"{len(failed)} windows failed; re-run the same command to resume")
+    else:
+        logger.info("Backfill complete")
+    return failed
+
+
+def repair(start=None, end=None, include_short=False, window='week', workers=4, retries=3):
+    """Re-fetch only the days SensorCoverage reports as gaps between start and end (default: this year to yesterday).
+
+    Missing and partial days are repaired, short ones too with include_short; the days are grouped into
+    windows of consecutive days and fetched past the response cache. Returns the windows that failed.
+    """
+    first_day, last_day = default_range()
+    start, end = start or first_day, end or last_day
+    statuses = REPAIR_STATUSES + (('short',) if include_short else ())
+    fetcher = GateCountFetcher()
+    with PipelineRun('repair', logger) as run:
+        con = connect_store('gate')
+        try:
+            fetcher.ensure_table(con)
+            gaps = [gap for gap in find_gaps(con, start, end) if gap[1] in statuses]
+            windows = gap_windows([gap[0] for gap in gaps], window)
+            logger.info(f"Repairing {start}..{end}: {len(gaps)} gap days in {len(windows)} windows")
+            for day, status, short, silent, fetched_at in gaps:
+                logger.info(f"  {day} {status}" + (f" ({short} short sensors)" if short else ""))
+            if not windows:
+                return []
+            failed = load_windows(fetcher, con, windows, workers, retries, run, refresh=True, progress=False)
+            for first, last in windows:
+                touch_range(con, first - timedelta(days=1), last + timedelta(days=1))
+            with run.stage('rollups') as counts:
+                counts.rows = refresh_rollups(con)
+            with run.stage('gate_weather') as counts:
+                counts.rows = refresh_gate_weather(con)
+        finally:
+            con.close()
+        if failed:
+            run.status = 'partial'
+
+    if failed:
+        logger.warning(f"{len(failed)} windows still failed; re-run the repair to retry them")
+    else:
+        logger.info("Repair complete")
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill Sensource 15-minute gate data into the zoo store")
+    parser.add_argument('--start', required=True, help="first day to fetch (YYYY-MM-DD)")
+    parser.add_argument('--end', default=datetime.today().strftime('%Y-%m-%d'), help="last day to fetch (YYYY-MM-DD)")
+    parser.add_argument('--window', choices=WINDOW_SIZES, default='week')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--retries', type=int, default=3)
+    parser.add_argument('--no-resume', action='store_true', help="re-fetch windows already marked as done")
+    args = parser.parse_args()
+
+    backfill(
+        datetime.strptime(args.start, '%Y-%m-%d').date(),
+        datetime.strptime(args.end, '%Y-%m-%d').date(),
+        window=args.window,
+        workers=args.workers,
+        retries=args.retries,
+        resume=not args.no_resume,
+    )
@@ -0,0 +1,226 @@
+"""Fetch coverage of the 15-minute gate counts: which (day, sensor) windows Sensource answered.
+
+SensorCount leaves all-zero intervals out and failed fetches leave nothing behind either, so a missing
+interval can be a quiet gate or a lost request. SensorCoverage tells them apart: every window that loads
+records, per day and per known sensor, how many open-hour intervals the response held (zeros included,
+0 when the sensor sent nothing) and when it was fetched. Days stored before coverage was tracked are
+seeded from SensorCount with FetchedAt NULL.
+
+A day is a gap when it is
+    missing  no window covering it has loaded
+    partial  it was last fetched before the day was over
+    empty    it was fetched, but no sensor returned a single interval (Sensource's empty-results outage,
+             or a day the zoo was closed)
+    short    a sensor returned some open-hour intervals, but fewer than the busiest sensor that day
+    silent   a sensor returned nothing while others reported (an offline or not yet installed sensor)
+
+Backfill.repair re-fetches the missing, partial and empty days (and the short ones on request) only.
+"""
+import argparse
+import logging
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+from SensorCounts import ensure_sensor_storage
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from ZooStore import connect_store, print_query
+
+logger = logging.getLogger("GateCountFetcher")
+
+COVERAGE_TABLE = 'SensorCoverage'
+COVERAGE_STAGING = 'SensorCoverageStaging'
+COVERAGE_DDL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        Date DATE, SensorKey SMALLINT, Intervals INTEGER, FetchedAt TIMESTAMP,
+        PRIMARY KEY (Date, SensorKey)
+    );
+"""
+GAP_STATUSES = ('missing', 'partial', 'empty', 'short', 'silent')
+REPAIR_STATUSES = ('missing', 'partial', 'empty')
+
+
+def table_exists(con, table):
+    return con.execute(f"""
+        SELECT COUNT(*) FROM duckdb_tables() WHERE schema_name = current_schema() AND table_name = '{table}';
+    """).fetchone()[0] > 0
+
+
+def ensure_coverage_table(con):
+    """Create SensorCoverage, seeding it from the counts already stored the first time"""
+    if table_exists(con, COVERAGE_TABLE):
+        return
+    con.execute(COVERAGE_DDL.format(table=COVERAGE_TABLE))
+    rows = seed_coverage(con)
+    if rows:
+        logger.info(f"Seeded {COVERAGE_TABLE} with {rows:,} sensor days from the stored counts")
+
+
+def seed_coverage(con, source='SensorCount', table=COVERAGE_TABLE):
+    """Mark every (day, sensor) with stored counts in source as covered, with FetchedAt NULL; returns the rows added.
+
+    Only the non-zero intervals were stored, so Intervals is a lower bound and the day is never counted as short.
+    """
+    return con.execute(f"""
+        INSERT OR IGNORE INTO {table}
+        SELECT CAST(DateTime AS DATE), SensorKey, COUNT(*), NULL
+        FROM {source}
+        GROUP BY ALL;
+    """).fetchone()[0]
+
+
+def coverage_table(target):
+    """Coverage table that goes with a SensorCount load target (the staging table for a full load)"""
+    return COVERAGE_TABLE if target == 'SensorCount' else COVERAGE_STAGING
+
+
+def create_coverage_staging(con):
+    """Start an empty SensorCoverageStaging for a full load (dropping one left by a failed run)"""
+    con.execute(f"DROP TABLE IF EXISTS {COVERAGE_STAGING};")
+    con.execute(COVERAGE_DDL.format(table=COVERAGE_STAGING))
+    return COVERAGE_STAGING
+
+
+def swap_in_coverage(con):
+    """Replace the days SensorCoverageStaging covers in SensorCoverage; run it in the transaction that swaps in SensorCount"""
+    con.execute(f"""
+        DELETE FROM {COVERAGE_TABLE}
+        WHERE Date BETWEEN (SELECT MIN(Date) FROM {COVERAGE_STAGING}) AND (SELECT MAX(Date) FROM {COVERAGE_STAGING});
+    """)
+    con.execute(f"INSERT INTO {COVERAGE_TABLE} SELECT * FROM {COVERAGE_STAGING};")
+    con.execute(f"DROP TABLE {COVERAGE_STAGING};")
+
+
+def record_coverage(con, source, startDate, endDate, table=COVERAGE_TABLE):
+    """Record the days of a window that loaded (startDate..endDate, up to today) as fetched; returns the rows written.
+
+    source holds the window's staged sensor rows, all-zero intervals included. Every registered sensor gets
+    a row per day, with 0 intervals when the response had nothing for it; what the days held before
+    (seeded rows included) is replaced.
+    """
+    first = datetime.strptime(startDate, '%m-%d-%Y').date()
+    last = min(datetime.strptime(endDate, '%m-%d-%Y').date(), date.today())
+    if first > last:
+        return 0
+    con.execute(f"DELETE FROM {table} WHERE Date BETWEEN ? AND ?;", [first, last])
+    return con.execute(f"""
+        INSERT INTO {table}
+        WITH days AS (
+            SELECT CAST(d AS DATE) AS Date FROM generate_series(?::DATE, ?::DATE, INTERVAL 1 DAY) t(d)
+        ),
+        fetched AS (
+            SELECT CAST(DateTime AS DATE) AS Date, SensorKey, COUNT(*) AS Intervals FROM {source} GROUP BY ALL
+        )
+        SELECT d.Date, s.SensorKey, COALESCE(f.Intervals, 0), ?
+        FROM days d
+        CROSS JOIN SensorGate s
+        LEFT JOIN fetched f ON f.Date = d.Date AND f.SensorKey = s.SensorKey
+        WHERE s.SensorKey > 0;
+    """, [first, last, datetime.now()]).fetchone()[0]
+
+
+def find_gaps(con, first, last):
+    """[(Date, Status, short sensors, silent sensors, FetchedAt)] for the days from first to last that are gaps"""
+    return con.execute(f"""
+        WITH days AS (
+            SELECT CAST(d AS DATE) AS Date FROM generate_series(?::DATE, ?::DATE, INTERVAL 1 DAY) t(d)
+        ),
+        coverage AS (
+            SELECT *, MAX(CASE WHEN FetchedAt IS NOT NULL THEN Intervals END) OVER (PARTITION BY Date) AS OpenIntervals
+            FROM {COVERAGE_TABLE}
+            WHERE Date BETWEEN ? AND ?
+        ),
+        per_day AS (
+            SELECT
+                Date,
+                bool_or(FetchedAt < Date + INTERVAL 1 DAY) AS partial,
+                MAX(OpenIntervals) = 0 AS empty,
+                COUNT(*) FILTER (WHERE SensorKey > 0 AND FetchedAt IS NOT NULL AND Intervals BETWEEN 1 AND OpenIntervals - 1) AS short,
+                COUNT(*) FILTER (WHERE SensorKey > 0 AND FetchedAt IS NOT NULL AND Intervals = 0 AND OpenIntervals > 0) AS silent,
+                MAX(FetchedAt) AS FetchedAt
+            FROM coverage
+            GROUP BY Date
+        )
+        SELECT
+            d.Date,
+            CASE
+                WHEN p.Date IS NULL THEN 'missing' WHEN p.partial THEN 'partial' WHEN p.empty THEN 'empty'
+                WHEN p.short > 0 THEN 'short' ELSE 'silent'
+            END,
+            COALESCE(p.short, 0), COALESCE(p.silent, 0), p.FetchedAt
+        FROM days d
+        LEFT JOIN per_day p ON p.Date = d.Date
+        WHERE p.Date IS NULL OR p.partial OR p.empty OR p.short > 0 OR p.silent > 0
+        ORDER BY d.Date;
+    """, [first, last, first, last]).fetchall()
+
+
+def default_range():
+    """The start of the year to yesterday, the days a year-to-date fetch should have covered completely"""
+    today = date.today()
+    return date(today.year, 1, 1), today - timedelta(days=1)
+
+
+def store_gaps(start=None, end=None):
+    """find_gaps on the zoo store from start to end (default_range() by default), creating SensorCoverage on first use"""
+    first_day, last_day = default_range()
+    con = connect_store('gate')
+    try:
+        ensure_sensor_storage(con)
+        ensure_coverage_table(con)
+        return find_gaps(con, start or first_day, end or last_day)
+    finally:
+        con.close()
+
+
+def print_gaps(gaps):
+    counts = {status: sum(1 for gap in gaps if gap[1] == status) for status in GAP_STATUSES}
+    print(", ".join(f"{counts[status]} {status}" for status in GAP_STATUSES) + " days")
+    for day, status, short, silent, fetched_at in gaps:
+        detail = f"{short} short, {silent} silent sensors" if status not in ('missing', 'empty') else ""
+        fetched = f"fetched {fetched_at:%Y-%m-%d %H:%M}" if fetched_at else ""
+        print(f"{day}  {status:<8} {detail:<28} {fetched}")
+
+
+def print_coverage(con):
+    """Days and sensors covered per month, split into fetched and seeded (FetchedAt NULL) days"""
+    print_query(con, f"""
+        SELECT
+            strftime(Date, '%Y-%m') AS month,
+            COUNT(DISTINCT Date) FILTER (WHERE FetchedAt IS NOT NULL) AS fetched_days,
+            COUNT(DISTINCT Date) FILTER (WHERE FetchedAt IS NULL) AS seeded_days,
+            COUNT(DISTINCT SensorKey) FILTER (WHERE Intervals > 0) AS sensors,
+            SUM(Intervals) AS intervals
+        FROM {COVERAGE_TABLE}
+        GROUP BY ALL
+        ORDER BY month;
+    """)
+
+
+if __name__ == "__main__":
+    first_day, last_day = default_range()
+    parser = argparse.ArgumentParser(description="Report (and repair) gaps in the 15-minute gate counts")
+    parser.add_argument('--start', default=first_day.isoformat(), help="first day to check (YYYY-MM-DD, default: start of the year)")
+    parser.add_argument('--end', default=last_day.isoformat(), help="last day to check (YYYY-MM-DD, default: yesterday)")
+    parser.add_argument('--summary', action='store_true', help="print the coverage per month as well")
+    parser.add_argument('--repair', action='store_true', help="re-fetch the missing and partial days")
+    parser.add_argument('--include-short', action='store_true', help="with --repair, re-fetch the short days too")
+    args = parser.parse_args()
+    start = datetime.strptime(args.start, '%Y-%m-%d').date()
+    end = datetime.strptime(args.end, '%Y-%m-%d').date()
+
+    if args.repair:
+        from Backfill import repair
+        failed = repair(start, end, include_short=args.include_short)
+        sys.exit(1 if failed else 0)
+
+    gaps = store_gaps(start, end)
+    if args.summary:
+        con = connect_store('gate', read_only=True)
+        try:
+            print_coverage(con)
+        finally:
+            con.close()
+        print()
+    print_gaps(gaps)
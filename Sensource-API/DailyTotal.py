@@ -1,38 +1,52 @@
 import os
-import requests
-import pandas as pd
 import duckdb
+import pyarrow as pa
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import logging
 import sys
 from rich.logging import RichHandler
 import warnings
+from SensorGates import GATE_IDS, ensure_sensor_table, register_sensors
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from ApiClient import get_client
+from ZooStore import check_staging, connect_store, record_changed_days, rollback, store_path
+from PipelineRuns import PipelineRun
 
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
+# Fields of the daily traffic results that are used; any others are ignored
+DAILY_TRAFFIC_SCHEMA = pa.schema([('recordDate_day_1', pa.string()), ('name', pa.string()), ('sumins', pa.int64())])
+
+# Columns of DailyGateCount, as the staged rows must have them
+DAILY_COLUMNS = [('Date', 'DATE'), ('Gate', 'VARCHAR'), ('GateCount', 'INTEGER')]
+
 # Configure logging
 logger = logging.getLogger("GateCountFetcher")
 logger.setLevel(logging.INFO)
 formatter = logging.Formatter('[%(asctime)s] [%(levelname)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
 
-# Rich console handler
-rich_handler = RichHandler(rich_tracebacks=True, show_time=False, show_level=True, show_path=False)
-rich_handler.setFormatter(formatter)
-logger.addHandler(rich_handler)
+# Both fetchers share this logger, so only the first one imported into a process adds the handlers
+if not logger.handlers:
+    # Rich console handler
+    rich_handler = RichHandler(rich_tracebacks=True, show_time=False, show_level=True, show_path=False)
+    rich_handler.setFormatter(formatter)
+    logger.addHandler(rich_handler)
+
+    # File handler
+    file_handler = logging.FileHandler(os.path.join(os.path.dirname(__file__), '.', 'logs', 'GateCount.log'))
+    file_handler.setLevel(logging.INFO)
+    file_handler.setFormatter(formatter)
+    logger.addHandler(file_handler)
 
-# File handler
-file_handler = logging.FileHandler(os.path.join(os.path.dirname(__file__), '.', 'logs', 'GateCount.log'))
-file_handler.setLevel(logging.INFO)
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
 
 class GateCountFetcher:
     def __init__(self, env_path='.env'):
         load_dotenv(env_path)
         self.api_token = os.getenv("SENSOURCE_TOKEN")
-        self.south_gate = 'decd9257-660d-412b-a019-1bd44f0aecd9'
-        self.tlw_gate = 'b49b0f74-7af5-480c-a8ef-bb1a090731cf'
+        self.south_gate = GATE_IDS['SOUTH GATE']
+        self.tlw_gate = GATE_IDS['THE LIVING WORLD']
 
     def get_gate_count(self, date=None, to_db=True):
         if date is None:
@@ -51,26 +65,132 @@ class GateCountFetcher:
         
         # Ref: https://vea.sensourceinc.com/api-docs/
         url = (
-            f"https://vea.sensourceinc.com/api/data/traffic?relativeDate={relativeDate}"
+            f"/api/data/traffic?relativeDate={relativeDate}"
             f"&dateGroupings={dateGroupings}&entityType={entityType}"
             f"&excludeClosedHours={excludeClosedHours}&metrics={metrics}"
         )
-        response = requests.get(url, headers=headers).json()
-        
-        df = pd.DataFrame.from_dict(response['results'])
-        df = df[['recordDate_day_1', 'name', 'sumins']]
-        df = df.rename(columns={'recordDate_day_1': 'Date', 'name': 'location', 'sumins': 'GateCount'})
-        df = df[df.GateCount != 0]
-        df['Gate'] = df['location'].apply(lambda x: 'THE LIVING WORLD' if x in ['Treetop', 'TLW1'] else 'SOUTH GATE')
-        df = df.groupby(['Date', 'Gate'], as_index=False)['GateCount'].sum()
-        if to_db:
-            self.write_to_db(df)
+        today = datetime.today().date()
+        with PipelineRun('daily', logger, record=to_db) as run:
+            with run.stage('fetch') as counts:
+                response = get_client('sensource').get(
+                    url, headers=headers, validate=lambda r: 'results' in r.json(), window=(today, today)
+                )
+                counts.bytes = len(response.content)
+
+            with run.stage('parse') as counts:
+                traffic = pa.Table.from_pylist(response.json()['results'], schema=DAILY_TRAFFIC_SCHEMA)
+                counts.rows = traffic.num_rows
+            with run.stage('map_to_gates') as counts:
+                df = self.map_to_gates(traffic, to_db)
+                counts.rows = run.rows = len(df)
+            if to_db:
+                with run.stage('write') as counts:
+                    self.write_to_db(df)
+                    counts.rows = len(df)
         return df
 
+    def map_to_gates(self, traffic, to_db=True):
+        """Sum the nonzero sensor counts of traffic (an Arrow table) per gate using the gate.SensorGate table in the zoo store.
+
+        With to_db=False the store is only read: new sensors go into an in-memory copy of SensorGate.
+        """
+        con = connect_store('gate') if to_db else self.sensor_gate_copy()
+        try:
+            con.register('sensor_counts', traffic)
+            ensure_sensor_table(con)
+            register_sensors(con, '(SELECT name FROM sensor_counts WHERE sumins != 0)')
+            return con.execute("""
+                SELECT d.recordDate_day_1 AS Date, s.Gate, SUM(d.sumins)::INTEGER AS GateCount
+                FROM sensor_counts d
+                JOIN SensorGate s ON s.SensorName = d.name
+                WHERE d.sumins != 0
+                GROUP BY ALL
+                ORDER BY Date, s.Gate;
+            """).fetchdf()
+        finally:
+            con.close()
+
+    def sensor_gate_copy(self):
+        """In-memory database holding SensorGate as the zoo store has it (seeded only, if there is no store yet)"""
+        con = duckdb.connect(database=':memory:')
+        ensure_sensor_table(con)
+        if not os.path.exists(store_path()):
+            return con
+        store = connect_store('gate', read_only=True)
+        try:
+            exists = store.execute("""
+                SELECT COUNT(*) FROM duckdb_tables() WHERE schema_name = 'gate' AND table_name = 'SensorGate';
+            """).fetchone()[0]
+            sensors = store.execute("SELECT * FROM SensorGate;").arrow() if exists else None
+        finally:
+            store.close()
+        if sensors is not None:
+            con.register('store_sensors', sensors)
+            con.execute("INSERT OR REPLACE INTO SensorGate BY NAME SELECT * FROM store_sensors;")
+            con.unregister('store_sensors')
+        return con
+
+    def ensure_table(self, con):
+        """Create DailyGateCount keyed on (Date, Gate), migrating a legacy un-keyed table if needed"""
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS DailyGateCount (
+                Date DATE, Gate VARCHAR, GateCount INTEGER,
+                PRIMARY KEY (Date, Gate)
+            );
+        """)
+        keyed = con.execute("""
+            SELECT COUNT(*) FROM duckdb_constraints()
+            WHERE schema_name = current_schema() AND table_name = 'DailyGateCount' AND constraint_type = 'PRIMARY KEY';
+        """).fetchone()[0]
+        if not keyed:
+            logger.info("Migrating DailyGateCount to a keyed table")
+            con.execute("BEGIN TRANSACTION;")
+            try:
+                con.execute("""
+                    CREATE TABLE DailyGateCount_keyed (
+                        Date DATE, Gate VARCHAR, GateCount INTEGER,
+                        PRIMARY KEY (Date, Gate)
+                    );
+                """)
+                # Intraday re-runs only ever increase a day's count, so keep the largest duplicate
+                con.execute("""
+                    INSERT INTO DailyGateCount_keyed
+                    SELECT Date, Gate, MAX(GateCount) FROM DailyGateCount GROUP BY Date, Gate;
+                """)
+                con.execute("DROP TABLE DailyGateCount;")
+                con.execute("ALTER TABLE DailyGateCount_keyed RENAME TO DailyGateCount;")
+                record_changed_days(con, 'DailyGateCount', "SELECT DISTINCT Date FROM DailyGateCount")
+                con.execute("COMMIT;")
+            except Exception:
+                rollback(con)
+                raise
+
     def write_to_db(self, df):
-        con = duckdb.connect(database=os.path.join(os.path.dirname(__file__), '.', 'data', 'ZooData.duckdb'))
-        con.execute("CREATE OR REPLACE TABLE GateCount (Date DATE, Gate VARCHAR, GateCount INTEGER);")
-        con.execute("INSERT INTO GateCount SELECT * FROM df;")
+        """Stage df, check it, then upsert it into DailyGateCount"""
+        con = connect_store('gate')
+        try:
+            self.ensure_table(con)
+            # The casts fail here, before DailyGateCount is touched, if the API changed a field's type
+            con.execute("""
+                CREATE OR REPLACE TEMP TABLE DailyStaging AS
+                SELECT CAST(Date AS DATE) AS Date, CAST(Gate AS VARCHAR) AS Gate, CAST(GateCount AS INTEGER) AS GateCount
+                FROM df;
+            """)
+            check_staging(con, 'DailyStaging', DAILY_COLUMNS, ['Date', 'Gate'], len(df))
+            # One transaction, so readers see all of today's gates updated or none
+            con.execute("BEGIN TRANSACTION;")
+            try:
+                con.execute("""
+                    INSERT INTO DailyGateCount SELECT Date, Gate, GateCount FROM DailyStaging
+                    ON CONFLICT (Date, Gate) DO UPDATE SET GateCount = EXCLUDED.GateCount;
+                """)
+                record_changed_days(con, 'DailyGateCount', "SELECT DISTINCT Date FROM DailyStaging")
+                con.execute("COMMIT;")
+            except Exception:
+                rollback(con)
+                raise
+        finally:
+            con.close()
         logger.info("Gate count data written to DuckDB.")
 
 if __name__ == "__main__":
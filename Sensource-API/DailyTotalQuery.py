@@ -1,59 +1,79 @@
-import duckdb
+import argparse
 import os
+import sys
+from ParquetExport import export_csv, export_partitioned
 
-# Connect to the database
-db_path = os.path.join('Sensource-API', 'data', 'ZooData.duckdb')
-con = duckdb.connect(database=db_path, read_only=True)
-
-# Query all gate count data
-print("=== Gate Count Data ===\n")
-result = con.execute("SELECT * FROM GateCount ORDER BY Date DESC, Gate").fetchall()
-
-# Print the results
-print(f"{'Date':<12} {'Gate':<20} {'Count':>8}")
-print("-" * 42)
-
-for row in result:
-    date, gate, count = row
-    print(f"{date!s:<12} {gate:<20} {count:>8}")
-
-# Print summary statistics
-print("\n=== Summary Statistics ===\n")
-summary = con.execute("""
-    SELECT 
-        Gate,
-        COUNT(*) as Days,
-        SUM(GateCount) as TotalVisitors,
-        AVG(GateCount) as AvgDaily,
-        MAX(GateCount) as MaxDaily,
-        MIN(GateCount) as MinDaily
-    FROM GateCount 
-    GROUP BY Gate
-""").fetchall()
-
-for row in summary:
-    gate, days, total, avg, max_count, min_count = row
-    print(f"{gate}:")
-    print(f"  Days recorded: {days}")
-    print(f"  Total visitors: {total:,}")
-    print(f"  Average daily: {avg:,.0f}")
-    print(f"  Max daily: {max_count:,}")
-    print(f"  Min daily: {min_count:,}")
-    print()
-
-# Close connection
-con.close()
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from ZooStore import connect_store
+
+def print_daily_report():
+    """Print every daily gate count and per-gate summary statistics"""
+    # Connect to the database; both queries run before printing, so the store is released quickly
+    con = connect_store('gate', read_only=True)
+    try:
+        result = con.execute("SELECT * FROM DailyGateCount ORDER BY Date DESC, Gate").fetchall()
+        summary = con.execute("""
+            SELECT 
+                Gate,
+                COUNT(*) as Days,
+                SUM(GateCount) as TotalVisitors,
+                AVG(GateCount) as AvgDaily,
+                MAX(GateCount) as MaxDaily,
+                MIN(GateCount) as MinDaily
+            FROM DailyGateCount 
+            GROUP BY Gate
+        """).fetchall()
+    finally:
+        con.close()
+
+    # Query all gate count data
+    print("=== Gate Count Data ===\n")
+
+    # Print the results
+    print(f"{'Date':<12} {'Gate':<20} {'Count':>8}")
+    print("-" * 42)
+
+    for row in result:
+        date, gate, count = row
+        print(f"{date!s:<12} {gate:<20} {count:>8}")
+
+    # Print summary statistics
+    print("\n=== Summary Statistics ===\n")
+
+    for row in summary:
+        gate, days, total, avg, max_count, min_count = row
+        print(f"{gate}:")
+        print(f"  Days recorded: {days}")
+        print(f"  Total visitors: {total:,}")
+        print(f"  Average daily: {avg:,.0f}")
+        print(f"  Max daily: {max_count:,}")
+        print(f"  Min daily: {min_count:,}")
+        print()
 
 def export_to_csv(output_file='daily_gate_data.csv'):
     """Export all data to CSV"""
-    db_path = os.path.join(os.path.dirname(__file__), '.', 'data', 'ZooData.duckdb')
-    con = duckdb.connect(database=db_path, read_only=True)
-    
-    df = con.execute("SELECT * FROM GateCount ORDER BY Date, Gate;").fetchdf()
-    df.to_csv(output_file, index=False)
-    print(f"Exported {len(df):,} records to {output_file}")
-    
-    con.close()
+    con = connect_store('gate', read_only=True)
+    try:
+        rows = export_csv(con, 'DailyGateCount', output_file, order_by='Date, Gate')
+    finally:
+        con.close()
+    print(f"Exported {rows:,} records to {output_file}")
+
+def export_to_parquet(output_dir='daily_gate_data'):
+    """Export all data to year/month-partitioned Parquet, rewriting only the months that changed"""
+    con = connect_store('gate', read_only=True)
+    try:
+        written, unchanged, removed = export_partitioned(con, 'DailyGateCount', 'Date', output_dir, order_by='Date, Gate')
+    finally:
+        con.close()
+    print(f"Exported to {output_dir}: {written} partitions written, {unchanged} unchanged, {removed} removed")
 
 if __name__ == "__main__":
-    export_to_csv()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Print and export daily gate counts")
+    parser.add_argument('--export', choices=['parquet', 'csv', 'none'], default='parquet')
+    args = parser.parse_args()
+    print_daily_report()
+    if args.export == 'parquet':
+        export_to_parquet()
+    elif args.export == 'csv':
+        export_to_csv()
\ No newline at end of file
@@ -0,0 +1,118 @@
+import json
+import os
+import shutil
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from ZooStore import changed_days, data_version, migration_count
+
+MANIFEST = '_manifest.json'
+
+
+def partition_fingerprints(con, table, time_col, months=None):
+    """Return {'year=YYYY/month=M': fingerprint} for every month present in table (or only those in months).
+
+    The fingerprint is the row count plus an order-independent sum of row hashes, so any
+    inserted, updated or deleted row changes the fingerprint of its month. months is a set of
+    (year, month); only their rows are read.
+    """
+    where = ""
+    if months is not None:
+        if not months:
+            return {}
+        starts = ", ".join(f"DATE '{y:04d}-{m:02d}-01'" for y, m in sorted(months))
+        y, m = min(months)
+        where = f"WHERE {time_col} >= DATE '{y:04d}-{m:02d}-01' AND CAST(DATE_TRUNC('month', {time_col}) AS DATE) IN ({starts})"
+    rows = con.execute(f"""
+        SELECT YEAR({time_col}) AS y, MONTH({time_col}) AS m, COUNT(*) || ':' || SUM(hash(t))::VARCHAR
+        FROM {table} t
+        {where}
+        GROUP BY ALL
+        ORDER BY ALL;
+    """).fetchall()
+    return {f"year={y}/month={m}": fingerprint for y, m, fingerprint in rows}
+
+
+def read_manifest(manifest_path):
+    """(partition fingerprints, data version, migration count) of the last export; the version is None when unknown"""
+    if not os.path.exists(manifest_path):
+        return {}, None, None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if 'partitions' not in manifest:  # written before the data version was kept: fingerprints only
+        return manifest, None, None
+    return manifest['partitions'], manifest['data_version'], manifest['migrations']
+
+
+def current_fingerprints(con, table, time_col, previous, since_version, migrations):
+    """Fingerprints of every month of table, re-reading only the months logged as changed since since_version.
+
+    Falls back to reading the whole table when the last export's version is unknown, the store's version
+    went backwards (a new store), a legacy database was imported since, or the table's changes are not logged.
+    A month no longer in the table loses its stored fingerprint even when its deletion was not logged.
+    """
+    days = None
+    if since_version is not None and since_version <= data_version(con) and migrations == migration_count(con):
+        days = changed_days(con, table, since_version)
+    if days is None:
+        return partition_fingerprints(con, table, time_col)
+    months = {(day.year, day.month) for day in days}
+    present = set(con.execute(f"SELECT DISTINCT YEAR({time_col}), MONTH({time_col}) FROM {table};").fetchall())
+    current = {}
+    for partition, fingerprint in previous.items():
+        month = tuple(int(part.split('=')[1]) for part in partition.split('/'))
+        if month in present and month not in months:
+            current[partition] = fingerprint
+    current.update(partition_fingerprints(con, table, time_col, months))
+    return current
+
+
+def export_partitioned(con, table, time_col, output_dir, order_by=None, compression='zstd'):
+    """Export table as year/month-partitioned Parquet under output_dir, rewriting only changed months.
+
+    Each partition is written straight from DuckDB with COPY (no DataFrame in between) to
+    output_dir/year=YYYY/month=M/data.parquet; a manifest of partition fingerprints and the store's
+    data version next to the data decides which partitions need rewriting on the next run. Only the
+    months the store logged as changed since that version are fingerprinted again (see
+    ZooStore.record_changed_days); the others keep their stored fingerprint.
+    Returns (partitions written, partitions unchanged, partitions removed).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST)
+    previous, since_version, migrations = read_manifest(manifest_path)
+    version = data_version(con)
+
+    current = current_fingerprints(con, table, time_col, previous, since_version, migrations)
+    order_by = order_by or time_col
+    written = 0
+    for partition, fingerprint in current.items():
+        target = os.path.join(output_dir, partition, 'data.parquet')
+        if previous.get(partition) == fingerprint and os.path.exists(target):
+            continue
+        year, month = (int(part.split('=')[1]) for part in partition.split('/'))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        con.execute(f"""
+            COPY (
+                SELECT * FROM {table}
+                WHERE {time_col} >= MAKE_DATE({year}, {month}, 1)
+                  AND {time_col} < MAKE_DATE({year}, {month}, 1) + INTERVAL 1 MONTH
+                ORDER BY {order_by}
+            ) TO '{target}' (FORMAT PARQUET, COMPRESSION {compression});
+        """)
+        written += 1
+
+    removed = 0
+    for partition in set(previous) - set(current):
+        shutil.rmtree(os.path.join(output_dir, partition), ignore_errors=True)
+        removed += 1
+
+    with open(manifest_path, 'w') as f:
+        json.dump({'data_version': version, 'migrations': migration_count(con), 'partitions': current}, f, indent=2, sort_keys=True)
+    return written, len(current) - written, removed
+
+
+def export_csv(con, table, output_file, order_by):
+    """Write table to a single CSV file directly from DuckDB; returns the number of rows"""
+    rows = con.execute(f"SELECT COUNT(*) FROM {table};").fetchone()[0]
+    con.execute(f"COPY (SELECT * FROM {table} ORDER BY {order_by}) TO '{output_file}' (HEADER, DELIMITER ',');")
+    return rows
@@ -0,0 +1,256 @@
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from GateWeather import mark_stale_days
+from ZooStore import bump_data_version, connect_store, record_changed_days, rollback
+
+TOP_K = 10  # busiest intervals kept per day
+
+ROLLUP_TABLES = {
+    'GateCountDaily': """
+        CREATE TABLE IF NOT EXISTS GateCountDaily (
+            Date DATE, Gate VARCHAR, Ingress BIGINT, Egress BIGINT, Intervals INTEGER,
+            FirstRecord TIMESTAMP, LastRecord TIMESTAMP,
+            PRIMARY KEY (Date, Gate)
+        );
+    """,
+    'GateCountHourly': """
+        CREATE TABLE IF NOT EXISTS GateCountHourly (
+            Hour TIMESTAMP, Gate VARCHAR, Ingress BIGINT, Egress BIGINT, Intervals INTEGER,
+            FirstRecord TIMESTAMP, LastRecord TIMESTAMP,
+            PRIMARY KEY (Hour, Gate)
+        );
+    """,
+    'GateCountMonthly': """
+        CREATE TABLE IF NOT EXISTS GateCountMonthly (
+            Month DATE, Gate VARCHAR, Ingress BIGINT, Egress BIGINT,
+            PRIMARY KEY (Month, Gate)
+        );
+    """,
+    'GateCountHourProfile': """
+        CREATE TABLE IF NOT EXISTS GateCountHourProfile (
+            HourOfDay INTEGER, Gate VARCHAR, Ingress BIGINT, Egress BIGINT, Intervals BIGINT,
+            PRIMARY KEY (HourOfDay, Gate)
+        );
+    """,
+    'GateTotals': """
+        CREATE TABLE IF NOT EXISTS GateTotals (
+            Gate VARCHAR PRIMARY KEY, Records BIGINT, Ingress BIGINT, Egress BIGINT,
+            FirstRecord TIMESTAMP, LastRecord TIMESTAMP
+        );
+    """,
+    'GateCountTopIntervals': """
+        CREATE TABLE IF NOT EXISTS GateCountTopIntervals (
+            Date DATE, DateTime TIMESTAMP, Gate VARCHAR, Ingress INTEGER, Egress INTEGER
+        );
+    """,
+    # Net visitors let in through each gate since the start of the day, at the end of each interval
+    'GateOccupancy': """
+        CREATE TABLE IF NOT EXISTS GateOccupancy (
+            DateTime TIMESTAMP, Gate VARCHAR, Ingress INTEGER, Egress INTEGER, NetIn BIGINT,
+            PRIMARY KEY (DateTime, Gate)
+        );
+    """,
+    # Visitors in the park (all gates) at the end of each interval
+    'ParkOccupancy': """
+        CREATE TABLE IF NOT EXISTS ParkOccupancy (
+            DateTime TIMESTAMP PRIMARY KEY, Ingress BIGINT, Egress BIGINT, Occupancy BIGINT
+        );
+    """,
+    'DailyPeakOccupancy': """
+        CREATE TABLE IF NOT EXISTS DailyPeakOccupancy (
+            Date DATE PRIMARY KEY, PeakOccupancy BIGINT, PeakTime TIMESTAMP,
+            ClosingOccupancy BIGINT, Ingress BIGINT, Egress BIGINT
+        );
+    """,
+}
+
+
+def ensure_rollup_tables(con):
+    """Create the rollup tables; returns True if any of them had to be created"""
+    existing = {row[0] for row in con.execute(
+        "SELECT table_name FROM duckdb_tables() WHERE NOT temporary AND schema_name = current_schema();"
+    ).fetchall()}
+    outdated = con.execute("""
+        SELECT COUNT(*) FROM duckdb_tables() t
+        WHERE t.table_name = 'GateCountHourly' AND NOT t.temporary AND t.schema_name = current_schema()
+          AND NOT EXISTS (
+              SELECT 1 FROM duckdb_columns() c
+              WHERE c.schema_name = t.schema_name AND c.table_name = 'GateCountHourly' AND c.column_name = 'FirstRecord'
+          );
+    """).fetchone()[0]
+    if outdated:  # created before hourly buckets tracked their first/last record
+        drop_rollup_tables(con)
+        existing = set()
+    for ddl in ROLLUP_TABLES.values():
+        con.execute(ddl)
+    con.execute("CREATE TEMP TABLE IF NOT EXISTS TouchedDays (Date DATE PRIMARY KEY);")
+    return not set(ROLLUP_TABLES) <= existing
+
+
+def drop_rollup_tables(con):
+    for table in ROLLUP_TABLES:
+        con.execute(f"DROP TABLE IF EXISTS {table};")
+
+
+def touch_days(con, source, datetime_col='DateTime'):
+    """Record the days present in source (a table/relation name) as needing their rollups refreshed"""
+    con.execute("CREATE TEMP TABLE IF NOT EXISTS TouchedDays (Date DATE PRIMARY KEY);")
+    con.execute(f"INSERT OR IGNORE INTO TouchedDays SELECT DISTINCT CAST({datetime_col} AS DATE) FROM {source};")
+
+
+def touch_range(con, first, last):
+    """Record every day from first to last (inclusive) as needing its rollups refreshed"""
+    con.execute("CREATE TEMP TABLE IF NOT EXISTS TouchedDays (Date DATE PRIMARY KEY);")
+    con.execute(
+        "INSERT OR IGNORE INTO TouchedDays SELECT CAST(d AS DATE) FROM generate_series(?::DATE, ?::DATE, INTERVAL 1 DAY) t(d);",
+        [first, last]
+    )
+
+
+def refresh_rollups(con):
+    """Recompute every rollup bucket that overlaps a day in TouchedDays, then queue and log them as changed and clear TouchedDays.
+
+    Daily, hourly and per-day top-K buckets are rebuilt from GateCount for the touched days only;
+    monthly, hour-of-day and per-gate buckets are rebuilt from the (much smaller) daily/hourly rollups.
+    """
+    if ensure_rollup_tables(con):
+        touch_days(con, 'GateCount')  # first run: build everything
+    touched = con.execute("SELECT COUNT(*) FROM TouchedDays;").fetchone()[0]
+    if not touched:
+        return 0
+
+    touched_rows = """
+        FROM GateCount
+        WHERE DateTime >= (SELECT MIN(Date) FROM TouchedDays)
+          AND CAST(DateTime AS DATE) IN (SELECT Date FROM TouchedDays)
+    """
+    con.execute("DELETE FROM GateCountDaily WHERE Date IN (SELECT Date FROM TouchedDays);")
+    con.execute(f"""
+        INSERT INTO GateCountDaily
+        SELECT CAST(DateTime AS DATE), Gate, SUM(Ingress), SUM(Egress), COUNT(*), MIN(DateTime), MAX(DateTime)
+        {touched_rows}
+        GROUP BY ALL;
+    """)
+
+    con.execute("DELETE FROM GateCountHourly WHERE CAST(Hour AS DATE) IN (SELECT Date FROM TouchedDays);")
+    con.execute(f"""
+        INSERT INTO GateCountHourly
+        SELECT DATE_TRUNC('hour', DateTime), Gate, SUM(Ingress), SUM(Egress), COUNT(*), MIN(DateTime), MAX(DateTime)
+        {touched_rows}
+        GROUP BY ALL;
+    """)
+
+    con.execute("DELETE FROM GateCountTopIntervals WHERE Date IN (SELECT Date FROM TouchedDays);")
+    con.execute(f"""
+        INSERT INTO GateCountTopIntervals
+        SELECT CAST(DateTime AS DATE), DateTime, Gate, Ingress, Egress
+        {touched_rows}
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY CAST(DateTime AS DATE) ORDER BY Ingress DESC) <= {TOP_K};
+    """)
+
+    refresh_occupancy(con, touched_rows)
+
+    con.execute("""
+        CREATE OR REPLACE TEMP TABLE TouchedMonths AS
+        SELECT DISTINCT CAST(DATE_TRUNC('month', Date) AS DATE) AS Month FROM TouchedDays;
+    """)
+    con.execute("DELETE FROM GateCountMonthly WHERE Month IN (SELECT Month FROM TouchedMonths);")
+    con.execute("""
+        INSERT INTO GateCountMonthly
+        SELECT CAST(DATE_TRUNC('month', Date) AS DATE), Gate, SUM(Ingress), SUM(Egress)
+        FROM GateCountDaily
+        WHERE CAST(DATE_TRUNC('month', Date) AS DATE) IN (SELECT Month FROM TouchedMonths)
+        GROUP BY ALL;
+    """)
+
+    con.execute("""
+        CREATE OR REPLACE TEMP TABLE TouchedHours AS
+        SELECT DISTINCT EXTRACT(HOUR FROM Hour) AS HourOfDay FROM GateCountHourly
+        WHERE CAST(Hour AS DATE) IN (SELECT Date FROM TouchedDays);
+    """)
+    con.execute("DELETE FROM GateCountHourProfile WHERE HourOfDay IN (SELECT HourOfDay FROM TouchedHours);")
+    con.execute("""
+        INSERT INTO GateCountHourProfile
+        SELECT EXTRACT(HOUR FROM Hour), Gate, SUM(Ingress), SUM(Egress), SUM(Intervals)
+        FROM GateCountHourly
+        WHERE EXTRACT(HOUR FROM Hour) IN (SELECT HourOfDay FROM TouchedHours)
+        GROUP BY ALL;
+    """)
+
+    con.execute("""
+        INSERT OR REPLACE INTO GateTotals
+        SELECT Gate, SUM(Intervals), SUM(Ingress), SUM(Egress), MIN(FirstRecord), MAX(LastRecord)
+        FROM GateCountDaily
+        WHERE Gate IN (SELECT DISTINCT Gate FROM GateCountDaily WHERE Date IN (SELECT Date FROM TouchedDays))
+        GROUP BY Gate;
+    """)
+
+    mark_stale_days(con)
+    record_changed_days(con, 'GateCount', "SELECT Date FROM TouchedDays")
+    con.execute("DELETE FROM TouchedDays;")
+    return touched
+
+
+def refresh_occupancy(con, touched_rows):
+    """Rebuild the occupancy series and daily peaks of the touched days.
+
+    Occupancy restarts at zero every day, so a day's running totals only depend on that day's
+    intervals: late or corrected counts for one day never ripple into the rest of the history.
+    """
+    con.execute("DELETE FROM GateOccupancy WHERE CAST(DateTime AS DATE) IN (SELECT Date FROM TouchedDays);")
+    con.execute(f"""
+        INSERT INTO GateOccupancy
+        SELECT
+            DateTime, Gate, Ingress, Egress,
+            SUM(Ingress - Egress) OVER (PARTITION BY CAST(DateTime AS DATE), Gate ORDER BY DateTime)
+        {touched_rows};
+    """)
+
+    con.execute("DELETE FROM ParkOccupancy WHERE CAST(DateTime AS DATE) IN (SELECT Date FROM TouchedDays);")
+    con.execute(f"""
+        INSERT INTO ParkOccupancy
+        SELECT
+            DateTime, Ingress, Egress,
+            SUM(Ingress - Egress) OVER (PARTITION BY CAST(DateTime AS DATE) ORDER BY DateTime)
+        FROM (SELECT DateTime, SUM(Ingress) AS Ingress, SUM(Egress) AS Egress {touched_rows} GROUP BY DateTime);
+    """)
+
+    con.execute("DELETE FROM DailyPeakOccupancy WHERE Date IN (SELECT Date FROM TouchedDays);")
+    con.execute("""
+        INSERT INTO DailyPeakOccupancy
+        SELECT
+            CAST(DateTime AS DATE),
+            MAX(Occupancy),
+            arg_min(DateTime, (-Occupancy, DateTime)),  -- earliest interval at the peak
+            arg_max(Occupancy, DateTime),
+            SUM(Ingress), SUM(Egress)
+        FROM ParkOccupancy
+        WHERE CAST(DateTime AS DATE) IN (SELECT Date FROM TouchedDays)
+        GROUP BY ALL;
+    """)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the gate.GateCount rollup tables in the zoo store")
+    parser.add_argument('--rebuild', action='store_true', help="drop and rebuild every rollup table")
+    args = parser.parse_args()
+
+    con = connect_store('gate')
+    try:
+        # One transaction, so readers keep the old rollups until the rebuilt ones are complete
+        con.execute("BEGIN TRANSACTION;")
+        try:
+            if args.rebuild:
+                drop_rollup_tables(con)
+            days = refresh_rollups(con)
+            bump_data_version(con)
+            con.execute("COMMIT;")
+        except Exception:
+            rollback(con)
+            raise
+        print(f"Refreshed rollups for {days:,} days")
+    finally:
+        con.close()
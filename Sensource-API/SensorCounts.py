@@ -0,0 +1,258 @@
+"""Sensor-level 15-minute traffic, the raw store behind the gate-level GateCount view.
+
+SensorCount keeps one row per sensor and interval with the sensor as a SMALLINT key into SensorGate and
+the counts as SMALLINTs, written in DateTime order so DuckDB's per-row-group min/max (zone maps) can skip
+everything outside a queried time range. It has no primary key index: rows are replaced per (interval,
+gate) with a DELETE and an INSERT instead, which keeps the table a fraction of the size of the keyed
+gate table it replaces. GateCount is a view that sums the sensors of each gate per interval.
+
+Gate totals stored before the switch are kept as pseudo sensors named '<gate> (gate total)' with
+negative keys; real sensor rows fetched later for the same interval replace them.
+
+A full re-fetch loads into SensorCountStaging and only replaces the range it fetched once the load is
+complete and checked (swap_in_staging), so readers keep seeing the previous data while it runs and the
+history outside that range (backfilled or migrated) stays.
+"""
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime
+
+from SensorGates import GATE_TOTAL_SUFFIX, ensure_sensor_table, register_gate_totals
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from ZooStore import bump_data_version, check_staging, connect_store, print_query, rollback
+
+logger = logging.getLogger("GateCountFetcher")
+
+SENSOR_COUNT_DDL = """
+    CREATE TABLE IF NOT EXISTS SensorCount (
+        DateTime TIMESTAMP NOT NULL, SensorKey SMALLINT NOT NULL, Ingress SMALLINT, Egress SMALLINT
+    );
+"""
+SENSOR_COUNT_COLUMNS = [('DateTime', 'TIMESTAMP'), ('SensorKey', 'SMALLINT'), ('Ingress', 'SMALLINT'), ('Egress', 'SMALLINT')]
+STAGING_TABLE = 'SensorCountStaging'
+
+# Same columns and types as the GateCount table it replaces
+GATE_COUNT_VIEW = """
+    CREATE VIEW IF NOT EXISTS GateCount AS
+    SELECT c.DateTime, s.Gate, SUM(c.Ingress)::INTEGER AS Ingress, SUM(c.Egress)::INTEGER AS Egress
+    FROM {schema}.SensorCount c
+    JOIN {schema}.SensorGate s ON s.SensorKey = c.SensorKey
+    GROUP BY c.DateTime, s.Gate;
+"""
+
+
+def gate_count_kind(con):
+    """'BASE TABLE' for a gate-level GateCount table, 'VIEW' once it is derived from SensorCount, else None"""
+    row = con.execute("""
+        SELECT table_type FROM information_schema.tables
+        WHERE table_schema = current_schema() AND table_name = 'GateCount';
+    """).fetchone()
+    return row[0] if row else None
+
+
+def ensure_sensor_storage(con):
+    """Create SensorCount and the GateCount view, moving a gate-level GateCount table into SensorCount first"""
+    ensure_sensor_table(con)
+    con.execute(SENSOR_COUNT_DDL)
+    if gate_count_kind(con) == 'BASE TABLE':
+        migrate_gate_table(con)
+    schema = con.execute("SELECT current_schema();").fetchone()[0]
+    con.execute(GATE_COUNT_VIEW.format(schema=schema))
+
+
+def migrate_gate_table(con):
+    """Turn the rows of a gate-level GateCount table into pseudo-sensor rows and replace the table by the view"""
+    logger.info("Moving GateCount into SensorCount; stored gate totals become '<gate> (gate total)' sensors")
+    con.execute("BEGIN TRANSACTION;")
+    try:
+        register_gate_totals(con, 'GateCount')
+        # MAX() because legacy tables were not keyed and may hold the same interval twice
+        rows = con.execute(f"""
+            INSERT INTO SensorCount
+            SELECT g.DateTime, s.SensorKey, MAX(g.Ingress), MAX(g.Egress)
+            FROM GateCount g
+            JOIN SensorGate s ON s.SensorName = g.Gate || '{GATE_TOTAL_SUFFIX}'
+            WHERE g.Ingress != 0 OR g.Egress != 0
+            GROUP BY g.DateTime, s.SensorKey
+            ORDER BY g.DateTime, s.SensorKey;
+        """).fetchone()[0]
+        con.execute("DROP TABLE GateCount;")
+        con.execute("COMMIT;")
+    except Exception:
+        rollback(con)
+        raise
+    logger.info(f"Moved {rows:,} gate rows into SensorCount")
+    return rows
+
+
+def create_staging(con):
+    """Start an empty SensorCountStaging (dropping one left by a failed run); returns its name"""
+    con.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE};")
+    con.execute(SENSOR_COUNT_DDL.replace('SensorCount', STAGING_TABLE))
+    return STAGING_TABLE
+
+
+def validate_staging(con, expected_rows):
+    """Check SensorCountStaging before it replaces SensorCount; raises ValueError and leaves SensorCount alone.
+
+    Besides the columns, key and the rows the load reported, every sensor must be registered, and an
+    empty load may not replace stored counts (an API outage looks like that).
+    """
+    rows = check_staging(con, STAGING_TABLE, SENSOR_COUNT_COLUMNS, ['DateTime', 'SensorKey'], expected_rows)
+    orphans = con.execute(f"""
+        SELECT COUNT(*) FROM {STAGING_TABLE} c WHERE NOT EXISTS (SELECT 1 FROM SensorGate s WHERE s.SensorKey = c.SensorKey);
+    """).fetchone()[0]
+    if orphans:
+        raise ValueError(f"{STAGING_TABLE} has {orphans:,} rows for sensors missing from SensorGate")
+    if not rows:
+        stored = latest_interval(con)
+        if stored is not None:
+            raise ValueError(f"{STAGING_TABLE} is empty; not replacing the counts stored up to {stored}")
+    return rows
+
+
+def swap_in_staging(con, first=None, last=None):
+    """Replace what SensorCount holds from first to last (inclusive TIMESTAMPs) by SensorCountStaging.
+
+    The range widens to the rows staged, since UTC records near midnight land just outside the days
+    that were asked for; everything outside it is left alone. Run it inside the caller's transaction:
+    readers see the old counts until COMMIT and the new ones after it, never a half-loaded range.
+    Returns the (first, last) range replaced, or None if there was no range.
+    """
+    first, last = con.execute(f"""
+        SELECT LEAST(MIN(DateTime), ?::TIMESTAMP), GREATEST(MAX(DateTime), ?::TIMESTAMP) FROM {STAGING_TABLE};
+    """, [first, last]).fetchone()
+    if first is not None:
+        con.execute("DELETE FROM SensorCount WHERE DateTime BETWEEN ? AND ?;", [first, last])
+        con.execute(f"INSERT INTO SensorCount SELECT * FROM {STAGING_TABLE} ORDER BY DateTime, SensorKey;")
+    con.execute(f"DROP TABLE {STAGING_TABLE};")
+    return (first, last) if first is not None else None
+
+
+def upsert_sensor_counts(con, source, target='SensorCount'):
+    """Write source (DateTime, SensorKey, Ingress, Egress) into target (SensorCount); returns the rows inserted.
+
+    Every (interval, gate) present in source replaces what SensorCount held for it, as the keyed
+    GateCount table used to, so pseudo-sensor totals give way to real sensor rows. All-zero rows
+    are not stored, but they still clear an earlier count for their interval.
+    """
+    first, last = con.execute(f"SELECT MIN(DateTime), MAX(DateTime) FROM {source};").fetchone()
+    if first is None:
+        return 0
+    # The DateTime range lets the zone maps skip every row group outside the window
+    con.execute(f"""
+        DELETE FROM {target} c
+        USING SensorGate g, (
+            SELECT DISTINCT n.DateTime, s.Gate FROM {source} n JOIN SensorGate s ON s.SensorKey = n.SensorKey
+        ) n
+        WHERE c.DateTime BETWEEN ? AND ?
+          AND g.SensorKey = c.SensorKey AND n.DateTime = c.DateTime AND n.Gate = g.Gate;
+    """, [first, last])
+    return con.execute(f"""
+        INSERT INTO {target}
+        SELECT DateTime, SensorKey, Ingress, Egress FROM {source}
+        WHERE Ingress != 0 OR Egress != 0
+        ORDER BY DateTime, SensorKey;
+    """).fetchone()[0]
+
+
+def latest_interval(con):
+    """Latest DateTime stored (without aggregating the GateCount view), or None if nothing is stored yet"""
+    kind = gate_count_kind(con)
+    if kind is None:
+        return None
+    table = 'SensorCount' if kind == 'VIEW' else 'GateCount'
+    return con.execute(f"SELECT MAX(DateTime) FROM {table};").fetchone()[0]
+
+
+def compact(con):
+    """Rewrite SensorCount in (DateTime, SensorKey) order, e.g. after backfilling old windows out of order"""
+    con.execute("BEGIN TRANSACTION;")
+    try:
+        con.execute(SENSOR_COUNT_DDL.replace('SensorCount', 'SensorCount_sorted'))
+        rows = con.execute("INSERT INTO SensorCount_sorted SELECT * FROM SensorCount ORDER BY DateTime, SensorKey;").fetchone()[0]
+        con.execute("DROP TABLE SensorCount;")
+        con.execute("ALTER TABLE SensorCount_sorted RENAME TO SensorCount;")
+        bump_data_version(con)
+        con.execute("COMMIT;")
+    except Exception:
+        rollback(con)
+        raise
+    con.execute("CHECKPOINT;")
+    return rows
+
+
+def check_full_load():
+    """Swap a staged window into an in-memory store that holds rows before, inside and after it.
+
+    Returns a list of problems: the rows outside the window must survive, those inside must be the staged ones.
+    """
+    import duckdb
+    from Coverage import COVERAGE_DDL, COVERAGE_TABLE, create_coverage_staging, swap_in_coverage
+
+    con = duckdb.connect()
+    ensure_sensor_storage(con)
+    con.execute(COVERAGE_DDL.format(table=COVERAGE_TABLE))
+    old = [(datetime(2025, 7, 4, 10), 1, 5, 4), (datetime(2026, 3, 1, 9), 2, 3, 0), (datetime(2026, 6, 10, 9), 1, 8, 1),
+           (datetime(2026, 6, 11, 9), 2, 2, 2), (datetime(2026, 9, 1, 12), 1, 6, 6)]
+    staged = [(datetime(2026, 6, 10, 9), 1, 9, 2), (datetime(2026, 6, 12, 14), 2, 1, 1)]
+    con.executemany("INSERT INTO SensorCount VALUES (?, ?, ?, ?);", old)
+    con.executemany(f"INSERT INTO {COVERAGE_TABLE} VALUES (?, ?, 1, NULL);", [(row[0].date(), row[1]) for row in old])
+    con.execute(SENSOR_COUNT_DDL.replace('SensorCount', STAGING_TABLE))
+    con.executemany(f"INSERT INTO {STAGING_TABLE} VALUES (?, ?, ?, ?);", staged)
+    staging = create_coverage_staging(con)
+    con.executemany(f"INSERT INTO {staging} VALUES (?, ?, 1, current_timestamp);", [(row[0].date(), row[1]) for row in staged])
+
+    validate_staging(con, len(staged))
+    con.execute("BEGIN TRANSACTION;")
+    swap_in_staging(con, datetime(2026, 6, 1), datetime(2026, 6, 30, 23, 59, 59))
+    swap_in_coverage(con)
+    con.execute("COMMIT;")
+
+    expected = sorted([row for row in old if row[0].month != 6] + staged)
+    stored = con.execute("SELECT * FROM SensorCount ORDER BY ALL;").fetchall()
+    problems = [] if stored == expected else [f"SensorCount holds {stored}, expected {expected}"]
+    days = [row[0] for row in con.execute(f"SELECT Date FROM {COVERAGE_TABLE} ORDER BY ALL;").fetchall()]
+    expected_days = sorted({row[0].date() for row in expected})
+    if days != expected_days:
+        problems.append(f"{COVERAGE_TABLE} covers {days}, expected {expected_days}")
+    con.close()
+    return problems
+
+
+def print_sensors(con):
+    """Rows, traffic and date range per sensor"""
+    print_query(con, """
+        SELECT
+            s.Gate, s.SensorName AS sensor, s.SensorKey AS key,
+            COUNT(c.DateTime) AS intervals, SUM(c.Ingress) AS ingress, SUM(c.Egress) AS egress,
+            CAST(MIN(c.DateTime) AS DATE) AS first_day, CAST(MAX(c.DateTime) AS DATE) AS last_day
+        FROM SensorGate s
+        LEFT JOIN SensorCount c ON c.SensorKey = s.SensorKey
+        GROUP BY ALL
+        ORDER BY s.Gate, s.SensorKey;
+    """)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sensor-level gate counts (gate.SensorCount) in the zoo store")
+    parser.add_argument('--compact', action='store_true', help="rewrite SensorCount in time order")
+    parser.add_argument('--check', action='store_true', help="verify that a full load keeps the counts outside its window")
+    args = parser.parse_args()
+
+    if args.check:
+        problems = check_full_load()
+        print("\n".join(problems) or "Full load keeps the counts outside its window")
+        sys.exit(1 if problems else 0)
+
+    con = connect_store('gate')
+    try:
+        ensure_sensor_storage(con)
+        if args.compact:
+            print(f"Rewrote {compact(con):,} rows in time order")
+        print_sensors(con)
+    finally:
+        con.close()
@@ -0,0 +1,99 @@
+import logging
+import threading
+
+logger = logging.getLogger("GateCountFetcher")
+
+DEFAULT_GATE = 'SOUTH GATE'
+
+# Vea location ids for each gate
+GATE_IDS = {
+    'SOUTH GATE': 'decd9257-660d-412b-a019-1bd44f0aecd9',
+    'THE LIVING WORLD': 'b49b0f74-7af5-480c-a8ef-bb1a090731cf',
+}
+
+# Sensors known not to belong to the default gate. Anything else is added to SensorGate
+# under DEFAULT_GATE the first time it is seen and can be re-assigned with an UPDATE, which also
+# moves its stored history to the new gate (run `python Rollups.py --rebuild` afterwards).
+SEED_SENSORS = {
+    'Treetop': 'THE LIVING WORLD',
+    'TLW1': 'THE LIVING WORLD',
+}
+
+GATE_TOTAL_SUFFIX = ' (gate total)'
+_register_lock = threading.Lock()
+
+
+def ensure_sensor_table(con):
+    """Create and seed the SensorGate dimension (sensor name -> gate, and the small key SensorCount stores)"""
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS SensorGate (
+            SensorName VARCHAR PRIMARY KEY,
+            SensorId VARCHAR,
+            Gate VARCHAR NOT NULL,
+            GateId VARCHAR,
+            FirstSeen TIMESTAMP DEFAULT current_timestamp,
+            SensorKey SMALLINT
+        );
+    """)
+    con.execute("ALTER TABLE SensorGate ADD COLUMN IF NOT EXISTS SensorKey SMALLINT;")
+    # A sequence rather than MAX(SensorKey) + 1, so parallel backfill workers never hand out the same key
+    con.execute("CREATE SEQUENCE IF NOT EXISTS SensorKeys START 1;")
+    for name, gate in SEED_SENSORS.items():
+        con.execute(
+            "INSERT OR IGNORE INTO SensorGate (SensorName, Gate, GateId) VALUES (?, ?, ?);",
+            [name, gate, GATE_IDS[gate]]
+        )
+    assign_sensor_keys(con)
+
+
+def assign_sensor_keys(con):
+    """Give every sensor that has no SensorKey yet the next key"""
+    con.execute("UPDATE SensorGate SET SensorKey = nextval('SensorKeys') WHERE SensorKey IS NULL;")
+
+
+def gate_total_sensor(gate):
+    """Name of the pseudo sensor that holds a gate's totals from before counts were stored per sensor"""
+    return f"{gate}{GATE_TOTAL_SUFFIX}"
+
+
+def register_gate_totals(con, source, gate_col='Gate'):
+    """Add a pseudo sensor for each gate in source that does not have one yet.
+
+    Pseudo sensors get negative keys, so SensorKey < 0 always means "whole gate, no sensor breakdown".
+    """
+    gates = [row[0] for row in con.execute(f"""
+        SELECT DISTINCT src.{gate_col} FROM {source} src
+        WHERE src.{gate_col} IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM SensorGate s WHERE s.SensorName = src.{gate_col} || '{GATE_TOTAL_SUFFIX}')
+        ORDER BY ALL;
+    """).fetchall()]
+    for gate in gates:
+        con.execute("""
+            INSERT INTO SensorGate (SensorName, Gate, GateId, SensorKey)
+            SELECT ?, ?, ?, LEAST(COALESCE(MIN(SensorKey), 0), 0) - 1 FROM SensorGate;
+        """, [gate_total_sensor(gate), gate, GATE_IDS.get(gate)])
+    return len(gates)
+
+
+def register_sensors(con, source, name_col='name'):
+    """Add sensors from source (a table or registered DataFrame) that SensorGate does not know yet.
+
+    Threads take turns, so outside a transaction (where every statement commits) a second thread
+    sees the sensors the first one added instead of inserting them again.
+    """
+    with _register_lock:
+        new = con.execute(f"""
+            SELECT DISTINCT src.{name_col}
+            FROM {source} src
+            ANTI JOIN SensorGate s ON s.SensorName = src.{name_col}
+            WHERE src.{name_col} IS NOT NULL;
+        """).fetchall()
+        for (name,) in new:
+            logger.warning(f"New sensor '{name}' mapped to {DEFAULT_GATE}; update SensorGate to change it")
+            con.execute(
+                "INSERT OR IGNORE INTO SensorGate (SensorName, Gate, GateId) VALUES (?, ?, ?);",
+                [name, DEFAULT_GATE, GATE_IDS[DEFAULT_GATE]]
+            )
+        if new:
+            assign_sensor_keys(con)
+    return len(new)
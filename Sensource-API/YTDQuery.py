@@ -1,112 +1,255 @@
-import duckdb
-import pandas as pd
 from datetime import datetime
+import argparse
+import json
 import os
+import sys
+import time
+from ParquetExport import export_csv, export_partitioned
 
-def query_ytd_data():
-    """Query and display YTD gate count data from DuckDB"""
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from ZooStore import connect_store, print_query
+
+# Row sources the report can run over: the hourly rollup (default) or the raw 15-minute table
+REPORT_SOURCES = {
+    'hourly': {
+        'source': "SELECT Hour AS Bucket, Gate, Ingress, Egress, Intervals, FirstRecord, LastRecord FROM GateCountHourly",
+        'top_agg': "NULL",
+        'top_list': """(
+            SELECT list({'DateTime': DateTime, 'Gate': Gate, 'Ingress': Ingress, 'Egress': Egress} ORDER BY Ingress DESC)[1:10]
+            FROM GateCountTopIntervals
+        )""",
+    },
+    'raw': {
+        'source': "SELECT DateTime AS Bucket, Gate, Ingress, Egress, 1 AS Intervals, DateTime AS FirstRecord, DateTime AS LastRecord FROM GateCount",
+        'top_agg': "max_by({'DateTime': FirstRecord, 'Gate': Gate, 'Ingress': Ingress, 'Egress': Egress}, Ingress, 10)",
+        'top_list': "TopIntervals",
+    },
+}
+
+# Every report section in one GROUPING SETS pass; one row per (section, group)
+REPORT_QUERY = """
+WITH report AS (
+    SELECT
+        CASE GROUPING(Gate, Day, Month, HourOfDay)
+            WHEN 15 THEN 'total'
+            WHEN 7 THEN 'gate'
+            WHEN 3 THEN 'daily'
+            WHEN 5 THEN 'monthly'
+            ELSE 'hour_of_day'
+        END AS section,
+        Gate, Day, Month, HourOfDay,
+        SUM(Ingress)::BIGINT AS Ingress,
+        SUM(Egress)::BIGINT AS Egress,
+        SUM(Intervals)::BIGINT AS Records,
+        MIN(FirstRecord) AS FirstRecord,
+        MAX(LastRecord) AS LastRecord,
+        {top_agg} AS TopIntervals
+    FROM (
+        SELECT
+            *,
+            CAST(Bucket AS DATE) AS Day,
+            CAST(DATE_TRUNC('month', Bucket) AS DATE) AS Month,
+            EXTRACT(HOUR FROM Bucket)::INTEGER AS HourOfDay
+        FROM ({source})
+    )
+    GROUP BY GROUPING SETS ((), (Gate), (Day, Gate), (Month, Gate), (HourOfDay, Gate))
+)
+SELECT
+    section, Gate, Day, Month, HourOfDay, Ingress, Egress, Records, FirstRecord, LastRecord,
+    CASE WHEN section = 'total' THEN {top_list} END AS TopIntervals
+FROM report
+ORDER BY section, Day DESC, Month DESC, HourOfDay, Gate;
+"""
+
+
+def report_source(con, source=None):
+    """The requested source, or the hourly rollup when it exists and the raw table otherwise"""
+    if source is None:
+        has_rollups = con.execute(
+            "SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = current_schema() AND table_name = 'GateCountHourly';"
+        ).fetchone()[0]
+        source = 'hourly' if has_rollups else 'raw'
+    return source
+
+
+def build_report(con, source=None):
+    """Compute the whole YTD report in a single scan.
+
+    Returns (report, seconds, source) where report is a pyarrow.Table with a 'section' column
+    ('total', 'gate', 'daily', 'monthly', 'hour_of_day').
+    """
+    source = report_source(con, source)
+    start = time.perf_counter()
+    result = con.execute(REPORT_QUERY.format(**REPORT_SOURCES[source])).arrow()
+    report = result.read_all() if hasattr(result, 'read_all') else result  # RecordBatchReader on newer duckdb
+    return report, time.perf_counter() - start, source
+
+
+def build_report_table(con, source=None):
+    """Compute the report into the TEMP table report, skipping the Arrow round trip (and the pyarrow
+    and pandas imports it brings) when the report is only printed. Returns (seconds, source)."""
+    source = report_source(con, source)
+    start = time.perf_counter()
+    con.execute(f"CREATE OR REPLACE TEMP TABLE report AS {REPORT_QUERY.format(**REPORT_SOURCES[source])}")
+    return time.perf_counter() - start, source
+
+
+def report_to_dict(report):
+    """Group the report rows by section, dropping the columns that do not apply to each section"""
+    sections = {}
+    for row in report.to_pylist():
+        section = row.pop('section')
+        sections.setdefault(section, []).append({k: v for k, v in row.items() if v is not None})
+    return sections
+
+
+def query_ytd_data(output='console', output_file=None, source=None):
+    """Query and display YTD gate count data from DuckDB.
+
+    output='console' prints the report, 'json' prints (or writes) it as JSON and
+    'arrow' writes it as an Arrow IPC file.
+    """
     
     # Connect to the database
-    db_path = os.path.join(os.path.dirname(__file__), '.', 'data', 'YTD.data.duckdb')
-    con = duckdb.connect(database=db_path, read_only=True)
-    
+    con = connect_store('gate', read_only=True)
+    try:
+        if output == 'console':
+            seconds, source = build_report_table(con, source)
+            print_report(con)
+            print(f"\nReport computed in {seconds * 1000:.1f} ms in one pass over {'GateCountHourly' if source == 'hourly' else 'GateCount'}")
+            return None
+        report, seconds, source = build_report(con, source)
+        if output == 'json':
+            text = json.dumps(report_to_dict(report), default=str, indent=2)
+            if output_file:
+                with open(output_file, 'w') as f:
+                    f.write(text)
+                print(f"Report written to {output_file} in {seconds * 1000:.1f} ms (source: {source})")
+            else:
+                print(text)
+            return report
+        if output == 'arrow':
+            import pyarrow as pa
+            output_file = output_file or 'ytd_report.arrow'
+            with pa.ipc.new_file(output_file, report.schema) as writer:
+                writer.write_table(report)
+            print(f"Report written to {output_file} in {seconds * 1000:.1f} ms (source: {source})")
+        return report
+    finally:
+        con.close()
+
+
+def print_report(con, report=None):
+    """Print the report sections; each section is a small query over the report table
+    (the TEMP table from build_report_table, or the Arrow result of build_report)"""
+    if report is not None:
+        con.register('report', report)
     print("=" * 80)
     print("YTD GATE COUNT DATA QUERY")
     print("=" * 80)
     
     # 1. Show table schema
     print("\n1. TABLE SCHEMA:")
-    schema = con.execute("DESCRIBE GateCount;").fetchdf()
-    print(schema.to_string(index=False))
+    print_query(con, "DESCRIBE GateCount;")
     
     # 2. Show total record count
     print("\n2. TOTAL RECORDS:")
-    total = con.execute("SELECT COUNT(*) as total FROM GateCount;").fetchdf()
-    print(f"   {total['total'][0]:,} records")
+    total = con.execute("SELECT Records as total FROM report WHERE section = 'total';").fetchone()[0]
+    print(f"   {total:,} records")
     
     # 3. Date range
     print("\n3. DATE RANGE:")
-    date_range = con.execute("""
+    print_query(con, """
         SELECT 
-            MIN(DateTime) as first_record,
-            MAX(DateTime) as last_record
-        FROM GateCount;
-    """).fetchdf()
-    print(date_range.to_string(index=False))
+            FirstRecord as first_record,
+            LastRecord as last_record
+        FROM report
+        WHERE section = 'total';
+    """)
     
     # 4. Summary by Gate
     print("\n4. SUMMARY BY GATE:")
-    gate_summary = con.execute("""
+    print_query(con, """
         SELECT 
             Gate,
-            COUNT(*) as records,
-            SUM(Ingress) as total_ingress,
-            SUM(Egress) as total_egress,
-            SUM(Ingress) - SUM(Egress) as net_traffic
-        FROM GateCount
-        GROUP BY Gate
+            Records as records,
+            Ingress as total_ingress,
+            Egress as total_egress,
+            Ingress - Egress as net_traffic
+        FROM report
+        WHERE section = 'gate'
         ORDER BY Gate;
-    """).fetchdf()
-    print(gate_summary.to_string(index=False))
+    """)
     
     # 5. Daily totals (most recent 10 days)
     print("\n5. DAILY TOTALS (Last 10 Days):")
-    daily = con.execute("""
+    print_query(con, """
         SELECT 
-            DATE_TRUNC('day', DateTime) as date,
+            Day as date,
             Gate,
-            SUM(Ingress) as daily_ingress,
-            SUM(Egress) as daily_egress
-        FROM GateCount
-        GROUP BY date, Gate
+            Ingress as daily_ingress,
+            Egress as daily_egress
+        FROM report
+        WHERE section = 'daily'
         ORDER BY date DESC, Gate
         LIMIT 20;
-    """).fetchdf()
-    print(daily.to_string(index=False))
+    """)
     
     # 6. Busiest 15-minute intervals
     print("\n6. BUSIEST 15-MINUTE INTERVALS (Top 10 by Ingress):")
-    busiest = con.execute("""
+    print_query(con, """
         SELECT 
-            DateTime,
-            Gate,
-            Ingress,
-            Egress
-        FROM GateCount
-        ORDER BY Ingress DESC
-        LIMIT 10;
-    """).fetchdf()
-    print(busiest.to_string(index=False))
+            t.DateTime,
+            t.Gate,
+            t.Ingress,
+            t.Egress
+        FROM (SELECT UNNEST(TopIntervals) AS t FROM report WHERE section = 'total');
+    """)
     
     # 7. Monthly summary
     print("\n7. MONTHLY SUMMARY:")
-    monthly = con.execute("""
+    print_query(con, """
         SELECT 
-            DATE_TRUNC('month', DateTime) as month,
+            Month as month,
             Gate,
-            SUM(Ingress) as monthly_ingress,
-            SUM(Egress) as monthly_egress
-        FROM GateCount
-        GROUP BY month, Gate
+            Ingress as monthly_ingress,
+            Egress as monthly_egress
+        FROM report
+        WHERE section = 'monthly'
         ORDER BY month DESC, Gate;
-    """).fetchdf()
-    print(monthly.to_string(index=False))
+    """)
     
     # 8. Hour of day analysis
     print("\n8. AVERAGE TRAFFIC BY HOUR OF DAY:")
-    hourly = con.execute("""
+    print_query(con, """
         SELECT 
-            EXTRACT(HOUR FROM DateTime) as hour,
+            HourOfDay as hour,
             Gate,
-            ROUND(AVG(Ingress), 1) as avg_ingress,
-            ROUND(AVG(Egress), 1) as avg_egress
-        FROM GateCount
-        GROUP BY hour, Gate
+            ROUND(Ingress / Records, 1) as avg_ingress,
+            ROUND(Egress / Records, 1) as avg_egress
+        FROM report
+        WHERE section = 'hour_of_day'
         ORDER BY hour, Gate;
-    """).fetchdf()
-    print(hourly.to_string(index=False))
-    
-    con.close()
+    """)
+
+    # 9. Peak in-park occupancy (kept up to date with the rollups)
+    has_occupancy = con.execute("""
+        SELECT COUNT(*) FROM duckdb_tables()
+        WHERE schema_name = 'gate' AND table_name = 'DailyPeakOccupancy';
+    """).fetchone()[0]
+    if has_occupancy:
+        print("\n9. PEAK IN-PARK OCCUPANCY (Last 10 Days):")
+        print_query(con, """
+            SELECT
+                Date as date,
+                PeakOccupancy as peak_occupancy,
+                strftime(PeakTime, '%H:%M') as peak_time,
+                ClosingOccupancy as closing_occupancy
+            FROM gate.DailyPeakOccupancy
+            ORDER BY date DESC
+            LIMIT 10;
+        """)
+
     print("\n" + "=" * 80)
     print("QUERY COMPLETE")
     print("=" * 80)
@@ -114,8 +257,7 @@ def query_ytd_data():
 
 def custom_query(sql_query):
     """Execute a custom SQL query"""
-    db_path = os.path.join(os.path.dirname(__file__), '.', 'data', 'YTD.data.duckdb')
-    con = duckdb.connect(database=db_path, read_only=True)
+    con = connect_store('gate', read_only=True)
     
     try:
         result = con.execute(sql_query).fetchdf()
@@ -129,21 +271,37 @@ def custom_query(sql_query):
 
 def export_to_csv(output_file='ytd_gate_data.csv'):
     """Export all data to CSV"""
-    db_path = os.path.join(os.path.dirname(__file__), '.', 'data', 'YTD.data.duckdb')
-    con = duckdb.connect(database=db_path, read_only=True)
-    
-    df = con.execute("SELECT * FROM GateCount ORDER BY DateTime, Gate;").fetchdf()
-    df.to_csv(output_file, index=False)
-    print(f"Exported {len(df):,} records to {output_file}")
-    
-    con.close()
+    con = connect_store('gate', read_only=True)
+    try:
+        rows = export_csv(con, 'GateCount', output_file, order_by='DateTime, Gate')
+    finally:
+        con.close()
+    print(f"Exported {rows:,} records to {output_file}")
+
+
+def export_to_parquet(output_dir='ytd_gate_data'):
+    """Export all data to year/month-partitioned Parquet, rewriting only the months that changed"""
+    con = connect_store('gate', read_only=True)
+    try:
+        written, unchanged, removed = export_partitioned(con, 'GateCount', 'DateTime', output_dir, order_by='DateTime, Gate')
+    finally:
+        con.close()
+    print(f"Exported to {output_dir}: {written} partitions written, {unchanged} unchanged, {removed} removed")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="YTD gate count report")
+    parser.add_argument('--format', choices=['console', 'json', 'arrow'], default='console')
+    parser.add_argument('--output', help="file for json/arrow output (json defaults to stdout)")
+    parser.add_argument('--source', choices=REPORT_SOURCES, help="table to scan (default: hourly rollup if present)")
+    parser.add_argument('--export', choices=['parquet', 'csv', 'none'], default='parquet')
+    args = parser.parse_args()
+
     # Run the standard queries
-    query_ytd_data()
-    
-    # Optionally export to CSV
-    export_to_csv()
+    query_ytd_data(output=args.format, output_file=args.output, source=args.source)
     
-   
\ No newline at end of file
+    # Optionally export the data
+    if args.export == 'parquet':
+        export_to_parquet()
+    elif args.export == 'csv':
+        export_to_csv()
@@ -1,6 +1,4 @@
 import os
-import requests
-import pandas as pd
 import duckdb
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
@@ -8,6 +6,22 @@ import logging
 import sys
 from rich.logging import RichHandler
 import warnings
+from SensourceStream import TRAFFIC_TABLE, read_traffic
+from SensorGates import GATE_IDS, GATE_TOTAL_SUFFIX, register_gate_totals, register_sensors
+from SensorCounts import (
+    create_staging, ensure_sensor_storage, latest_interval, swap_in_staging, upsert_sensor_counts, validate_staging,
+)
+from Rollups import refresh_rollups, touch_days, touch_range
+from Coverage import (
+    coverage_table, create_coverage_staging, ensure_coverage_table, record_coverage, seed_coverage, swap_in_coverage,
+)
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from ApiClient import get_client
+from ResponseCache import as_date, cache_windows
+from ZooStore import connect_store, rollback
+from GateWeather import refresh_gate_weather
+from PipelineRuns import PipelineRun
 
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
@@ -16,34 +30,98 @@ logger = logging.getLogger("GateCountFetcher")
 logger.setLevel(logging.INFO)
 formatter = logging.Formatter('[%(asctime)s] [%(levelname)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
 
-# Rich console handler
-rich_handler = RichHandler(rich_tracebacks=True, show_time=False, show_level=True, show_path=False)
-rich_handler.setFormatter(formatter)
-logger.addHandler(rich_handler)
+# Both fetchers share this logger, so only the first one imported into a process adds the handlers
+if not logger.handlers:
+    # Rich console handler
+    rich_handler = RichHandler(rich_tracebacks=True, show_time=False, show_level=True, show_path=False)
+    rich_handler.setFormatter(formatter)
+    logger.addHandler(rich_handler)
+
+    # File handler
+    file_handler = logging.FileHandler(os.path.join(os.path.dirname(__file__), '.', 'logs', 'GateCount.log'))
+    file_handler.setLevel(logging.INFO)
+    file_handler.setFormatter(formatter)
+    logger.addHandler(file_handler)
 
-# File handler
-file_handler = logging.FileHandler(os.path.join(os.path.dirname(__file__), '.', 'logs', 'GateCount.log'))
-file_handler.setLevel(logging.INFO)
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
+OVERLAP = timedelta(days=1)  # re-fetch this much before the watermark to pick up late-arriving counts
 
 class GateCountFetcher:
     def __init__(self, env_path='.env'):
         load_dotenv(env_path)
         self.api_token = os.getenv("SENSOURCE_TOKEN")
-        self.south_gate = 'decd9257-660d-412b-a019-1bd44f0aecd9'
-        self.tlw_gate = 'b49b0f74-7af5-480c-a8ef-bb1a090731cf'
+        self.south_gate = GATE_IDS['SOUTH GATE']
+        self.tlw_gate = GATE_IDS['THE LIVING WORLD']
+
+    def get_watermark(self):
+        """Return the latest DateTime already stored, or None if nothing is stored yet"""
+        con = connect_store('gate', read_only=True)
+        try:
+            return latest_interval(con)
+        finally:
+            con.close()
+
+    def get_gate_count(self, date=None, to_db=True, incremental=True, start=None):
+        """Fetch sensor traffic into gate.SensorCount (GateCount) in the zoo store.
 
-    def get_gate_count(self, date=None, to_db=True):
+        Returns the gate-level rows (DateTime, Gate, Ingress, Egress) of the fetched range as a DataFrame.
+        With to_db=False the window is loaded into an in-memory database instead of the store.
+        start (a date) overrides the first day of a full fetch, which is otherwise the start of the year.
+        """
         if date is None:
             date = datetime.today().strftime('%m-%d-%Y')
+        watermark = self.get_watermark() if incremental and to_db else None
+        if watermark is None:
+            incremental = False
+            startDate = (start or datetime(datetime.today().year, 1, 1) - timedelta(days=1)).strftime('%m-%d-%Y') # Query from start of year
+        else:
+            startDate = (watermark - OVERLAP).strftime('%m-%d-%Y')  # Query only what is newer than the stored data
+            logger.info(f"Incremental fetch from {startDate} (watermark {watermark})")
+        endDate = datetime.today().strftime('%m-%d-%Y')
+
+        with PipelineRun('ytd' if incremental else 'ytd_full', logger, record=to_db) as run:
+            con = connect_store('gate') if to_db else duckdb.connect(database=':memory:')
+            try:
+                self.ensure_table(con)
+                # A full fetch is staged and swapped in at the end, so readers keep the old data meanwhile
+                target = 'SensorCount' if incremental else create_staging(con)
+                if not incremental:
+                    create_coverage_staging(con)
+                # Fetched in windows that repeat between runs, so closed days come from the response cache
+                rows = 0
+                for first, last in cache_windows(startDate, endDate):
+                    rows += get_client('sensource').retrying(
+                        self.load_window_atomically, con, first.strftime('%m-%d-%Y'), last.strftime('%m-%d-%Y'), run, target
+                    )
+                run.rows = rows
+                if not incremental:
+                    with run.stage('swap') as counts:
+                        last = datetime.strptime(endDate, '%m-%d-%Y') + timedelta(days=1) - timedelta(microseconds=1)
+                        counts.rows = self.swap_in_full_load(con, rows, datetime.strptime(startDate, '%m-%d-%Y'), last)
+                with run.stage('rollups') as counts:
+                    counts.rows = refresh_rollups(con)
+                df = con.execute(
+                    "SELECT * FROM GateCount WHERE DateTime >= ? ORDER BY DateTime, Gate;",
+                    [datetime.strptime(startDate, '%m-%d-%Y')]
+                ).fetchdf()
+                if not to_db:
+                    return df
+                with run.stage('gate_weather') as counts:
+                    counts.rows = refresh_gate_weather(con)
+            finally:
+                con.close()
+        logger.info(f"Gate count data written to DuckDB ({rows:,} sensor rows, {'incremental' if incremental else 'full'}).")
+        return df
+
+    def request_window(self, startDate, endDate, refresh=False):
+        """Open a streaming request for 15-minute sensor traffic for startDate..endDate (mm-dd-YYYY).
+
+        refresh=True bypasses the response cache, e.g. when repairing a window.
+        """
         headers = {
             "accept": "application/json",
             "Authorization": f"Bearer {self.api_token}"
         }
         relativeDate = "custom"
-        startDate = (datetime(datetime.today().year, 1, 1) - timedelta(days=1)).strftime('%m-%d-%Y') # Query from start of year
-        endDate = datetime.today().strftime('%m-%d-%Y')
         dateGroupings = "minute(15)"  # get gate data every 15 minutes
         entityType = "sensor"
         excludeClosedHours = "true"
@@ -51,41 +129,166 @@ class GateCountFetcher:
         
         # Refrence link: https://vea.sensourceinc.com/api-docs/
         url = (
-            f"https://vea.sensourceinc.com/api/data/traffic?relativeDate={relativeDate}&startDate={startDate}"
+            f"/api/data/traffic?relativeDate={relativeDate}&startDate={startDate}"
             f"&endDate={endDate}&dateGroupings={dateGroupings}&entityType={entityType}"
             f"&excludeClosedHours={excludeClosedHours}&metrics={metrics}"
         )
-        response = requests.get(url, headers=headers).json()
-        
-        df = pd.DataFrame.from_dict(response['results'])
-        
-        # Find the correct column names dynamically
-        date_col = [col for col in df.columns if 'recordDate' in col][0]  # Dynamic column detection
-        
-        df = df[[date_col, 'name', 'sumins', 'sumouts']]  # Include sumouts
-        df = df.rename(columns={date_col: 'DateTime', 'name': 'location', 'sumins': 'Ingress', 'sumouts': 'Egress'})
-        df['DateTime'] = pd.to_datetime(df['DateTime'])
-        df['DateTime'] = df['DateTime'].dt.tz_convert('America/Chicago')
-        df['DateTime'] = df['DateTime'].dt.tz_localize(None)
-        df = df[(df.Ingress != 0) | (df.Egress != 0)]  # Filter for non-zero ingress OR egress
-        df['Gate'] = df['location'].apply(lambda x: 'THE LIVING WORLD' if x in ['Treetop', 'TLW1'] else 'SOUTH GATE')
-        df = df.groupby(['DateTime', 'Gate'], as_index=False)[['Ingress', 'Egress']].sum() 
-        if to_db:
-            self.write_to_db(df)
-        return df
+        window = (as_date(startDate), as_date(endDate))
+        return get_client('sensource').get(url, headers=headers, stream=True, window=window, refresh=refresh)
+
+    def load_window_atomically(self, con, startDate, endDate, run=None, target='SensorCount', refresh=False):
+        """load_window with the window written in a transaction of its own, so a failed attempt leaves no
+        half-replaced intervals. The request and any new sensors stay outside the transaction."""
+        self.fetch_window(con, startDate, endDate, run, refresh)
+        self.add_new_sensors(con)
+        con.execute("BEGIN TRANSACTION;")
+        try:
+            rows = self.store_window(con, startDate, endDate, run, target)
+            con.execute("COMMIT;")
+        except Exception:
+            rollback(con)
+            raise
+        return rows
+
+    def load_window(self, con, startDate, endDate, run=None, target='SensorCount', refresh=False):
+        """Stream one window of sensor rows into DuckDB and upsert them into target (SensorCount).
+
+        Only SensourceStream.BATCH_SIZE rows are held as Python objects at once; the window itself goes
+        straight into a temp table. The window's days are recorded in SensorCoverage (see Coverage.py).
+        Stage timings are added to run (a PipelineRun) when one is given. Run ensure_table first.
+        """
+        run = run or PipelineRun('load_window', logger, record=False)
+        self.fetch_window(con, startDate, endDate, run, refresh)
+        self.add_new_sensors(con)
+        return self.store_window(con, startDate, endDate, run, target)
+
+    def fetch_window(self, con, startDate, endDate, run=None, refresh=False):
+        """Request one window and stream it into the SensorTraffic temp table on con; returns its rows.
+
+        The table outlives a rolled back store_window, so a window that failed to write can be stored
+        again without another request.
+        """
+        run = run or PipelineRun('load_window', logger, record=False)
+        with run.stage('request'):
+            response = self.request_window(startDate, endDate, refresh)
+        with response:
+            try:
+                rows = read_traffic(con, response, run=run)
+            except Exception:
+                get_client('sensource').forget(response)  # don't replay a body that does not parse
+                raise
+        if rows == 0:
+            # Sensource's outage answer; cached as a closed day it would be replayed for good
+            get_client('sensource').forget(response)
+        return rows
+
+    def add_new_sensors(self, con, source=TRAFFIC_TABLE):
+        """Register the sensors in source (the fetched window) that SensorGate does not know yet.
+
+        Call it outside a transaction: each sensor is committed straight away (one thread at a time, see
+        register_sensors), so parallel windows that meet the same new sensor do not conflict on commit.
+        """
+        return register_sensors(con, source)
+
+    def store_window(self, con, startDate, endDate, run=None, target='SensorCount'):
+        """Transform the fetched window and upsert it into target, recording its days in SensorCoverage"""
+        run = run or PipelineRun('load_window', logger, record=False)
+        with run.stage('transform') as counts:
+            counts.rows = self.transform(con)
+        with run.stage('upsert') as counts:
+            counts.rows = upsert_sensor_counts(con, 'SensorStaging', target)
+            touch_days(con, 'SensorStaging')
+            record_coverage(con, 'SensorStaging', startDate, endDate, coverage_table(target))
+            con.execute("DROP TABLE SensorStaging;")
+            con.execute(f"DROP TABLE {TRAFFIC_TABLE};")
+        return counts.rows
+
+    def transform(self, con, source=TRAFFIC_TABLE):
+        """Turn raw traffic (a table or registered Arrow table in SensourceStream.TRAFFIC_SCHEMA) into the SensorStaging temp table.
+
+        One statement: UTC to local time, sensor names to keys and one row per sensor and interval.
+        All-zero rows are kept, since they clear an interval's earlier counts; upsert_sensor_counts
+        leaves them out of SensorCount. Sensors must be registered already (add_new_sensors).
+        Returns the number of staged rows.
+        """
+        # The time zone conversion is the costly part, so it runs once per interval rather than per sensor row
+        return con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE SensorStaging AS
+            WITH intervals AS (
+                SELECT recordDate, timezone('America/Chicago', recordDate::TIMESTAMPTZ) AS DateTime
+                FROM (SELECT DISTINCT recordDate FROM {source})
+            )
+            SELECT
+                i.DateTime,
+                s.SensorKey,
+                SUM(t.Ingress) AS Ingress,
+                SUM(t.Egress) AS Egress
+            FROM {source} t
+            JOIN intervals i ON i.recordDate = t.recordDate
+            JOIN SensorGate s ON s.SensorName = t.name
+            GROUP BY ALL;
+        """).fetchone()[0]
+
+    def ensure_table(self, con):
+        """Create SensorCount and the GateCount view over it, migrating a gate-level GateCount table if needed"""
+        ensure_sensor_storage(con)
+        ensure_coverage_table(con)
+
+    def swap_in_full_load(self, con, rows, first=None, last=None):
+        """Check the staged full load and swap it in over first..last (at least the staged rows' range),
+        together with its coverage and refreshed rollups, in one transaction; the rest of the store stays"""
+        validate_staging(con, rows)
+        con.execute("BEGIN TRANSACTION;")
+        try:
+            replaced = swap_in_staging(con, first, last)
+            swap_in_coverage(con)
+            if replaced:
+                touch_range(con, replaced[0].date(), replaced[1].date())
+            refresh_rollups(con)
+            con.execute("COMMIT;")
+        except Exception:
+            rollback(con)
+            raise
+        return rows
 
-    def write_to_db(self, df):
-        con = duckdb.connect(database=os.path.join(os.path.dirname(__file__), '.', 'data', 'YTD.data.duckdb'))
-        con.execute("DROP TABLE IF EXISTS GateCount;")
-        con.execute("CREATE TABLE GateCount (DateTime TIMESTAMP, Gate VARCHAR, Ingress INTEGER, Egress INTEGER);")  
-        con.execute("INSERT INTO GateCount SELECT * FROM df;")
-        logger.info("Gate count data written to DuckDB.")
+    def write_to_db(self, df, incremental=False):
+        con = connect_store('gate')
+        try:
+            con.register('df', df)  # the helpers below query it from other modules, out of reach of DuckDB's replacement scan
+            self.ensure_table(con)
+            # Gate-level rows have no sensor breakdown, so they are stored under the gates' pseudo sensors
+            register_gate_totals(con, 'df')
+            con.execute(f"""
+                CREATE OR REPLACE TEMP TABLE SensorStaging AS
+                SELECT df.DateTime, s.SensorKey, df.Ingress, df.Egress
+                FROM df JOIN SensorGate s ON s.SensorName = df.Gate || '{GATE_TOTAL_SUFFIX}';
+            """)
+            if incremental:
+                con.execute("BEGIN TRANSACTION;")
+                try:
+                    upsert_sensor_counts(con, 'SensorStaging')
+                    touch_days(con, 'df')
+                    refresh_rollups(con)
+                    con.execute("COMMIT;")
+                except Exception:
+                    rollback(con)
+                    raise
+            else:
+                staging = create_staging(con)
+                rows = upsert_sensor_counts(con, 'SensorStaging', staging)
+                seed_coverage(con, staging, create_coverage_staging(con))  # no fetch to record, only the days it holds
+                self.swap_in_full_load(con, rows)
+            con.execute("DROP TABLE SensorStaging;")
+            refresh_gate_weather(con)
+        finally:
+            con.close()
+        logger.info(f"Gate count data written to DuckDB ({len(df):,} rows, {'incremental' if incremental else 'full'}).")
 
 if __name__ == "__main__":
     logger.info("Sending gate count data to DuckDB")
     fetcher = GateCountFetcher()
     try:
-        fetcher.get_gate_count()
+        fetcher.get_gate_count(incremental='--full' not in sys.argv)
         logger.info("Success")
     except Exception as e:
         logger.warning(f"Failure! {e}")
\ No newline at end of file
@@ -0,0 +1,219 @@
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ResponseCache import CacheMiss, default_cache, request_key
+
+logger = logging.getLogger("ApiClient")
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RequestBudgetExceeded(Exception):
+    """Raised when a provider's request budget would be exceeded"""
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """Exponential backoff with full jitter for the given (1-based) attempt"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def retry_after_seconds(response):
+    """Seconds to wait according to a Retry-After header (delta-seconds or HTTP date), or None"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestBudget:
+    """Sliding-window request limits, e.g. [(3, 1), (25, 3600)] = 3 per second and 25 per hour.
+
+    Short waits (up to max_wait seconds) are slept off; anything longer raises RequestBudgetExceeded
+    instead of blocking the run.
+    """
+
+    def __init__(self, limits, max_wait=5.0):
+        self.limits = [(count, period, deque()) for count, period in limits]
+        self.max_wait = max_wait
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait = 0.0
+                for count, period, sent in self.limits:
+                    while sent and now - sent[0] >= period:
+                        sent.popleft()
+                    if len(sent) >= count:
+                        wait = max(wait, period - (now - sent[0]))
+                if wait == 0.0:
+                    for _, _, sent in self.limits:
+                        sent.append(now)
+                    return
+            if wait > self.max_wait:
+                raise RequestBudgetExceeded(f"request budget exhausted, next slot in {wait:.0f}s")
+            time.sleep(wait)
+
+
+class ApiClient:
+    """requests.Session wrapper with keep-alive pooling, timeouts, retries with backoff and a request budget"""
+
+    def __init__(self, name, base_url, timeout=(10, 120), retries=4, backoff=1.0, max_backoff=60.0,
+                 budget=None, pool_size=8, headers=None, log=None, cache=None):
+        self.name = name
+        self.logger = log or logger
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.budget = budget
+        self.cache = cache
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if headers:
+            self.session.headers.update(headers)
+
+    def url(self, path):
+        return path if path.startswith('http') else f"{self.base_url}/{path.lstrip('/')}"
+
+    def request(self, method, path, validate=None, window=None, refresh=False, **kwargs):
+        """Send a request, or answer it from the response cache when it covers a (first_day, last_day) window.
+
+        Cached responses are file-backed stand-ins (ResponseCache.CachedResponse) for requests.Response.
+        refresh=True sends the request even so and replaces the cached copy, e.g. to repair a window.
+        """
+        if self.cache is None or (window is None and not self.cache.offline):
+            return self.send(method, path, validate, **kwargs)
+        key = request_key(method, f"{self.name}:{path}", kwargs.get('params'), kwargs.get('json'), window) if window else None
+        cached = self.cache.lookup(key) if key and not refresh else None
+        if cached is not None:
+            self.logger.debug(f"{self.name}: {method} {path} served from cache")
+            return cached
+        if self.cache.offline:
+            raise CacheMiss(f"{self.name}: {method} {path} is not in the response cache (offline mode)")
+        kwargs['stream'] = True  # the body goes straight to disk
+        response = self.send(method, path, validate, **kwargs)
+        return self.cache.store(key, response, window, description=f"{self.name} {method} {path}")
+
+    def forget(self, response):
+        """Drop a cached response, e.g. one that failed to parse, so the next request fetches it again"""
+        key = getattr(response, 'cache_key', None)
+        if key and self.cache is not None:
+            self.cache.discard(key)
+
+    def send(self, method, path, validate=None, **kwargs):
+        """Send a request, retrying connection errors, timeouts, 429/5xx responses and responses
+        that fail validate(response). Other 4xx responses raise immediately."""
+        kwargs.setdefault('timeout', self.timeout)
+        url = self.url(path)
+        for attempt in range(1, self.retries + 2):
+            if self.budget:
+                self.budget.acquire()
+            delay = None
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                reason = str(e)
+            else:
+                if response.status_code in RETRY_STATUSES:
+                    reason = f"HTTP {response.status_code}"
+                    delay = retry_after_seconds(response)
+                    response.close()
+                else:
+                    response.raise_for_status()
+                    if validate is None or self._is_valid(validate, response):
+                        return response
+                    reason = "invalid response body"
+                    response.close()
+            if attempt > self.retries:
+                raise requests.exceptions.RetryError(f"{self.name}: {method} {url} failed after {attempt} attempts ({reason})")
+            if delay is None:
+                delay = backoff_delay(attempt, self.backoff, self.max_backoff)
+            self.logger.warning(f"{self.name}: {reason}, retry {attempt}/{self.retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+    def retrying(self, fn, *args, **kwargs):
+        """Run fn (e.g. a fetch-and-parse step) with the same backoff policy, retrying on any exception"""
+        for attempt in range(1, self.retries + 2):
+            try:
+                return fn(*args, **kwargs)
+            except (RequestBudgetExceeded, CacheMiss, requests.exceptions.RetryError, requests.HTTPError):
+                raise  # already retried by request(), or not worth retrying
+            except Exception as e:
+                if attempt > self.retries:
+                    raise
+                delay = backoff_delay(attempt, self.backoff, self.max_backoff)
+                self.logger.warning(f"{self.name}: {e!r}, retry {attempt}/{self.retries} in {delay:.1f}s")
+                time.sleep(delay)
+
+    @staticmethod
+    def _is_valid(validate, response):
+        try:
+            return bool(validate(response))
+        except ValueError:  # e.g. a body that is not JSON
+            return False
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name):
+    """Return the process-wide client for a provider ('sensource' or 'tomorrow'), creating it on first use.
+
+    SENSOURCE_BASE_URL / TOMORROW_BASE_URL point a provider somewhere else, e.g. at Shared/FakeApi.py.
+    """
+    with _clients_lock:
+        if name not in _clients:
+            if name == 'sensource':
+                _clients[name] = ApiClient(
+                    'sensource', os.getenv('SENSOURCE_BASE_URL') or 'https://vea.sensourceinc.com',
+                    budget=RequestBudget([(10, 1), (1000, 3600)]),
+                    log=logging.getLogger("GateCountFetcher"), cache=default_cache(),
+                )
+            elif name == 'tomorrow':
+                # Free plan limits: 3 requests/second, 25/hour, 500/day
+                _clients[name] = ApiClient(
+                    'tomorrow', os.getenv('TOMORROW_BASE_URL') or 'https://api.tomorrow.io', timeout=(10, 30),
+                    budget=RequestBudget([(3, 1), (25, 3600), (500, 86400)]), cache=default_cache(),
+                )
+            else:
+                raise ValueError(f"Unknown API provider: {name}")
+        return _clients[name]
+
+
+def close_clients():
+    """Close every client created so far (e.g. when a long-running process shuts down)"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
@@ -0,0 +1,267 @@
+"""Local stand-in for the Sensource and Tomorrow.io endpoints the fetchers call.
+
+Serves /api/data/traffic (15-minute custom windows and today's daily totals), /v4/weather/realtime and
+/v4/timelines with synthetic but deterministic data: the same seed, sensors and dates always produce the
+same counts. Point the clients at it with SENSOURCE_BASE_URL and TOMORROW_BASE_URL (see ApiClient.get_client);
+any token or API key is accepted.
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+try:
+    from zoneinfo import ZoneInfo
+    LOCAL_TZ = ZoneInfo('America/Chicago')
+except Exception:  # no tz database (e.g. Windows without tzdata): close enough for fake data
+    LOCAL_TZ = timezone(timedelta(hours=-6))
+
+SEED_SENSORS = ['Treetop', 'TLW1']  # mapped to THE LIVING WORLD by SensorGates
+
+
+def sensor_names(count):
+    """The seeded Living World sensors first, then South Gate sensors"""
+    return (SEED_SENSORS + [f"South{i}" for i in range(1, count + 1)])[:count]
+
+
+class FakeData:
+    """Deterministic synthetic gate traffic and weather"""
+
+    def __init__(self, sensors=4, open_hours=(9, 17), seed=0, empty_days=()):
+        self.sensors = sensor_names(sensors)
+        self.open_hours = open_hours
+        self.seed = seed
+        self.empty_days = set(empty_days)  # a traffic window touching one of these answers with no results
+
+    def day_traffic(self, day):
+        """[(local interval start, sensor, ins, outs)] for the open hours of one day"""
+        open_hour, close_hour = self.open_hours
+        slots = (close_hour - open_hour) * 4
+        weekend = 1.6 if day.weekday() >= 5 else 1.0
+        season = 0.6 + 0.4 * math.sin(math.pi * (day.timetuple().tm_yday - 60) / 365) ** 2
+        start = datetime(day.year, day.month, day.day, open_hour, tzinfo=LOCAL_TZ)
+        rows = []
+        for index, sensor in enumerate(self.sensors):
+            rng = random.Random(f"{self.seed}:{sensor}:{day.toordinal()}")
+            base = 20 + 10 * (index % 3)
+            for slot in range(slots):
+                # Arrivals peak late morning, departures mid afternoon
+                arrive = math.exp(-((slot / slots - 0.25) ** 2) / 0.05)
+                leave = math.exp(-((slot / slots - 0.75) ** 2) / 0.05)
+                ins = rng.randint(0, 3) + int(base * weekend * season * arrive * rng.uniform(0.7, 1.3))
+                outs = rng.randint(0, 3) + int(base * weekend * season * leave * rng.uniform(0.7, 1.3))
+                rows.append((start + timedelta(minutes=15 * slot), sensor, ins, outs))
+        return rows
+
+    def weather(self, moment, fields=None):
+        """Weather values (Tomorrow.io names, imperial units) at an aware datetime"""
+        rng = random.Random(f"{self.seed}:weather:{int(moment.timestamp()) // 3600}")
+        local = moment.astimezone(LOCAL_TZ)
+        day_of_year = local.timetuple().tm_yday
+        seasonal = 56 - 22 * math.cos(2 * math.pi * (day_of_year - 15) / 365)
+        temperature = round(seasonal + 9 * math.sin(math.pi * (local.hour - 9) / 12) + rng.uniform(-3, 3), 1)
+        humidity = round(rng.uniform(35, 90))
+        rain = round(max(0.0, rng.uniform(-0.6, 0.4)), 2)
+        values = {
+            'temperature': temperature,
+            'temperatureApparent': round(temperature + (humidity - 50) / 12, 1),
+            'temperatureMin': round(temperature - 6, 1),
+            'temperatureMax': round(temperature + 6, 1),
+            'humidity': humidity,
+            'dewPoint': round(temperature - (100 - humidity) / 5, 1),
+            'precipitationProbability': 60 if rain else round(rng.uniform(0, 20)),
+            'rainIntensity': rain,
+            'windSpeed': round(rng.uniform(0, 18), 1),
+            'windGust': round(rng.uniform(5, 30), 1),
+            'windDirection': round(rng.uniform(0, 360)),
+            'cloudCover': round(rng.uniform(0, 100)),
+            'uvIndex': max(0, round(8 * math.sin(math.pi * (local.hour - 6) / 14))) if 6 <= local.hour <= 20 else 0,
+            'visibility': 9.94,
+            'weatherCode': 4001 if rain else (1000 if humidity < 60 else 1101),
+        }
+        return {k: v for k, v in values.items() if k in fields} if fields else values
+
+
+def parse_time(value, now):
+    """Tomorrow.io startTime/endTime: ISO 8601, 'now' or 'nowPlus<N>h|d' / 'nowMinus<N>h|d'"""
+    match = re.fullmatch(r'now(?:(Plus|Minus)(\d+)([hd]))?', value)
+    if not match:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+    if not match.group(1):
+        return now
+    offset = timedelta(**{'hours' if match.group(3) == 'h' else 'days': int(match.group(2))})
+    return now + offset if match.group(1) == 'Plus' else now - offset
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    # HTTP/1.0 and no Content-Length: bodies are generated and written as they are produced
+    protocol_version = 'HTTP/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, payload, status=200):
+        self.start(status)
+        self.write(json.dumps(payload).encode())
+
+    def start(self, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+
+    def write(self, body):
+        self.wfile.write(body)
+        self.server.count(self.path, len(body))
+
+    def do_GET(self):
+        self.server.count(self.path)
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if url.path == '/api/data/traffic':
+            return self.traffic(query)
+        if url.path == '/v4/weather/realtime':
+            now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+            return self.send_json({
+                'data': {'time': now.strftime('%Y-%m-%dT%H:%M:%SZ'), 'values': self.server.data.weather(now)},
+                'location': {'lat': 38.6355, 'lon': -90.2905},
+            })
+        self.send_json({'message': f"Unknown endpoint {url.path}"}, 404)
+
+    def do_POST(self):
+        self.server.count(self.path)
+        url = urlparse(self.path)
+        if url.path != '/v4/timelines':
+            return self.send_json({'message': f"Unknown endpoint {url.path}"}, 404)
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+        self.send_json(self.timelines(body))
+
+    def traffic(self, query):
+        data = self.server.data
+        today = datetime.now(LOCAL_TZ).date()
+        if query.get('relativeDate') == 'today':
+            totals = {}
+            for _, sensor, ins, outs in data.day_traffic(today):
+                totals[sensor] = totals.get(sensor, 0) + ins
+            return self.send_json({'messages': [], 'results': [
+                {'recordDate_day_1': today.isoformat(), 'name': sensor, 'sensorId': f"id-{sensor}", 'sumins': ins}
+                for sensor, ins in totals.items()
+            ]})
+        try:
+            first = datetime.strptime(query['startDate'], '%m-%d-%Y').date()
+            last = datetime.strptime(query['endDate'], '%m-%d-%Y').date()
+        except (KeyError, ValueError):
+            return self.send_json({'messages': ['startDate and endDate (mm-dd-YYYY) are required'], 'results': []}, 400)
+        if any(first <= day <= last for day in data.empty_days):
+            return self.send_json({'messages': [], 'results': []})  # the outage Sensource answers with
+        self.start()
+        self.write(b'{"messages": [], "results": [')
+        separator = b''
+        day = first
+        while day <= min(last, today):
+            rows = data.day_traffic(day)
+            if rows:
+                chunk = ','.join(
+                    json.dumps({
+                        'recordDate_minute_15_1': moment.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                        'name': sensor, 'sensorId': f"id-{sensor}", 'sumins': ins, 'sumouts': outs,
+                    })
+                    for moment, sensor, ins, outs in rows
+                ).encode()
+                self.write(separator + chunk)
+                separator = b','
+            day += timedelta(days=1)
+        self.write(b']}')
+
+    def timelines(self, body):
+        data = self.server.data
+        now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        start = parse_time(body.get('startTime', 'now'), now)
+        end = parse_time(body.get('endTime', 'nowPlus5d'), now)
+        timelines = []
+        for timestep in body.get('timesteps') or ['1h']:
+            step = timedelta(days=1) if timestep == '1d' else timedelta(hours=1)
+            intervals = []
+            moment = start.replace(minute=0, second=0, microsecond=0)
+            while moment <= end:
+                intervals.append({
+                    'startTime': moment.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                    'values': data.weather(moment, body.get('fields')),
+                })
+                moment += step
+            timelines.append({
+                'timestep': timestep, 'startTime': start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'endTime': end.strftime('%Y-%m-%dT%H:%M:%SZ'), 'intervals': intervals,
+            })
+        return {'data': {'timelines': timelines}}
+
+
+class FakeApiServer(ThreadingHTTPServer):
+    """Threaded HTTP server around FakeData; counts requests and bytes sent per endpoint"""
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, data=None):
+        super().__init__((host, port), FakeApiHandler)
+        self.data = data or FakeData()
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.bytes_sent = {}
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, path, size=None):
+        """Record a request (size None) or size bytes of its body"""
+        endpoint = urlparse(path).path
+        with self.lock:
+            if size is None:
+                self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            else:
+                self.bytes_sent[endpoint] = self.bytes_sent.get(endpoint, 0) + size
+
+    def start(self):
+        """Serve in a background thread; returns the base URL"""
+        self.thread = threading.Thread(target=self.serve_forever, name='FakeApiServer', daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def totals(self):
+        """(requests, bytes sent) over all endpoints"""
+        with self.lock:
+            return sum(self.requests.values()), sum(self.bytes_sent.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve fake Sensource and Tomorrow.io endpoints for local runs and benchmarks")
+    parser.add_argument('--port', type=int, default=8750)
+    parser.add_argument('--sensors', type=int, default=4, help="number of door sensors reporting traffic")
+    parser.add_argument('--open-hours', default='9-17', help="local opening hours, e.g. 9-17 (15-minute intervals in between)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--empty-days', default='', help="comma-separated YYYY-MM-DD days whose traffic windows come back empty")
+    args = parser.parse_args()
+
+    open_hour, close_hour = (int(h) for h in args.open_hours.split('-'))
+    empty_days = [datetime.strptime(d, '%Y-%m-%d').date() for d in args.empty_days.split(',') if d]
+    server = FakeApiServer(port=args.port, data=FakeData(args.sensors, (open_hour, close_hour), args.seed, empty_days))
+    print(f"Fake APIs on {server.url}; in another shell set:")
+    print(f"  SENSOURCE_BASE_URL={server.url}")
+    print(f"  TOMORROW_BASE_URL={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
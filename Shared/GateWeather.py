@@ -0,0 +1,148 @@
+import argparse
+import logging
+
+from ZooStore import bump_data_version, connect_store, rollback
+
+logger = logging.getLogger("GateWeather")
+
+# Each 15-minute gate interval joined to the latest weather observation taken at or before its start
+GATE_WEATHER_DDL = """
+    CREATE TABLE IF NOT EXISTS gate.GateCountWeather (
+        DateTime TIMESTAMP, Gate VARCHAR, Ingress INTEGER, Egress INTEGER,
+        WeatherTime TIMESTAMP WITH TIME ZONE, WeatherAgeMinutes INTEGER,
+        Temperature DOUBLE, ApparentTemperature DOUBLE, Humidity DOUBLE, PrecipitationProbability DOUBLE,
+        RainIntensity DOUBLE, WindSpeed DOUBLE, CloudCover DOUBLE, UvIndex DOUBLE, WeatherCode INTEGER,
+        ZooWeatherScore DOUBLE, ConditionRating VARCHAR,
+        PRIMARY KEY (DateTime, Gate)
+    );
+    -- Observations (and a hash of their values and score) already applied to GateCountWeather
+    CREATE TABLE IF NOT EXISTS gate.GateWeatherApplied (
+        WeatherTime TIMESTAMP WITH TIME ZONE PRIMARY KEY, LocalTime TIMESTAMP, Fingerprint UBIGINT
+    );
+    CREATE TABLE IF NOT EXISTS gate.GateWeatherStaleDays (Date DATE PRIMARY KEY);
+"""
+
+# Weather observations with their score, on the same local (America/Chicago) clock as GateCount.DateTime
+OBSERVATIONS = """
+    SELECT
+        timezone('America/Chicago', r.time) AS LocalTime,
+        r.time AS WeatherTime,
+        r.values__temperature AS Temperature,
+        r.values__temperature_apparent AS ApparentTemperature,
+        r.values__humidity AS Humidity,
+        r.values__precipitation_probability AS PrecipitationProbability,
+        r.values__rain_intensity AS RainIntensity,
+        r.values__wind_speed AS WindSpeed,
+        r.values__cloud_cover AS CloudCover,
+        r.values__uv_index AS UvIndex,
+        r.values__weather_code AS WeatherCode,
+        s.zoo_weather_score AS ZooWeatherScore,
+        s.condition_rating AS ConditionRating
+    FROM weather.weather_realtime r
+    LEFT JOIN weather.zoo_weather_scores s ON s.time = r.time AND s.location IS NOT DISTINCT FROM r.location
+"""
+
+
+def has_sources(con):
+    """True when the store has both gate counts and scored weather observations"""
+    # information_schema also lists views, and GateCount is a view over gate.SensorCount
+    return con.execute("""
+        SELECT COUNT(*) FROM information_schema.tables
+        WHERE (table_schema, table_name) IN (
+            ('gate', 'GateCount'), ('weather', 'weather_realtime'), ('weather', 'zoo_weather_scores')
+        );
+    """).fetchone()[0] == 3
+
+
+def mark_stale_days(con, days='TouchedDays'):
+    """Queue the days in days (a table of Date) for the next refresh_gate_weather.
+
+    The rollup refresh calls it with its TouchedDays, in the writer's transaction and on a connection
+    whose current schema is gate, so every change to GateCount reaches GateCountWeather however late
+    the refresh runs.
+    """
+    con.execute("CREATE TABLE IF NOT EXISTS GateWeatherStaleDays (Date DATE PRIMARY KEY);")
+    con.execute(f"INSERT OR IGNORE INTO GateWeatherStaleDays SELECT Date FROM {days};")
+
+
+def refresh_gate_weather(con, rebuild=False):
+    """Bring gate.GateCountWeather up to date with GateCount and the weather observations.
+
+    Only the days queued by mark_stale_days are re-joined, plus the intervals at or after the earliest
+    observation that is new or changed since the latest one applied; older observations are taken as
+    settled, so rescoring them needs rebuild=True. Returns the number of intervals (re)written.
+    """
+    if not has_sources(con):
+        logger.info("Gate or weather data missing; skipping GateCountWeather")
+        return 0
+    con.execute("BEGIN TRANSACTION;")
+    try:
+        if rebuild:
+            con.execute("DROP TABLE IF EXISTS gate.GateCountWeather;")
+            con.execute("DROP TABLE IF EXISTS gate.GateWeatherApplied;")
+        full = not con.execute("""
+            SELECT COUNT(*) FROM duckdb_tables() WHERE schema_name = 'gate' AND table_name = 'GateCountWeather';
+        """).fetchone()[0]
+        con.execute(GATE_WEATHER_DDL)
+        if full:
+            # First build (or rebuild): every day and every observation
+            con.execute("DELETE FROM gate.GateWeatherApplied;")
+            con.execute("INSERT OR IGNORE INTO gate.GateWeatherStaleDays SELECT DISTINCT CAST(DateTime AS DATE) FROM gate.GateCount;")
+
+        con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE GateWeatherChanged AS
+            SELECT o.LocalTime, o.WeatherTime, o.Fingerprint
+            FROM (
+                SELECT LocalTime, WeatherTime, hash(o) AS Fingerprint FROM ({OBSERVATIONS}) o
+                WHERE WeatherTime >= (SELECT COALESCE(MAX(WeatherTime), '-infinity') FROM gate.GateWeatherApplied)
+            ) o
+            ANTI JOIN gate.GateWeatherApplied a ON a.WeatherTime = o.WeatherTime AND a.Fingerprint = o.Fingerprint;
+        """)
+        # Stale days are re-joined whole, which also drops intervals GateCount no longer has
+        deleted = con.execute("""
+            DELETE FROM gate.GateCountWeather
+            WHERE CAST(DateTime AS DATE) IN (SELECT Date FROM gate.GateWeatherStaleDays);
+        """).fetchone()[0]
+        con.execute("""
+            CREATE OR REPLACE TEMP TABLE GateWeatherPending AS
+            SELECT DateTime, Gate, Ingress, Egress FROM gate.GateCount
+            WHERE DateTime >= (SELECT MIN(Date) FROM gate.GateWeatherStaleDays)
+              AND CAST(DateTime AS DATE) IN (SELECT Date FROM gate.GateWeatherStaleDays)
+            UNION
+            SELECT DateTime, Gate, Ingress, Egress FROM gate.GateCount
+            WHERE DateTime >= (SELECT MIN(LocalTime) FROM GateWeatherChanged);
+        """)
+        rows = con.execute(f"""
+            INSERT OR REPLACE INTO gate.GateCountWeather
+            SELECT
+                p.DateTime, p.Gate, p.Ingress, p.Egress,
+                w.WeatherTime, DATE_DIFF('minute', w.LocalTime, p.DateTime),
+                w.Temperature, w.ApparentTemperature, w.Humidity, w.PrecipitationProbability,
+                w.RainIntensity, w.WindSpeed, w.CloudCover, w.UvIndex, w.WeatherCode,
+                w.ZooWeatherScore, w.ConditionRating
+            FROM GateWeatherPending p
+            ASOF LEFT JOIN ({OBSERVATIONS}) w ON p.DateTime >= w.LocalTime;
+        """).fetchone()[0]
+        con.execute("INSERT OR REPLACE INTO gate.GateWeatherApplied SELECT WeatherTime, LocalTime, Fingerprint FROM GateWeatherChanged;")
+        con.execute("DELETE FROM gate.GateWeatherStaleDays;")
+        for table in ('GateWeatherChanged', 'GateWeatherPending'):
+            con.execute(f"DROP TABLE {table};")
+        if rows or deleted or rebuild:  # a refresh that found nothing to do leaves readers' caches valid
+            bump_data_version(con)
+        con.execute("COMMIT;")
+    except Exception:
+        rollback(con)
+        raise
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh gate.GateCountWeather (gate intervals joined to weather) in the zoo store")
+    parser.add_argument('--rebuild', action='store_true', help="recompute every interval")
+    args = parser.parse_args()
+
+    con = connect_store()
+    try:
+        print(f"GateCountWeather: {refresh_gate_weather(con, rebuild=args.rebuild):,} intervals written")
+    finally:
+        con.close()
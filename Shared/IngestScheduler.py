@@ -0,0 +1,188 @@
+import argparse
+import logging
+import os
+import random
+import signal
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, '..', 'Sensource-API'))
+sys.path.append(os.path.join(HERE, '..', 'Zoo-WeatherAPI'))
+
+from ApiClient import RequestBudgetExceeded, close_clients
+from ZooStore import connect_store
+
+logger = logging.getLogger("IngestScheduler")
+
+
+class Job:
+    """A task run every interval seconds, delayed by up to jitter seconds each time"""
+
+    def __init__(self, name, run, interval, jitter=0.0):
+        self.name = name
+        self.run = run
+        self.interval = interval
+        self.jitter = min(jitter, interval / 2)
+        self.slot = time.monotonic()
+        self.next_run = self.slot + random.uniform(0, self.jitter)
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+
+    def reschedule(self, now):
+        """Move to the next slot after now; slots missed while the job was running are skipped, not queued"""
+        self.slot += self.interval
+        if self.slot <= now:
+            missed = int((now - self.slot) // self.interval) + 1
+            self.skipped += missed
+            self.slot += missed * self.interval
+            logger.warning(f"{self.name}: run took longer than its interval, skipped {missed} run(s)")
+        self.next_run = self.slot + random.uniform(0, self.jitter)
+
+
+class IngestScheduler:
+    """Runs the ingestion jobs in one resident process.
+
+    Jobs run one at a time on the main thread, so a job never overlaps itself or another job's
+    database writes. The API sessions (ApiClient) stay open between runs; the zoo store is opened by
+    each job and released in between, so Power BI and the query scripts can read it, unless hold_store
+    keeps it open. With serve_port set, a QueryService answers read-only queries on the same database
+    instance, which is then held open so the service's connections and the jobs' never differ in mode.
+    """
+
+    def __init__(self, jobs, hold_store=False, serve_port=None, serve_host='127.0.0.1'):
+        self.jobs = jobs
+        self.hold_store = hold_store or bool(serve_port)  # a read-only service connection would lock the jobs out
+        self.serve_port = serve_port
+        self.serve_host = serve_host
+        self.store = None
+        self.service = None
+        self.stopping = threading.Event()
+
+    def stop(self, signum=None, frame=None):
+        if self.stopping.is_set():
+            raise KeyboardInterrupt  # second signal: abandon the current run
+        logger.info("Shutdown requested; finishing the current run")
+        self.stopping.set()
+
+    def install_signal_handlers(self):
+        for name in ('SIGINT', 'SIGTERM', 'SIGBREAK'):  # SIGBREAK is Ctrl+Break on Windows
+            if hasattr(signal, name):
+                signal.signal(getattr(signal, name), self.stop)
+
+    def run_job(self, job):
+        start = time.monotonic()
+        try:
+            result = job.run()
+            job.runs += 1
+            logger.info(f"{job.name}: finished in {time.monotonic() - start:.1f}s ({result})")
+        except RequestBudgetExceeded as e:
+            logger.warning(f"{job.name}: skipped, {e}")
+        except Exception:
+            job.failures += 1
+            logger.exception(f"{job.name}: failed")
+        job.reschedule(time.monotonic())
+
+    def run_forever(self):
+        if self.hold_store:
+            # Connections opened by the jobs reuse this database instance and its cache
+            self.store = connect_store()
+        if self.serve_port:
+            from QueryService import QueryService
+            self.service = QueryService(self.serve_host, self.serve_port)
+            logger.info(f"Serving read-only queries on {self.service.start()}/api")
+        try:
+            logger.info("Scheduler started: " + ", ".join(f"{j.name} every {j.interval / 60:g} min" for j in self.jobs))
+            while not self.stopping.is_set():
+                job = min(self.jobs, key=lambda j: j.next_run)
+                if self.stopping.wait(max(0.0, job.next_run - time.monotonic())):
+                    break
+                self.run_job(job)
+        finally:
+            self.close()
+
+    def run_once(self):
+        try:
+            for job in self.jobs:
+                self.run_job(job)
+        finally:
+            self.close()
+
+    def close(self):
+        if self.service is not None:
+            self.service.stop()
+            self.service = None
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+        close_clients()
+        for job in self.jobs:
+            logger.info(f"{job.name}: {job.runs} runs, {job.failures} failed, {job.skipped} skipped")
+
+
+def build_jobs(gate_minutes=15, weather_minutes=10, jitter=60, forecast_minutes=60):
+    """Create the Sensource and Tomorrow.io jobs; a cadence of 0 disables that source"""
+    jobs = []
+    if gate_minutes:
+        from YearToDate import GateCountFetcher as IntervalFetcher
+        from DailyTotal import GateCountFetcher as DailyFetcher
+
+        intervals, daily = IntervalFetcher(), DailyFetcher()
+
+        def update_gate_counts():
+            rows = len(intervals.get_gate_count())
+            days = len(daily.get_gate_count())
+            return f"{rows:,} gate interval rows, {days} daily rows"
+
+        jobs.append(Job('sensource', update_gate_counts, gate_minutes * 60, jitter))
+    if weather_minutes:
+        from HistoricalWeatherAnalysis import update_realtime_weather
+
+        def update_weather():
+            inserted, rejoined = update_realtime_weather()
+            return f"{inserted} new scores, {rejoined} gate intervals re-joined"
+
+        jobs.append(Job('tomorrow', update_weather, weather_minutes * 60, jitter))
+    if forecast_minutes:
+        from AttendanceForecast import update_attendance_forecast
+
+        def update_forecast():
+            return f"{update_attendance_forecast()} days forecast"
+
+        jobs.append(Job('forecast', update_forecast, forecast_minutes * 60, jitter))
+    return jobs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep the zoo store up to date from Sensource and Tomorrow.io")
+    parser.add_argument('--gate-minutes', type=float, default=15, help="Sensource polling interval (0 disables)")
+    parser.add_argument('--weather-minutes', type=float, default=10, help="Tomorrow.io realtime polling interval (0 disables)")
+    parser.add_argument('--forecast-minutes', type=float, default=60,
+                        help="Tomorrow.io forecast and attendance forecast interval (0 disables)")
+    parser.add_argument('--jitter', type=float, default=60, help="random delay of up to this many seconds per run")
+    parser.add_argument('--hold-store', action='store_true',
+                        help="keep the zoo store open between runs (other processes, e.g. Power BI, cannot open it meanwhile)")
+    parser.add_argument('--serve', type=int, metavar='PORT',
+                        help="also serve the store read-only as JSON on this port (QueryService.py)")
+    parser.add_argument('--serve-host', default='127.0.0.1', help="interface for --serve (0.0.0.0 for the whole intranet)")
+    parser.add_argument('--once', action='store_true', help="run every job once and exit")
+    args = parser.parse_args()
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('[%(asctime)s] [%(levelname)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+    scheduler = IngestScheduler(
+        build_jobs(args.gate_minutes, args.weather_minutes, args.jitter, args.forecast_minutes),
+        hold_store=args.hold_store,
+        serve_port=None if args.once else args.serve,
+        serve_host=args.serve_host,
+    )
+    if args.once:
+        scheduler.run_once()
+    else:
+        scheduler.install_signal_handlers()
+        scheduler.run_forever()
@@ -0,0 +1,344 @@
+"""End-to-end benchmarks of the fetchers against the local fake APIs (FakeApi.py), no tokens needed.
+
+Every case runs in a fresh interpreter with its own empty zoo store, response cache and dlt folder,
+and measures fetch -> transform -> DuckDB write: wall and CPU time, the peak resident memory the run
+added on top of the imports and, with --trace-memory, the peak Python heap. The server counts the
+requests and bytes each case pulled. Results can be saved with --json and compared with --compare.
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RESULT_PREFIX = 'BENCH-RESULT '
+
+CASES = {}
+
+
+def case(name, description, cached=False):
+    """Register a benchmark case. The function does the imports and setup and returns the timed callable,
+    which returns the number of rows it wrote. Cached cases run once unmeasured to warm the response cache."""
+    def register(setup):
+        CASES[name] = {'setup': setup, 'description': description, 'cached': cached}
+        return setup
+    return register
+
+
+def use_folder(name):
+    path = os.path.join(HERE, '..', name)
+    if path not in sys.path:
+        sys.path.append(path)
+
+
+def quiet_gate_logger():
+    """Keep benchmark runs out of Sensource-API/logs/GateCount.log and the console"""
+    gate_logger = logging.getLogger("GateCountFetcher")
+    for handler in list(gate_logger.handlers):
+        gate_logger.removeHandler(handler)
+    gate_logger.addHandler(logging.NullHandler())
+
+
+def first_day(args):
+    return date.today() - timedelta(days=args.days - 1)
+
+
+def traffic_url(args):
+    return (
+        f"/api/data/traffic?relativeDate=custom&startDate={first_day(args):%m-%d-%Y}&endDate={date.today():%m-%d-%Y}"
+        "&dateGroupings=minute(15)&entityType=sensor&excludeClosedHours=true&metrics=ins%2Couts"
+    )
+
+
+@case('sensource-download', "stream the 15-minute traffic window and discard it (network and server only)")
+def download_case(args):
+    from ApiClient import get_client
+    url = traffic_url(args)
+
+    def run():
+        with get_client('sensource').get(url, stream=True) as response:
+            for _ in response.iter_content(chunk_size=1 << 16):
+                pass
+        return None
+    return run
+
+
+def ytd_setup(args):
+    use_folder('Sensource-API')
+    from YearToDate import GateCountFetcher
+    quiet_gate_logger()
+    fetcher = GateCountFetcher()
+    return lambda: len(fetcher.get_gate_count(incremental=False, start=first_day(args)))
+
+
+case('ytd', "YearToDate full load of the window: GateCount, rollups and the gate x weather join")(ytd_setup)
+case('ytd-cached', "the same load again, with closed days replayed from the response cache", cached=True)(ytd_setup)
+
+
+@case('backfill', "Backfill.py over the window in week windows with 4 workers")
+def backfill_case(args):
+    use_folder('Sensource-API')
+    from Backfill import backfill
+    from ZooStore import connect_store
+    quiet_gate_logger()
+
+    def run():
+        backfill(first_day(args), date.today(), window='week', workers=4)
+        con = connect_store('gate', read_only=True)
+        try:
+            return con.execute("SELECT COUNT(*) FROM GateCount;").fetchone()[0]
+        finally:
+            con.close()
+    return run
+
+
+def transform_setup(args):
+    """The parsed traffic results of the window and an in-memory database whose SensorGate knows their sensors.
+
+    The transform cases start from the same parsed results, so they time the transform alone.
+    """
+    import duckdb
+    import pyarrow as pa
+    from ApiClient import get_client
+
+    use_folder('Sensource-API')
+    from SensorGates import ensure_sensor_table, register_sensors
+    quiet_gate_logger()
+    results = get_client('sensource').get(traffic_url(args)).json()['results']
+    con = duckdb.connect(database=':memory:')
+    ensure_sensor_table(con)
+    con.register('sensors', pa.table({'name': sorted({item['name'] for item in results})}))
+    register_sensors(con, 'sensors')
+    con.unregister('sensors')
+    return results, con
+
+
+@case('transform-pandas', "the original pandas transform of the parsed window into a gate-level DuckDB table")
+def transform_pandas_case(args):
+    import pandas as pd
+    results, con = transform_setup(args)
+    gates = dict(con.execute("SELECT SensorName, Gate FROM SensorGate;").fetchall())
+
+    def run():
+        df = pd.DataFrame.from_dict(results)
+        date_col = [col for col in df.columns if 'recordDate' in col][0]
+        df = df[[date_col, 'name', 'sumins', 'sumouts']]
+        df = df.rename(columns={date_col: 'DateTime', 'name': 'location', 'sumins': 'Ingress', 'sumouts': 'Egress'})
+        df['DateTime'] = pd.to_datetime(df['DateTime'])
+        df['DateTime'] = df['DateTime'].dt.tz_convert('America/Chicago')
+        df['DateTime'] = df['DateTime'].dt.tz_localize(None)
+        df = df[(df.Ingress != 0) | (df.Egress != 0)]
+        df['Gate'] = df['location'].apply(lambda x: gates[x])
+        df = df.groupby(['DateTime', 'Gate'], as_index=False)[['Ingress', 'Egress']].sum()
+        con.execute("CREATE OR REPLACE TEMP TABLE GateStaging AS SELECT * FROM df;")
+        return len(results)
+    return run
+
+
+@case('transform-arrow', "YearToDate's transform of the same results: Arrow batches and one DuckDB statement")
+def transform_arrow_case(args):
+    import pyarrow as pa
+    results, con = transform_setup(args)
+    from SensourceStream import TRAFFIC_SCHEMA, record_batches
+    from YearToDate import GateCountFetcher
+    fetcher = GateCountFetcher()
+
+    def run():
+        traffic = pa.Table.from_batches(list(record_batches(results)), schema=TRAFFIC_SCHEMA)
+        con.register('BenchTraffic', traffic)
+        fetcher.transform(con, 'BenchTraffic')
+        con.unregister('BenchTraffic')
+        return len(results)
+    return run
+
+
+@case('daily', "DailyTotal.py: today's per-sensor totals into DailyGateCount")
+def daily_case(args):
+    use_folder('Sensource-API')
+    from DailyTotal import GateCountFetcher
+    quiet_gate_logger()
+    fetcher = GateCountFetcher()
+    return lambda: len(fetcher.get_gate_count())
+
+
+@case('weather-realtime', "HistoricalWeatherAnalysis: realtime observation through dlt, scoring and the gate join")
+def realtime_case(args):
+    use_folder('Zoo-WeatherAPI')
+    from HistoricalWeatherAnalysis import update_realtime_weather
+    return lambda: update_realtime_weather()[0]
+
+
+@case('weather-past-week', "PastWeekWeather: a week of hourly /v4/timelines values through dlt")
+def past_week_case(args):
+    use_folder('Zoo-WeatherAPI')
+    from PastWeekWeather import load_past_week
+    from ZooStore import connect_store
+
+    def run():
+        load_past_week()
+        con = connect_store('weather', read_only=True)
+        try:
+            return con.execute("SELECT COUNT(*) FROM weather_history;").fetchone()[0]
+        finally:
+            con.close()
+    return run
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, or None where the resource module is missing (Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_child(args):
+    """Body of the child interpreter: set up one case, time it and print the measurements"""
+    import contextlib
+    import io
+    import tracemalloc
+
+    output = io.StringIO()  # the fetchers print progress; keep it off the result line
+    with contextlib.redirect_stdout(output):
+        start = time.perf_counter()
+        run = CASES[args.child]['setup'](args)
+        # DuckDB imports pandas the first time it binds a parameter or returns a DataFrame; a one-off
+        # cost per process that would otherwise land in whichever stage happens to come first
+        import pandas  # noqa: F401
+        setup_seconds = time.perf_counter() - start
+        rss_before = peak_rss_mb()
+        if args.trace_memory:
+            tracemalloc.start()
+        cpu, start = time.process_time(), time.perf_counter()
+        rows = run()
+        seconds, cpu = time.perf_counter() - start, time.process_time() - cpu
+        heap = tracemalloc.get_traced_memory()[1] / (1 << 20) if args.trace_memory else None
+        rss_after = peak_rss_mb()
+    print(RESULT_PREFIX + json.dumps({
+        'setup_s': setup_seconds, 'wall_s': seconds, 'cpu_s': cpu, 'rows': rows,
+        'peak_rss_mb': rss_after, 'added_rss_mb': None if rss_after is None else rss_after - rss_before,
+        'peak_heap_mb': heap,
+    }))
+
+
+def empty_store(path):
+    """Create the store up front, so ensure_store does not import the legacy databases into it"""
+    import duckdb
+    from ZooStore import create_schemas
+
+    con = duckdb.connect(database=path)
+    try:
+        create_schemas(con)
+    finally:
+        con.close()
+
+
+def child_env(workdir, server, cache):
+    env = dict(os.environ)
+    env.update({
+        'ZOO_DB_PATH': os.path.join(workdir, 'zoo.duckdb'),
+        'ZOO_CACHE': 'on' if cache else 'off',
+        'ZOO_CACHE_DIR': os.path.join(workdir, 'cache'),
+        'ZOO_CACHE_TTL': '0',  # only closed days are replayed, the open window is always fetched
+        'DLT_DATA_DIR': os.path.join(workdir, 'dlt'),
+        'SENSOURCE_BASE_URL': server.url,
+        'TOMORROW_BASE_URL': server.url,
+        'SENSOURCE_TOKEN': 'bench',
+        'API_KEY': 'bench',
+    })
+    return env
+
+
+def measure(name, args, server):
+    """Run one case in a fresh interpreter and workspace; returns its measurements"""
+    command = [sys.executable, os.path.abspath(__file__), '--child', name, '--days', str(args.days)]
+    if args.trace_memory:
+        command.append('--trace-memory')
+    with tempfile.TemporaryDirectory(prefix='zoo-bench-') as workdir:
+        env = child_env(workdir, server, CASES[name]['cached'])
+        empty_store(env['ZOO_DB_PATH'])
+        if CASES[name]['cached']:
+            subprocess.run(command, env=env, capture_output=True, text=True, check=True)
+        requests_before, bytes_before = server.totals()
+        result = subprocess.run(command, env=env, capture_output=True, text=True)
+        requests_after, bytes_after = server.totals()
+    lines = [line for line in result.stdout.splitlines() if line.startswith(RESULT_PREFIX)]
+    if result.returncode or not lines:
+        raise RuntimeError(f"{name} failed:\n{result.stderr[-3000:]}")
+    measured = json.loads(lines[-1][len(RESULT_PREFIX):])
+    measured.update({'case': name, 'requests': requests_after - requests_before,
+                     'mb_received': (bytes_after - bytes_before) / (1 << 20)})
+    return measured
+
+
+def fmt(value, spec):
+    return '-' if value is None else format(value, spec)
+
+
+def print_results(results, baseline=None):
+    previous = {r['case']: r for r in (baseline or {}).get('results', [])}
+    print(f"{'case':<18} {'wall s':>7} {'cpu s':>6} {'rows':>8} {'rows/s':>9} {'+rss MB':>8} {'heap MB':>8} {'reqs':>5} {'MB in':>6}"
+          + ("  vs baseline" if baseline else ""))
+    for r in results:
+        rate = r['rows'] / r['wall_s'] if r['rows'] and r['wall_s'] else None
+        line = (f"{r['case']:<18} {r['wall_s']:>7.2f} {r['cpu_s']:>6.2f} {fmt(r['rows'], ',d'):>8} {fmt(rate, ',.0f'):>9} "
+                f"{fmt(r['added_rss_mb'], '.1f'):>8} {fmt(r['peak_heap_mb'], '.1f'):>8} {r['requests']:>5} {r['mb_received']:>6.1f}")
+        if r['case'] in previous:
+            line += f"  {(r['wall_s'] / previous[r['case']]['wall_s'] - 1) * 100:+.0f}% wall"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the fetch -> transform -> DuckDB write path of each fetcher against fake APIs")
+    parser.add_argument('cases', nargs='*', help=f"cases to run (default: all): {', '.join(CASES)}")
+    parser.add_argument('--days', type=int, default=30, help="days of 15-minute traffic per run")
+    parser.add_argument('--sensors', type=int, default=8, help="door sensors reporting traffic")
+    parser.add_argument('--open-hours', default='9-17', help="local opening hours, e.g. 9-17")
+    parser.add_argument('--repeat', type=int, default=1, help="runs per case; the fastest is reported")
+    parser.add_argument('--trace-memory', action='store_true', help="also record the peak Python heap (slows the runs down)")
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--compare', help="results file from an earlier run to compare wall times against")
+    parser.add_argument('--child', choices=list(CASES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    unknown = set(args.cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+    sys.path.append(HERE)
+    if args.child:
+        run_child(args)
+        sys.exit(0)
+
+    from FakeApi import FakeApiServer, FakeData
+
+    open_hour, close_hour = (int(h) for h in args.open_hours.split('-'))
+    server = FakeApiServer(data=FakeData(args.sensors, (open_hour, close_hour)))
+    server.start()
+    print(f"{args.days} days x {args.sensors} sensors x {(close_hour - open_hour) * 4} intervals "
+          f"= {args.days * args.sensors * (close_hour - open_hour) * 4:,} sensor rows per window\n")
+    results = []
+    try:
+        for name in args.cases or list(CASES):
+            runs = [measure(name, args, server) for _ in range(args.repeat)]
+            results.append(min(runs, key=lambda r: r['wall_s']))
+    finally:
+        server.stop()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if (baseline['days'], baseline['sensors'], baseline['open_hours']) != (args.days, args.sensors, args.open_hours):
+            print(f"Note: {args.compare} was run at a different scale ({baseline['days']} days x {baseline['sensors']} sensors)")
+    print_results(results, baseline)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'days': args.days, 'sensors': args.sensors, 'open_hours': args.open_hours,
+                       'python': sys.version.split()[0], 'results': results}, f, indent=2)
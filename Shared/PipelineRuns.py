@@ -0,0 +1,285 @@
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from ZooStore import bump_data_version, connect_store, print_query
+
+logger = logging.getLogger("PipelineRuns")
+
+# One row per fetcher run; stages holds the per-stage breakdown in the order the stages first ran.
+# peak_rss_mb is the process's high-water mark at the end of the run; a stage's rss_added_mb is how far
+# resident memory rose above where it stood when the stage started (the largest rise over its calls)
+STAGES_TYPE = 'STRUCT(stage VARCHAR, seconds DOUBLE, calls INTEGER, rows BIGINT, bytes BIGINT, rss_added_mb DOUBLE)[]'
+RUNS_DDL = f"""
+    CREATE TABLE IF NOT EXISTS main.pipeline_runs (
+        run_id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+        pipeline VARCHAR NOT NULL,
+        started_at TIMESTAMP NOT NULL,
+        seconds DOUBLE,
+        status VARCHAR,
+        error VARCHAR,
+        rows BIGINT,
+        bytes BIGINT,
+        peak_rss_mb DOUBLE,
+        stages {STAGES_TYPE}
+    );
+"""
+
+
+def ensure_runs_table(con):
+    """Create main.pipeline_runs, or move one from before rss_added_mb to the current stages type.
+
+    The old per-stage peak_rss_mb was the process peak at the time, not the stage's, so it is dropped.
+    """
+    con.execute(RUNS_DDL)
+    stages_type = con.execute("""
+        SELECT data_type FROM duckdb_columns()
+        WHERE schema_name = 'main' AND table_name = 'pipeline_runs' AND column_name = 'stages';
+    """).fetchone()[0]
+    if 'rss_added_mb' not in stages_type:
+        con.execute(f"""
+            ALTER TABLE main.pipeline_runs ALTER stages TYPE {STAGES_TYPE}
+            USING list_transform(stages, x -> {{
+                'stage': x['stage'], 'seconds': x['seconds'], 'calls': x['calls'], 'rows': x['rows'],
+                'bytes': x['bytes'], 'rss_added_mb': NULL::DOUBLE
+            }});
+        """)
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far in MB (DuckDB's native memory included), or None if unknown"""
+    try:
+        import resource
+    except ImportError:
+        counters = _windows_memory_counters()
+        return counters.PeakWorkingSetSize / (1 << 20) if counters else None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024  # bytes on macOS, KB on Linux
+
+
+def current_rss_mb():
+    """Resident memory of this process right now in MB (Linux and Windows), or None if unknown"""
+    if sys.platform.startswith('linux'):
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1 << 20)
+        except (OSError, ValueError, IndexError):
+            return None
+    if sys.platform == 'win32':
+        counters = _windows_memory_counters()
+        return counters.WorkingSetSize / (1 << 20) if counters else None
+    return None
+
+
+def rss_added_mb(rss_before, peak_before):
+    """How far resident memory rose above rss_before since then, given the process peak at that moment.
+
+    When the process peak moved in the meantime it was set in between, so the rise is exact; otherwise
+    the current resident memory gives a lower bound. None where current_rss_mb() is unknown.
+    """
+    if rss_before is None:
+        return None
+    peak = peak_rss_mb()
+    if peak is not None and peak_before is not None and peak > peak_before:
+        return peak - rss_before
+    rss = current_rss_mb()
+    return None if rss is None else rss - rss_before
+
+
+def _windows_memory_counters():
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                    'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage',
+                )
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        kernel32 = ctypes.windll.kernel32
+        kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+        if not kernel32.K32GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+            return None
+        return counters
+    except (AttributeError, OSError):
+        return None
+
+
+class StageCounts:
+    """Rows and bytes a stage reports while it runs"""
+
+    def __init__(self):
+        self.rows = 0
+        self.bytes = 0
+
+
+class Stage:
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.calls = 0
+        self.rows = 0
+        self.bytes = 0
+        self.rss_added_mb = None
+
+
+class PipelineRun:
+    """Timings of one fetcher run, broken down by stage, logged and stored in main.pipeline_runs.
+
+        with PipelineRun('ytd', logger) as run:
+            with run.stage('fetch') as counts:
+                counts.bytes += ...
+            run.rows = ...
+
+    A stage that runs several times (one fetch per window, say) is added up. Stages can be recorded
+    from several threads; their seconds are then summed over the threads, and a stage's memory rise
+    includes whatever the other threads allocated meanwhile.
+    """
+
+    def __init__(self, pipeline, log=None, record=True):
+        self.pipeline = pipeline
+        self.logger = log or logger
+        self.record = record
+        self.rows = None
+        self.status = None  # 'ok' unless set (e.g. 'partial') or the run raises
+        self.stages = {}
+        self.lock = threading.Lock()
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+
+    def add(self, name, seconds, rows=0, bytes=0, rss_added=None):
+        """Add one call of a stage that was timed elsewhere (rss_added: its memory rise in MB, if measured)"""
+        with self.lock:
+            stage = self.stages.setdefault(name, Stage(name))
+            stage.seconds += seconds
+            stage.calls += 1
+            stage.rows += rows or 0
+            stage.bytes += bytes or 0
+            if rss_added is not None and (stage.rss_added_mb is None or rss_added > stage.rss_added_mb):
+                stage.rss_added_mb = rss_added
+
+    @contextmanager
+    def stage(self, name):
+        counts = StageCounts()
+        rss_before, peak_before = current_rss_mb(), peak_rss_mb()
+        start = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            seconds = time.perf_counter() - start
+            self.add(name, seconds, counts.rows, counts.bytes, rss_added_mb(rss_before, peak_before))
+
+    def summary(self, seconds, status):
+        parts = [f"{self.pipeline} {status} in {seconds:.2f}s"]
+        if self.rows is not None:
+            parts[0] += f", {self.rows:,} rows"
+        for stage in self.stages.values():
+            detail = f"{stage.name} {stage.seconds:.2f}s"
+            if stage.calls > 1:
+                detail += f" x{stage.calls}"
+            if stage.rows:
+                detail += f" {stage.rows:,} rows"
+            if stage.bytes:
+                detail += f" {stage.bytes / (1 << 20):.1f} MB"
+            if stage.rss_added_mb is not None:
+                detail += f" +{max(stage.rss_added_mb, 0):.0f} MB rss"
+            parts.append(detail)
+        peak = peak_rss_mb()
+        if peak is not None:
+            parts.append(f"process peak {peak:.0f} MB")
+        return " | ".join(parts)
+
+    def finish(self, status=None, error=None):
+        status = status or self.status or 'ok'
+        seconds = time.perf_counter() - self.start
+        self.logger.info(self.summary(seconds, status))
+        if self.record:
+            try:
+                self.save(seconds, status, error)
+            except Exception as e:  # e.g. the store is locked by another process; the run itself is fine
+                self.logger.warning(f"Could not record the {self.pipeline} run in pipeline_runs: {e}")
+
+    def save(self, seconds, status, error):
+        con = connect_store()
+        try:
+            ensure_runs_table(con)
+            con.execute("""
+                INSERT INTO main.pipeline_runs (pipeline, started_at, seconds, status, error, rows, bytes, peak_rss_mb, stages)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
+            """, [
+                self.pipeline, self.started_at, seconds, status, error, self.rows,
+                sum(s.bytes for s in self.stages.values()), peak_rss_mb(),
+                [{'stage': s.name, 'seconds': s.seconds, 'calls': s.calls, 'rows': s.rows, 'bytes': s.bytes,
+                  'rss_added_mb': s.rss_added_mb} for s in self.stages.values()],
+            ])
+            if status != 'failed':
+                bump_data_version(con)
+        finally:
+            con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.finish()
+        else:
+            self.finish('failed', f"{exc_type.__name__}: {exc}")
+        return False
+
+
+def print_runs(con, pipeline=None, limit=20):
+    """Recent runs with their stage breakdown, then each pipeline's last successful run against its median"""
+    exists = con.execute("""
+        SELECT COUNT(*) FROM duckdb_tables() WHERE schema_name = 'main' AND table_name = 'pipeline_runs';
+    """).fetchone()[0]
+    if not exists:
+        print("No runs recorded yet")
+        return
+    # Inlined rather than bound: binding a parameter makes DuckDB import pandas, which is slow to start
+    where = "AND pipeline = '{}'".format(pipeline.replace("'", "''")) if pipeline else ""
+    print_query(con, f"""
+        SELECT
+            strftime(started_at, '%Y-%m-%d %H:%M:%S') AS started, pipeline, status,
+            round(seconds, 2) AS seconds, rows, round(bytes / 1048576, 1) AS mb, round(peak_rss_mb) AS process_peak_mb,
+            array_to_string(list_transform(stages, s -> s.stage || ' ' || round(s.seconds, 2) || 's'), ', ') AS stages
+        FROM main.pipeline_runs
+        WHERE true {where}
+        ORDER BY started_at DESC
+        LIMIT {int(limit)};
+    """)
+    print()
+    print_query(con, f"""
+        SELECT
+            pipeline, COUNT(*) AS runs,
+            round(median(seconds), 2) AS median_s,
+            round(arg_max(seconds, started_at), 2) AS last_s,
+            round((arg_max(seconds, started_at) / median(seconds) - 1) * 100) AS last_vs_median_pct
+        FROM main.pipeline_runs
+        WHERE status = 'ok' {where}
+        GROUP BY pipeline
+        ORDER BY pipeline;
+    """)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show recent fetcher runs from main.pipeline_runs in the zoo store")
+    parser.add_argument('--pipeline', help="only this pipeline (ytd, ytd_full, backfill, repair, daily, weather_realtime, weather_past_week, attendance_forecast)")
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    con = connect_store(read_only=True)
+    try:
+        print_runs(con, args.pipeline, args.limit)
+    finally:
+        con.close()
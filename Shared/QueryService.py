@@ -0,0 +1,398 @@
+"""Read-only JSON service over the zoo store for intranet pages and dashboards.
+
+Serves today's gate counts, the YTD rollups, in-park occupancy, the current zoo weather score and the
+attendance forecast. Responses are cached by URL and tagged with the store's data version
+(main.DataVersion, moved forward by every recorded fetcher run), so repeated polls between two ingests
+cost a dictionary lookup, and clients sending If-None-Match get a bodyless 304.
+
+DuckDB lets only one process write the store, and a reader in another process blocks it, so the
+service holds no connection between requests: it opens the store read-only to check the data version
+(at most once per version_seconds) and to answer a request the cache cannot, and closes it right
+after. A fetcher in another process therefore waits for one query at most, and while it writes, the
+version check is skipped and cached responses keep being served. Next to the jobs
+(IngestScheduler.py --serve) the connections share the scheduler's database instance instead.
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import duckdb
+
+from ZooStore import connect_store, data_version, store_path
+
+logger = logging.getLogger("QueryService")
+
+ENDPOINTS = {}
+
+
+class BadRequest(ValueError):
+    """A query parameter the endpoint cannot use; answered with 400"""
+
+
+class StoreBusy(Exception):
+    """No store connection could be opened in time; answered with 503"""
+
+
+def endpoint(path, description):
+    def register(func):
+        func.description = description
+        ENDPOINTS[path] = func
+        return func
+    return register
+
+
+def rows(cur, sql):
+    """Result rows as dicts; a table that has not been created yet reads as no rows"""
+    try:
+        cur.execute(sql)
+    except duckdb.CatalogException:
+        return []
+    columns = [d[0] for d in cur.description]
+    return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+
+# Values are validated here and inlined: binding a parameter makes DuckDB import pandas
+def date_param(query, name, default=None):
+    if name not in query:
+        return default
+    try:
+        return date.fromisoformat(query[name])
+    except ValueError:
+        raise BadRequest(f"{name} must be a date (YYYY-MM-DD)")
+
+
+def int_param(query, name, default, low, high):
+    try:
+        value = int(query.get(name, default))
+    except ValueError:
+        raise BadRequest(f"{name} must be a whole number")
+    if not low <= value <= high:
+        raise BadRequest(f"{name} must be between {low} and {high}")
+    return value
+
+
+@endpoint('/api/today', "visitors per gate today (or ?date=) and the latest in-park occupancy")
+def today(cur, query):
+    day = date_param(query, 'date', date.today())
+    gates = rows(cur, f"""
+        SELECT Gate AS gate, GateCount AS visitors FROM gate.DailyGateCount
+        WHERE Date = DATE '{day}' ORDER BY Gate;
+    """)
+    if not gates:  # DailyTotal.py has not run for the day; fall back to the 15-minute rollup
+        gates = rows(cur, f"""
+            SELECT Gate AS gate, Ingress::INTEGER AS visitors FROM gate.GateCountDaily
+            WHERE Date = DATE '{day}' ORDER BY Gate;
+        """)
+    occupancy = rows(cur, f"""
+        SELECT DateTime AS time, Occupancy AS occupancy FROM gate.ParkOccupancy
+        WHERE DateTime >= DATE '{day}' AND DateTime < DATE '{day + timedelta(days=1)}'
+        ORDER BY DateTime DESC LIMIT 1;
+    """)
+    return {
+        'date': day, 'gates': gates, 'total': sum(g['visitors'] or 0 for g in gates),
+        'occupancy': occupancy[0] if occupancy else None,
+    }
+
+
+@endpoint('/api/ytd', "year-to-date totals per gate and month (?year=, default this year)")
+def ytd(cur, query):
+    year = int_param(query, 'year', date.today().year, 2000, 2100)
+    return {
+        'year': year,
+        'gates': rows(cur, f"""
+            SELECT Gate AS gate, SUM(Ingress)::BIGINT AS ingress, SUM(Egress)::BIGINT AS egress,
+                   COUNT(*) AS days, MAX(Date) AS last_day
+            FROM gate.GateCountDaily WHERE year(Date) = {year}
+            GROUP BY Gate ORDER BY Gate;
+        """),
+        'months': rows(cur, f"""
+            SELECT Month AS month, Gate AS gate, Ingress AS ingress, Egress AS egress
+            FROM gate.GateCountMonthly WHERE year(Month) = {year}
+            ORDER BY Month, Gate;
+        """),
+    }
+
+
+@endpoint('/api/daily', "visitors per day and gate over the last ?days= (default 30)")
+def daily(cur, query):
+    days = int_param(query, 'days', 30, 1, 366)
+    return {
+        'days': days,
+        'rows': rows(cur, f"""
+            SELECT Date AS date, Gate AS gate, Ingress AS ingress, Egress AS egress
+            FROM gate.GateCountDaily
+            WHERE Date > (SELECT MAX(Date) FROM gate.GateCountDaily) - {days}
+            ORDER BY Date DESC, Gate;
+        """),
+    }
+
+
+@endpoint('/api/occupancy', "in-park occupancy by 15 minutes and the daily peak (?date=, default latest day)")
+def occupancy(cur, query):
+    day = date_param(query, 'date')
+    if day is None:
+        latest = rows(cur, "SELECT MAX(Date) AS day FROM gate.DailyPeakOccupancy;")
+        day = latest[0]['day'] if latest else None
+    if day is None:
+        return {'date': None, 'peak': None, 'intervals': []}
+    peak = rows(cur, f"""
+        SELECT PeakOccupancy AS peak_occupancy, PeakTime AS peak_time, ClosingOccupancy AS closing_occupancy,
+               Ingress AS ingress, Egress AS egress
+        FROM gate.DailyPeakOccupancy WHERE Date = DATE '{day}';
+    """)
+    return {
+        'date': day,
+        'peak': peak[0] if peak else None,
+        'intervals': rows(cur, f"""
+            SELECT DateTime AS time, Ingress AS ingress, Egress AS egress, Occupancy AS occupancy
+            FROM gate.ParkOccupancy
+            WHERE DateTime >= DATE '{day}' AND DateTime < DATE '{day + timedelta(days=1)}'
+            ORDER BY DateTime;
+        """),
+    }
+
+
+@endpoint('/api/weather', "the latest zoo weather score with the observation it was computed from")
+def weather(cur, query):
+    # Cast to text: fetching TIMESTAMPTZ values as Python datetimes needs pytz
+    score = rows(cur, """
+        SELECT time::VARCHAR AS time, location, zoo_weather_score, condition_rating
+        FROM weather.zoo_weather_scores ORDER BY time DESC LIMIT 1;
+    """)
+    observation = rows(cur, """
+        SELECT time::VARCHAR AS time, values__temperature AS temperature,
+               values__temperature_apparent AS temperature_apparent, values__humidity AS humidity,
+               values__wind_speed AS wind_speed, values__precipitation_probability AS precipitation_probability,
+               values__weather_code AS weather_code
+        FROM weather.weather_realtime ORDER BY time DESC LIMIT 1;
+    """)
+    return {'score': score[0] if score else None, 'observation': observation[0] if observation else None}
+
+
+@endpoint('/api/forecast', "expected visitors for the coming days (AttendanceForecast.py)")
+def forecast(cur, query):
+    return {'days': rows(cur, """
+        SELECT forecast_date AS date, expected_visitors, low_visitors, high_visitors,
+               zoo_weather_score, condition_rating, max_temperature, rain_share, model, generated_at
+        FROM weather.attendance_forecast
+        WHERE forecast_date >= current_date
+        ORDER BY forecast_date;
+    """)}
+
+
+def to_json(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+class ResultCache:
+    """Encoded responses by request key, valid for one data version; least recently used entries go first"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.lock_version = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, response):
+        with self.lock:
+            self.entries[key] = (version, response)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def key_lock(self, key, version):
+        """One lock per key, so a burst of polls after an ingest runs the query once, not once per poll.
+
+        The locks are dropped when the version moves on or max_entries keys have been asked for; a request
+        still holding a dropped lock at worst runs its query alongside one more.
+        """
+        with self.lock:
+            if version != self.lock_version or len(self.key_locks) >= self.max_entries:
+                self.key_locks = {}
+                self.lock_version = version
+            return self.key_locks.setdefault(key, threading.Lock())
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def send_body(self, status, body=b'', etag=None, version=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')  # clients revalidate with the ETag
+        if etag:
+            self.send_header('ETag', etag)
+        if version is not None:
+            self.send_header('X-Data-Version', str(version))
+        self.end_headers()
+        if body and self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def send_error_json(self, status, message):
+        self.send_body(status, json.dumps({'error': message}).encode())
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = url.path.rstrip('/') or '/'
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        server = self.server
+        try:
+            version = server.current_version()
+        except StoreBusy as e:
+            return self.send_error_json(503, str(e))
+        if path in ('/', '/api'):
+            payload = {'data_version': version, 'endpoints': {p: f.description for p, f in ENDPOINTS.items()}}
+            return self.send_body(200, json.dumps(payload).encode(), version=version)
+        if path not in ENDPOINTS:
+            return self.send_error_json(404, f"Unknown endpoint {path}")
+
+        key = (path, tuple(sorted(query.items())))
+        response = server.cache.get(key, version)
+        if response is None:
+            with server.cache.key_lock(key, version):
+                response = server.cache.get(key, version)  # computed by another request meanwhile
+                if response is None:
+                    try:
+                        response = server.run(ENDPOINTS[path], query, version)
+                    except BadRequest as e:
+                        return self.send_error_json(400, str(e))
+                    except StoreBusy as e:
+                        return self.send_error_json(503, str(e))
+                    except duckdb.Error as e:
+                        logger.exception(f"{path} failed")
+                        return self.send_error_json(500, str(e))
+                    server.cache.put(key, version, response)
+        body, etag = response
+        if etag in (self.headers.get('If-None-Match') or ''):
+            return self.send_body(304, etag=etag, version=version)
+        self.send_body(200, body, etag, version)
+
+    do_HEAD = do_GET
+
+
+class QueryService(ThreadingHTTPServer):
+    """Threaded HTTP server answering ENDPOINTS from short-lived read-only store connections.
+
+    pool_size caps how many connections are open at once; version_wait is how long a version check
+    waits for a writer in another process before the last version read is kept.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=8760, pool_size=4, version_seconds=1.0, cache_entries=256,
+                 version_wait=0.5):
+        super().__init__((host, port), QueryHandler)
+        self.slots = threading.BoundedSemaphore(pool_size)
+        self.cache = ResultCache(cache_entries)
+        self.version_seconds = version_seconds
+        self.version_wait = version_wait
+        self.version = None
+        self.version_checked = 0.0
+        self.version_lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @contextmanager
+    def open_store(self, wait=None):
+        """A read-only store connection, closed on exit (wait as for connect_store)"""
+        if not self.slots.acquire(timeout=10):
+            raise StoreBusy("all store connections are busy")
+        try:
+            try:
+                # Inside a process that writes the store (the scheduler) this shares its read-write instance
+                con = connect_store(read_only=True, wait=wait)
+            except duckdb.IOException as e:
+                raise StoreBusy(f"the store is in use by another process: {e}")
+            try:
+                yield con
+            finally:
+                con.close()
+        finally:
+            self.slots.release()
+
+    def current_version(self):
+        """The store's data version, read at most once per version_seconds however many requests come in.
+
+        While another process writes the store the last version read stands: nothing it writes is
+        visible before it commits, so the cached responses are still current.
+        """
+        with self.version_lock:
+            if self.version is None or time.monotonic() - self.version_checked >= self.version_seconds:
+                try:
+                    with self.open_store(self.version_wait) as con:
+                        self.version = data_version(con)
+                except StoreBusy:
+                    if self.version is None:
+                        raise
+                self.version_checked = time.monotonic()
+            return self.version
+
+    def run(self, func, query, version):
+        """(encoded body, ETag) of one endpoint call"""
+        with self.open_store() as con:
+            payload = func(con, query)
+        payload['data_version'] = version
+        body = json.dumps(payload, default=to_json).encode()
+        return body, f'"{version}-{zlib.crc32(body):08x}"'
+
+    def start(self):
+        """Serve in a background thread; returns the base URL"""
+        self.thread = threading.Thread(target=self.serve_forever, name='QueryService', daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def serve(host='127.0.0.1', port=8760, pool_size=4):
+    service = QueryService(host, port, pool_size)
+    print(f"Serving {store_path()} read-only on {service.url}/api")
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the zoo store read-only as JSON for intranet consumers")
+    parser.add_argument('--host', default='127.0.0.1', help="interface to listen on (0.0.0.0 for the whole intranet)")
+    parser.add_argument('--port', type=int, default=8760)
+    parser.add_argument('--pool', type=int, default=4, help="store connections open at once")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.pool)
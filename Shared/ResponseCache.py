@@ -0,0 +1,327 @@
+"""On-disk cache of raw API responses.
+
+Responses are stored once per distinct body (blobs/<sha256 of the body>) and indexed in index.sqlite by a
+key made of the method, endpoint, parameters and date window of the request. Windows that end before the
+settle period (by default: before yesterday) are closed and cached for good; windows that reach into the
+last day or two can still change and expire after a short TTL. The cache is capped in size and evicts the
+least recently used entries first. In offline mode nothing is fetched: cached responses are replayed
+whatever their age and a missing one raises CacheMiss.
+"""
+import argparse
+import calendar
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+DEFAULT_CACHE_DIR = os.path.join(REPO_ROOT, 'data', 'cache')
+DEFAULT_MAX_MB = 512
+DEFAULT_TTL = 300  # seconds a response for a still-open window is reused
+SETTLE_DAYS = 1  # matches YearToDate.OVERLAP: yesterday can still receive late counts
+
+INDEX_DDL = """
+    CREATE TABLE IF NOT EXISTS responses (
+        key TEXT PRIMARY KEY, digest TEXT NOT NULL, size INTEGER NOT NULL,
+        description TEXT, window_start TEXT, window_end TEXT,
+        stored_at REAL NOT NULL, expires_at REAL, last_used REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS responses_digest ON responses (digest);
+"""
+
+
+class CacheMiss(Exception):
+    """Raised in offline mode when a response is not in the cache"""
+
+
+def as_date(value):
+    """date from a date, datetime or 'mm-dd-YYYY' / 'YYYY-mm-dd' string"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    for fmt in ('%m-%d-%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f"Not a date: {value!r}")
+
+
+def is_closed(window, today=None, settle_days=SETTLE_DAYS):
+    """True when the (first_day, last_day) window ended before the settle period, so its data no longer changes"""
+    today = today or date.today()
+    return as_date(window[1]) < today - timedelta(days=settle_days)
+
+
+def cache_windows(start, end, today=None, settle_days=SETTLE_DAYS):
+    """Split start..end (inclusive) into windows whose cache keys repeat from one run to the next.
+
+    Closed calendar months that are fully inside the range become one window each, other closed days
+    one window per day, and the days that are not settled yet a single trailing window. A full-year
+    fetch is then a dozen or so requests the first time and one request (the open window) after that.
+    """
+    start, end = as_date(start), as_date(end)
+    today = today or date.today()
+    open_from = today - timedelta(days=settle_days)
+    windows = []
+    current = start
+    while current <= end and current < open_from:
+        month_end = current.replace(day=calendar.monthrange(current.year, current.month)[1])
+        if current.day == 1 and month_end <= end and month_end < open_from:
+            windows.append((current, month_end))
+            current = month_end + timedelta(days=1)
+        else:
+            windows.append((current, current))
+            current += timedelta(days=1)
+    if current <= end:
+        windows.append((current, end))
+    return windows
+
+
+def request_key(method, endpoint, params=None, json_body=None, window=None):
+    """Content key of a request: endpoint, parameters and date window (never credentials or headers)"""
+    window = [as_date(d).isoformat() for d in window] if window else None
+    payload = json.dumps([method.upper(), endpoint, params, json_body, window], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class CachedResponse:
+    """Stands in for a requests.Response whose body is a file in the cache"""
+
+    status_code = 200
+
+    def __init__(self, path, key, headers=None, from_cache=True):
+        self.path = path
+        self.cache_key = key
+        self.headers = headers or {}
+        self.from_cache = from_cache
+        self._raw = None
+
+    @property
+    def raw(self):
+        if self._raw is None:
+            self._raw = open(self.path, 'rb')
+        return self._raw
+
+    @property
+    def content(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        with open(self.path, 'rb') as f:
+            return json.load(f)
+
+    def iter_content(self, chunk_size=1 << 16, decode_unicode=False):
+        with open(self.path, 'rb') as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        if self._raw is not None:
+            self._raw.close()
+            self._raw = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ResponseCache:
+    """Content-addressed response store shared by every process that uses the same directory"""
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_MB << 20, ttl=DEFAULT_TTL, offline=False,
+                 settle_days=SETTLE_DAYS):
+        self.directory = os.path.abspath(directory or DEFAULT_CACHE_DIR)
+        self.blob_dir = os.path.join(self.directory, 'blobs')
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.offline = offline
+        self.settle_days = settle_days
+        self.lock = threading.Lock()
+        self.undeleted = set()  # digests of blobs that could not be removed yet
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(self.directory, 'index.sqlite'), timeout=30, check_same_thread=False)
+        self.db.executescript(INDEX_DDL)
+
+    def blob_path(self, digest):
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def expiry(self, window, now):
+        """None (kept until evicted) for a closed window, now + ttl otherwise"""
+        return None if is_closed(window, settle_days=self.settle_days) else now + self.ttl
+
+    def lookup(self, key):
+        """CachedResponse for key if it is cached and fresh (or at any age when offline), else None"""
+        now = time.time()
+        with self.lock:
+            row = self.db.execute("SELECT digest, expires_at FROM responses WHERE key = ?;", [key]).fetchone()
+            if row is None:
+                return None
+            digest, expires_at = row
+            path = self.blob_path(digest)
+            if not os.path.exists(path):
+                self.db.execute("DELETE FROM responses WHERE key = ?;", [key])
+                self.db.commit()
+                return None
+            if expires_at is not None and expires_at <= now and not self.offline:
+                return None
+            self.db.execute("UPDATE responses SET last_used = ? WHERE key = ?;", [now, key])
+            self.db.commit()
+        return CachedResponse(path, key)
+
+    def store(self, key, response, window, description=None):
+        """Write the body of a requests.Response to the cache (chunk by chunk) and return it as a CachedResponse"""
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=self.blob_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=1 << 16):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        finally:
+            response.close()
+        digest = digest.hexdigest()
+        path = self.blob_path(digest)
+        now = time.time()
+        first, last = (as_date(d).isoformat() for d in window)
+        with self.lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                os.replace(tmp, path)  # same body, same name: an existing copy is simply overwritten
+            except OSError:
+                # On Windows a copy that is open for reading cannot be replaced; it holds the same bytes anyway
+                if not os.path.exists(path):
+                    raise
+                os.remove(tmp)
+            self.db.execute("""
+                INSERT OR REPLACE INTO responses
+                (key, digest, size, description, window_start, window_end, stored_at, expires_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
+            """, [key, digest, size, description, first, last, now, self.expiry(window, now), now])
+            self.db.commit()
+            self._evict(keep=key)
+        return CachedResponse(path, key, headers=dict(response.headers), from_cache=False)
+
+    def discard(self, key):
+        """Drop one entry, e.g. a response that turned out not to parse"""
+        with self.lock:
+            self._delete("WHERE key = ?", [key])
+
+    def _delete(self, where, params=()):
+        """Delete the matching entries, and the blob files no remaining entry points to"""
+        digests = {row[0] for row in self.db.execute(f"SELECT digest FROM responses {where};", params).fetchall()}
+        self.db.execute(f"DELETE FROM responses {where};", params)
+        self.db.commit()
+        for digest in digests | self.undeleted:
+            self.undeleted.discard(digest)
+            if self.db.execute("SELECT 1 FROM responses WHERE digest = ? LIMIT 1;", [digest]).fetchone() is None:
+                try:
+                    os.remove(self.blob_path(digest))
+                except FileNotFoundError:
+                    pass
+                except OSError:  # still open for reading (Windows); tried again on the next delete
+                    self.undeleted.add(digest)
+        return len(digests)
+
+    def _evict(self, keep=None):
+        """Drop expired entries, then the least recently used ones until the blobs fit in max_bytes.
+
+        keep is the entry just stored, which the caller is about to read.
+        """
+        if not self.offline:
+            self._delete("WHERE expires_at IS NOT NULL AND expires_at <= ? AND key IS DISTINCT FROM ?", [time.time(), keep])
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM responses);").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        oldest = []
+        for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY last_used;").fetchall():
+            if key == keep:
+                continue
+            oldest.append(key)
+            total -= size
+            if total <= self.max_bytes:
+                break
+        self._delete(f"WHERE key IN ({', '.join('?' * len(oldest))})", oldest)
+
+    def prune(self):
+        with self.lock:
+            self._evict()
+
+    def clear(self):
+        with self.lock:
+            self._delete("")
+
+    def stats(self):
+        return self.db.execute("""
+            SELECT COUNT(*), COUNT(*) FILTER (WHERE expires_at IS NULL), COUNT(DISTINCT digest),
+                   COALESCE(SUM(size), 0)
+            FROM responses;
+        """).fetchone()
+
+    def close(self):
+        self.db.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def default_cache():
+    """The process-wide cache configured from the environment, or None when ZOO_CACHE=off.
+
+    ZOO_CACHE: on (default), off or offline. ZOO_CACHE_DIR: cache folder (default data/cache).
+    ZOO_CACHE_MAX_MB: size cap. ZOO_CACHE_TTL: seconds to reuse responses for windows still open.
+    """
+    global _cache
+    mode = os.getenv('ZOO_CACHE', 'on').lower()
+    if mode == 'off':
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(
+                os.getenv('ZOO_CACHE_DIR') or None,
+                max_bytes=int(float(os.getenv('ZOO_CACHE_MAX_MB', DEFAULT_MAX_MB)) * (1 << 20)),
+                ttl=float(os.getenv('ZOO_CACHE_TTL', DEFAULT_TTL)),
+                offline=mode == 'offline',
+            )
+        return _cache
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or trim the API response cache")
+    parser.add_argument('--prune', action='store_true', help="drop expired entries and enforce the size cap")
+    parser.add_argument('--clear', action='store_true', help="drop every cached response")
+    args = parser.parse_args()
+
+    cache = ResponseCache(os.getenv('ZOO_CACHE_DIR') or None,
+                          max_bytes=int(float(os.getenv('ZOO_CACHE_MAX_MB', DEFAULT_MAX_MB)) * (1 << 20)))
+    try:
+        if args.clear:
+            cache.clear()
+        elif args.prune:
+            cache.prune()
+        entries, permanent, blobs, size = cache.stats()
+        print(f"Response cache: {cache.directory}")
+        print(f"  {entries} responses ({permanent} closed windows), {blobs} distinct bodies, {size / (1 << 20):.1f} MB")
+    finally:
+        cache.close()
@@ -0,0 +1,225 @@
+"""zoo-data command line.
+
+Only argparse and the standard library are imported up front; each subcommand imports the
+modules it needs (pandas, dlt, rich, ...) when it runs, so quick queries start fast.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LAUNCHER = os.path.join(HERE, '..', 'zoo-data')
+HEAVY_MODULES = ('pandas', 'pyarrow', 'numpy', 'dlt', 'rich', 'requests')
+
+
+def use_folder(name):
+    """Make the scripts in Sensource-API or Zoo-WeatherAPI importable"""
+    path = os.path.join(HERE, '..', name)
+    if path not in sys.path:
+        sys.path.append(path)
+
+
+def fetch_daily(args):
+    use_folder('Sensource-API')
+    from DailyTotal import GateCountFetcher
+    df = GateCountFetcher().get_gate_count()
+    print(f"{len(df)} daily gate rows written")
+
+
+def fetch_ytd(args):
+    use_folder('Sensource-API')
+    from YearToDate import GateCountFetcher
+    df = GateCountFetcher().get_gate_count(incremental=not args.full)
+    print(f"{len(df):,} gate interval rows fetched")
+
+
+def fetch_weather(args):
+    use_folder('Zoo-WeatherAPI')
+    if args.past_week:
+        from PastWeekWeather import load_past_week
+        load_past_week()
+        return
+    from HistoricalWeatherAnalysis import update_realtime_weather
+    update_realtime_weather(rescore=args.rescore)
+
+
+def fetch_forecast(args):
+    use_folder('Zoo-WeatherAPI')
+    from AttendanceForecast import update_attendance_forecast
+    update_attendance_forecast(args.days)
+
+
+def repair(args):
+    use_folder('Sensource-API')
+    from datetime import datetime
+    start, end = (datetime.strptime(d, '%Y-%m-%d').date() if d else None for d in (args.start, args.end))
+    if args.dry_run:
+        from Coverage import print_gaps, store_gaps
+        print_gaps(store_gaps(start, end))
+        return
+    from Backfill import repair as repair_gaps
+    failed = repair_gaps(start, end, include_short=args.include_short)
+    if failed:
+        raise RuntimeError(f"{len(failed)} windows could not be fetched; run it again to retry them")
+
+
+def report(args):
+    if args.dataset == 'ytd':
+        use_folder('Sensource-API')
+        from YTDQuery import query_ytd_data
+        query_ytd_data(output=args.format, output_file=args.output, source=args.source)
+    elif args.dataset == 'daily':
+        use_folder('Sensource-API')
+        from DailyTotalQuery import print_daily_report
+        print_daily_report()
+    elif args.dataset == 'forecast':
+        use_folder('Zoo-WeatherAPI')
+        from TodayWeatherQuery import print_attendance_forecast
+        from ZooStore import connect_store
+        con = connect_store(read_only=True)
+        try:
+            print_attendance_forecast(con)
+        finally:
+            con.close()
+    elif args.dataset == 'runs':
+        from PipelineRuns import print_runs
+        from ZooStore import connect_store
+        con = connect_store(read_only=True)
+        try:
+            print_runs(con, args.pipeline)
+        finally:
+            con.close()
+    else:
+        use_folder('Zoo-WeatherAPI')
+        from TodayWeatherQuery import query_weather
+        query_weather()
+
+
+def export(args):
+    use_folder('Sensource-API')
+    if args.dataset == 'ytd':
+        import YTDQuery as query
+        default_name = 'ytd_gate_data'
+    else:
+        import DailyTotalQuery as query
+        default_name = 'daily_gate_data'
+    if args.format == 'parquet':
+        query.export_to_parquet(args.output or default_name)
+    else:
+        query.export_to_csv(args.output or f"{default_name}.csv")
+
+
+def serve(args):
+    from QueryService import serve as serve_store
+    serve_store(args.host, args.port, args.pool)
+
+
+def time_command(argv, runs):
+    """Wall-clock seconds of each run of `zoo-data argv` in a fresh interpreter, plus the heavy modules it imported"""
+    env = dict(os.environ, ZOO_DATA_REPORT_IMPORTS='1')
+    timings, imported = [], ''
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, LAUNCHER, *argv], env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        timings.append(time.perf_counter() - start)
+        if result.returncode:
+            raise RuntimeError(f"zoo-data {' '.join(argv)} failed:\n{result.stderr}")
+        lines = result.stderr.strip().splitlines()
+        imported = lines[-1].split(':', 1)[1].strip() if lines and lines[-1].startswith('imported:') else ''
+    return timings, imported
+
+
+def bench_startup(args):
+    """Time quick commands end to end, against an empty interpreter and an eager pandas + dlt import"""
+    baselines = {
+        'python (empty)': [sys.executable, '-c', 'pass'],
+        'python -c "import pandas, dlt"': [sys.executable, '-c', 'import pandas, dlt'],
+    }
+    width = max([34] + [len('zoo-data ' + command) for command in args.commands])
+    print(f"{'command':<{width}} {'best ms':>8} {'median ms':>10}  heavy imports")
+    for label, cmd in baselines.items():
+        timings = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            timings.append(time.perf_counter() - start)
+        print(f"{label:<{width}} {min(timings) * 1000:>8.0f} {statistics.median(timings) * 1000:>10.0f}")
+    for command in args.commands:
+        timings, imported = time_command(command.split(), args.runs)
+        print(f"{'zoo-data ' + command:<{width}} {min(timings) * 1000:>8.0f} {statistics.median(timings) * 1000:>10.0f}  {imported or '-'}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='zoo-data', description="Fetch, report on and export the zoo gate and weather data")
+    parser.add_argument('--offline', action='store_true', help="replay API responses from the response cache, never call the APIs")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('fetch-daily', help="fetch today's per-gate totals from Sensource")
+    p.set_defaults(func=fetch_daily)
+
+    p = commands.add_parser('fetch-ytd', help="fetch 15-minute gate counts newer than the stored data")
+    p.add_argument('--full', action='store_true', help="re-fetch the whole year instead")
+    p.set_defaults(func=fetch_ytd)
+
+    p = commands.add_parser('fetch-weather', help="fetch and score the current Tomorrow.io observation")
+    p.add_argument('--rescore', action='store_true', help="recompute every zoo weather score")
+    p.add_argument('--past-week', action='store_true', help="load the past week of hourly weather instead")
+    p.set_defaults(func=fetch_weather)
+
+    p = commands.add_parser('fetch-forecast', help="fetch the hourly weather forecast and forecast attendance for the coming days")
+    p.add_argument('--days', type=int, choices=range(1, 5), default=4, metavar='1-4', help="days ahead (default 4)")
+    p.set_defaults(func=fetch_forecast)
+
+    p = commands.add_parser('repair', help="re-fetch only the days of 15-minute gate counts that are missing or were fetched early")
+    p.add_argument('--start', help="first day to check (YYYY-MM-DD, default: start of the year)")
+    p.add_argument('--end', help="last day to check (YYYY-MM-DD, default: yesterday)")
+    p.add_argument('--include-short', action='store_true', help="also re-fetch days where a sensor returned too few intervals")
+    p.add_argument('--dry-run', action='store_true', help="only list the gaps")
+    p.set_defaults(func=repair)
+
+    p = commands.add_parser('report', help="print a report from the zoo store")
+    p.add_argument('dataset', choices=['ytd', 'daily', 'weather', 'forecast', 'runs'])
+    p.add_argument('--format', choices=['console', 'json', 'arrow'], default='console', help="ytd only")
+    p.add_argument('--output', help="file for json/arrow output (ytd only)")
+    p.add_argument('--source', choices=['hourly', 'raw'], help="table the ytd report scans")
+    p.add_argument('--pipeline', help="only this fetcher's runs (runs only)")
+    p.set_defaults(func=report)
+
+    p = commands.add_parser('export', help="export gate counts to Parquet or CSV")
+    p.add_argument('dataset', choices=['ytd', 'daily'])
+    p.add_argument('--format', choices=['parquet', 'csv'], default='parquet')
+    p.add_argument('--output', help="output directory (parquet) or file (csv)")
+    p.set_defaults(func=export)
+
+    p = commands.add_parser('serve', help="serve the store read-only as JSON (today, ytd, daily, occupancy, weather, forecast)")
+    p.add_argument('--host', default='127.0.0.1', help="interface to listen on (0.0.0.0 for the whole intranet)")
+    p.add_argument('--port', type=int, default=8760)
+    p.add_argument('--pool', type=int, default=4, help="store cursors shared by the request threads")
+    p.set_defaults(func=serve)
+
+    p = commands.add_parser('bench-startup', help="time quick commands in fresh interpreters")
+    p.add_argument('--runs', type=int, default=5)
+    p.add_argument('commands', nargs='*', default=['--help', 'report daily', 'report weather', 'report forecast', 'report ytd', 'report runs'],
+                   help="zoo-data command lines to time")
+    p.set_defaults(func=bench_startup)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.offline:
+        os.environ['ZOO_CACHE'] = 'offline'  # read by ResponseCache when the API clients are created
+    try:
+        args.func(args)
+    except Exception as e:
+        print(f"zoo-data {args.command}: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if os.getenv('ZOO_DATA_REPORT_IMPORTS'):
+            heavy = [name for name in HEAVY_MODULES if name in sys.modules]
+            print(f"imported: {','.join(heavy)}", file=sys.stderr)
+    return 0
@@ -0,0 +1,287 @@
+import argparse
+import logging
+import os
+import re
+import threading
+import time
+
+import duckdb
+
+logger = logging.getLogger("ZooStore")
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+DEFAULT_DB_PATH = os.path.join(REPO_ROOT, 'data', 'zoo.duckdb')
+SCHEMAS = ('gate', 'weather')
+_cursor_lock = threading.Lock()
+
+# Databases used before the unified store: (path, schema in that file, schema in the store, renamed tables).
+# ZooData.duckdb and YTD.data.duckdb both had a GateCount table, so the daily totals become DailyGateCount.
+# The weather files were written to whatever the working directory was, so both likely places are checked.
+LEGACY_DATABASES = [
+    (os.path.join(REPO_ROOT, 'Sensource-API', 'data', 'ZooData.duckdb'), 'main', 'gate', {'GateCount': 'DailyGateCount'}),
+    (os.path.join(REPO_ROOT, 'Sensource-API', 'data', 'YTD.data.duckdb'), 'main', 'gate', {}),
+] + [
+    (os.path.join(folder, f"{name}.duckdb"), 'weather', 'weather', {})
+    for folder in (REPO_ROOT, os.path.join(REPO_ROOT, 'Zoo-WeatherAPI'))
+    for name in ('tomorrow_zoo_weather_realtime', 'tomorrow_zoo_weather_scores', 'tomorrow_zoo_weather')
+]
+
+
+def store_path():
+    """Path of the zoo store: $ZOO_DB_PATH, or data/zoo.duckdb at the top of the repo"""
+    return os.path.abspath(os.getenv('ZOO_DB_PATH') or DEFAULT_DB_PATH)
+
+
+def ensure_store():
+    """Create the store with its schemas on first use, importing the legacy databases; returns its path"""
+    path = store_path()
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        con = connect_file(path)
+        try:
+            logger.info(f"Creating zoo store at {path}")
+            create_schemas(con)
+            migrate_legacy(con)
+        finally:
+            con.close()
+    return path
+
+
+def create_schemas(con):
+    for schema in SCHEMAS:
+        con.execute(f"CREATE SCHEMA IF NOT EXISTS {schema};")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS main.StoreMigrations (
+            Source VARCHAR PRIMARY KEY, Tables INTEGER, Rows BIGINT,
+            MigratedAt TIMESTAMP DEFAULT current_timestamp
+        );
+    """)
+
+
+def data_version(con):
+    """Counter that moves forward whenever something has written to the store (0 before the first one)"""
+    exists = con.execute("""
+        SELECT COUNT(*) FROM duckdb_tables() WHERE schema_name = 'main' AND table_name = 'DataVersion';
+    """).fetchone()[0]
+    if not exists:
+        return 0
+    row = con.execute("SELECT Version FROM main.DataVersion;").fetchone()
+    return row[0] if row else 0
+
+
+def bump_data_version(con):
+    """Move the data version forward; readers such as QueryService drop results cached under older versions"""
+    con.execute("CREATE TABLE IF NOT EXISTS main.DataVersion (Version BIGINT NOT NULL, UpdatedAt TIMESTAMP);")
+    if not con.execute("UPDATE main.DataVersion SET Version = Version + 1, UpdatedAt = current_timestamp;").fetchone()[0]:
+        con.execute("INSERT INTO main.DataVersion VALUES (1, current_timestamp);")
+
+
+def record_changed_days(con, table, days):
+    """Log the days of table (its unqualified name) listed by days, a query of Date values, as changed.
+
+    Each day is stamped with the data version current at the time, so a reader that noted the version
+    can tell which days changed since (see changed_days). Call it in the transaction that writes them.
+    """
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS main.ChangedDays (
+            TableName VARCHAR, Date DATE, Version BIGINT,
+            PRIMARY KEY (TableName, Date)
+        );
+    """)
+    con.execute(f"INSERT OR REPLACE INTO main.ChangedDays SELECT ?, Date, ? FROM ({days});", [table, data_version(con)])
+
+
+def changed_days(con, table, since_version):
+    """Days of table logged as changed at or after since_version, or None if nothing was ever logged for table"""
+    exists = con.execute("""
+        SELECT COUNT(*) FROM duckdb_tables() WHERE schema_name = 'main' AND table_name = 'ChangedDays';
+    """).fetchone()[0]
+    if not exists or not con.execute("SELECT COUNT(*) FROM main.ChangedDays WHERE TableName = ?;", [table]).fetchone()[0]:
+        return None
+    rows = con.execute("SELECT Date FROM main.ChangedDays WHERE TableName = ? AND Version >= ?;", [table, since_version])
+    return {row[0] for row in rows.fetchall()}
+
+
+def migration_count(con):
+    """How many legacy databases have been imported into the store (main.StoreMigrations rows)"""
+    exists = con.execute("""
+        SELECT COUNT(*) FROM duckdb_tables() WHERE schema_name = 'main' AND table_name = 'StoreMigrations';
+    """).fetchone()[0]
+    return con.execute("SELECT COUNT(*) FROM main.StoreMigrations;").fetchone()[0] if exists else 0
+
+
+def use_schema(con, schema):
+    """Make unqualified table names on con resolve to schema ('gate' or 'weather')"""
+    if schema not in SCHEMAS:
+        raise ValueError(f"Unknown zoo store schema: {schema}")
+    con.execute(f"SET schema = '{schema}';")
+    return con
+
+
+def lock_wait_seconds():
+    """How long connect_store waits for another process to release the store ($ZOO_STORE_WAIT, default 30)"""
+    return float(os.getenv('ZOO_STORE_WAIT') or 30)
+
+
+def connect_file(path, read_only=False, wait=None):
+    """duckdb.connect, retrying while another process holds the file lock (one writer or many readers).
+
+    The fetchers only keep the store open for the length of a run, so a report or a fetcher that
+    starts meanwhile waits for it instead of failing. wait overrides lock_wait_seconds.
+    """
+    wait = lock_wait_seconds() if wait is None else wait
+    deadline = time.monotonic() + wait
+    delay = 0.1
+    while True:
+        try:
+            return duckdb.connect(database=path, read_only=read_only)
+        except duckdb.IOException as e:
+            if 'lock' not in str(e).lower() or time.monotonic() >= deadline:
+                raise
+            if delay == 0.1:
+                logger.info(f"{path} is in use by another process; waiting up to {wait:g}s")
+            time.sleep(delay)
+            delay = min(delay * 2, 2.0)
+
+
+def connect_store(schema=None, read_only=False, wait=None):
+    """Open the zoo store; unqualified table names resolve to schema when one is given"""
+    path = ensure_store()
+    try:
+        con = connect_file(path, read_only=read_only, wait=wait)
+    except duckdb.ConnectionException:
+        if not read_only:
+            raise
+        # This process already has the store open for writing (e.g. the ingest scheduler); share that instance
+        con = duckdb.connect(database=path)
+        read_only = False
+    if not read_only:
+        create_schemas(con)
+    return use_schema(con, schema) if schema else con
+
+
+def store_cursor(con):
+    """con.cursor() on the same schema as con (DuckDB cursors start in 'main'); safe to call from worker threads"""
+    with _cursor_lock:  # con itself is shared, and a connection must not run two statements at once
+        cursor = con.cursor()
+        schema = con.execute("SELECT current_schema();").fetchone()[0]
+    cursor.execute(f"SET schema = '{schema}';")
+    return cursor
+
+
+def rollback(con):
+    """ROLLBACK that tolerates a transaction DuckDB already ended (a COMMIT that failed on a conflict)"""
+    try:
+        con.execute("ROLLBACK;")
+    except duckdb.TransactionException:
+        pass
+
+
+def check_staging(con, table, columns, key, expected_rows=None):
+    """Check a staged table before it is swapped in: columns and types, a unique non-null key and the row count.
+
+    columns is [(name, type)] as DESCRIBE reports them and key a list of column names; raises ValueError.
+    """
+    actual = [(row[0], row[1]) for row in con.execute(f"DESCRIBE {table};").fetchall()]
+    if actual != list(columns):
+        raise ValueError(f"{table} has columns {actual}, expected {list(columns)}")
+    key_list = ', '.join(key)
+    rows, bad_keys, duplicates = con.execute(f"""
+        SELECT
+            COUNT(*),
+            COUNT(*) FILTER (WHERE {' OR '.join(f'{k} IS NULL' for k in key)}),
+            COUNT(*) - COUNT(DISTINCT ({key_list}))
+        FROM {table};
+    """).fetchone()
+    if bad_keys:
+        raise ValueError(f"{table} has {bad_keys:,} rows with a NULL in ({key_list})")
+    if duplicates:
+        raise ValueError(f"{table} has {duplicates:,} duplicate ({key_list}) rows")
+    if expected_rows is not None and rows != expected_rows:
+        raise ValueError(f"{table} has {rows:,} rows, expected {expected_rows:,}")
+    return rows
+
+
+def format_rows(columns, rows):
+    """Render query results as right-aligned text columns (like DataFrame.to_string(index=False))"""
+    cells = [[str(c) for c in columns]] + [['NULL' if v is None else str(v) for v in row] for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(columns))]
+    for i in range(len(columns)):  # pandas leaves an extra space before numeric columns
+        values = [row[i] for row in rows if row[i] is not None]
+        if values and all(isinstance(v, (int, float)) for v in values):
+            widths[i] += 1
+    return "\n".join(" ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in cells)
+
+
+def print_query(con, sql, params=None):
+    """Run sql and print the result as a text table without going through pandas; returns the rows"""
+    result = con.execute(sql, params or [])
+    rows = result.fetchall()
+    print(format_rows([d[0] for d in result.description], rows))
+    return rows
+
+
+def migrate_legacy(con):
+    """Copy every table of the legacy databases into the store, keeping primary keys.
+
+    Each legacy file is imported once (recorded in main.StoreMigrations); keyed tables that come from
+    more than one file, such as SensorGate, are merged with INSERT OR IGNORE.
+    """
+    create_schemas(con)
+    done = {row[0] for row in con.execute("SELECT Source FROM main.StoreMigrations;").fetchall()}
+    migrated = 0
+    for path, source_schema, target_schema, renames in LEGACY_DATABASES:
+        path = os.path.abspath(path)
+        if path in done or not os.path.exists(path) or path == store_path():
+            continue
+        con.execute(f"ATTACH '{path}' AS legacy (READ_ONLY);")
+        try:
+            con.execute("BEGIN TRANSACTION;")
+            tables = con.execute("""
+                SELECT t.table_name, t.sql, COUNT(c.constraint_type) > 0 AS keyed
+                FROM duckdb_tables() t
+                LEFT JOIN duckdb_constraints() c
+                  ON c.database_name = t.database_name AND c.schema_name = t.schema_name
+                 AND c.table_name = t.table_name AND c.constraint_type = 'PRIMARY KEY'
+                WHERE t.database_name = 'legacy' AND t.schema_name = ?
+                GROUP BY ALL;
+            """, [source_schema]).fetchall()
+            rows = 0
+            for name, sql, keyed in tables:
+                target = f'{target_schema}."{renames.get(name, name)}"'
+                con.execute(re.sub(r'^CREATE TABLE [^(]+\(', f'CREATE TABLE IF NOT EXISTS {target}(', sql))
+                rows += con.execute(f"""
+                    INSERT {'OR IGNORE ' if keyed else ''}INTO {target} BY NAME
+                    SELECT * FROM legacy.{source_schema}."{name}";
+                """).fetchone()[0]
+            con.execute("INSERT INTO main.StoreMigrations (Source, Tables, Rows) VALUES (?, ?, ?);", [path, len(tables), rows])
+            bump_data_version(con)
+            con.execute("COMMIT;")
+            logger.info(f"Imported {len(tables)} tables ({rows:,} rows) from {path} into {target_schema}")
+            migrated += 1
+        except Exception:
+            con.execute("ROLLBACK;")
+            raise
+        finally:
+            con.execute("DETACH legacy;")
+    return migrated
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description="Create the zoo store and import the legacy DuckDB files into it")
+    parser.add_argument('--migrate', action='store_true', help="import legacy databases that have not been imported yet")
+    args = parser.parse_args()
+
+    con = connect_store()
+    try:
+        if args.migrate:
+            print(f"Imported {migrate_legacy(con)} legacy databases")
+        print(f"Zoo store: {store_path()}")
+        for schema, table, rows in con.execute("""
+            SELECT schema_name, table_name, estimated_size FROM duckdb_tables()
+            WHERE NOT temporary ORDER BY ALL;
+        """).fetchall():
+            print(f"  {schema}.{table}: ~{rows:,} rows")
+    finally:
+        con.close()
@@ -0,0 +1,324 @@
+"""Day-ahead attendance forecast from Tomorrow.io hourly forecasts.
+
+Each run fetches the hourly forecast (/v4/timelines), scores every forecast hour in one NumPy batch
+(ZooWeatherScore.score_weather) into weather.weather_forecast, fits a small least-squares model of daily
+attendance (ingress through all gates) on the stored history and writes one row per upcoming day to
+weather.attendance_forecast, which reports read as is.
+
+The model predicts log attendance from the day of the week, the time of year and, once enough days have
+both gate counts and weather, the average zoo weather score and the share of rainy readings during opening
+hours. Observed weather (weather_realtime) is used for past days, falling back to the last forecast stored
+for the day. With too little weather history the weather terms are left out ('calendar' model).
+"""
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from dotenv import load_dotenv
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from ApiClient import get_client
+from ZooStore import connect_store
+from ZooWeatherScore import rate_scores, score_weather
+from PipelineRuns import PipelineRun
+from TodayWeatherQuery import print_attendance_forecast
+
+load_dotenv()
+
+API_KEY = os.getenv('API_KEY')
+LOCATION = "38.6355,-90.2905"
+
+FORECAST_DAYS = 4  # hourly forecasts reach 120 hours ahead
+OPEN_HOURS = (9, 17)  # local hours whose weather counts towards a day
+MIN_HISTORY_DAYS = 14  # days of gate counts needed for any forecast
+MIN_WEATHER_DAYS = 28  # days with gate counts and weather needed before weather enters the model
+RIDGE = 1.0  # shrinks the coefficients a little so a short history does not overfit
+INTERVAL_Z = 1.2816  # low/high bound an 80% prediction interval
+
+# (Tomorrow.io field, weather_forecast column)
+FORECAST_FIELDS = [
+    ('temperature', 'temperature'),
+    ('temperatureApparent', 'temperature_apparent'),
+    ('humidity', 'humidity'),
+    ('precipitationProbability', 'precipitation_probability'),
+    ('rainIntensity', 'rain_intensity'),
+    ('windSpeed', 'wind_speed'),
+    ('cloudCover', 'cloud_cover'),
+    ('uvIndex', 'uv_index'),
+    ('weatherCode', 'weather_code'),
+]
+
+FORECAST_DDL = """
+    CREATE TABLE IF NOT EXISTS weather.weather_forecast (
+        time TIMESTAMP WITH TIME ZONE, location VARCHAR,
+        temperature DOUBLE, temperature_apparent DOUBLE, humidity DOUBLE, precipitation_probability DOUBLE,
+        rain_intensity DOUBLE, wind_speed DOUBLE, cloud_cover DOUBLE, uv_index DOUBLE, weather_code INTEGER,
+        zoo_weather_score DOUBLE, condition_rating VARCHAR, fetched_at TIMESTAMP WITH TIME ZONE,
+        PRIMARY KEY (time, location)
+    );
+    CREATE TABLE IF NOT EXISTS weather.attendance_forecast (
+        forecast_date DATE PRIMARY KEY,
+        expected_visitors INTEGER, low_visitors INTEGER, high_visitors INTEGER,
+        zoo_weather_score DOUBLE, condition_rating VARCHAR, max_temperature DOUBLE, rain_share DOUBLE,
+        forecast_hours INTEGER, model VARCHAR, training_days INTEGER, generated_at TIMESTAMP
+    );
+"""
+
+# Hourly weather with its zoo score: observations, and the latest forecast made for each hour
+OBSERVED_HOURS = """
+    SELECT r.time, r.values__temperature AS temperature, r.values__rain_intensity AS rain_intensity,
+           s.zoo_weather_score
+    FROM weather.weather_realtime r
+    JOIN weather.zoo_weather_scores s ON s.time = r.time AND s.location IS NOT DISTINCT FROM r.location
+"""
+FORECAST_HOURS = f"""
+    SELECT time, temperature, rain_intensity, zoo_weather_score
+    FROM weather.weather_forecast
+    WHERE location = '{LOCATION}'
+"""
+
+# One row per local day: the weather during opening hours
+DAILY_WEATHER = """
+    SELECT
+        CAST(timezone('America/Chicago', time) AS DATE) AS day,
+        AVG(zoo_weather_score) AS zoo_weather_score,
+        MAX(temperature) AS max_temperature,
+        AVG(CASE WHEN rain_intensity > 0 THEN 1.0 ELSE 0.0 END) AS rain_share,
+        COUNT(*) AS readings
+    FROM ({hours}) h
+    WHERE hour(timezone('America/Chicago', time)) >= {open_hour}
+      AND hour(timezone('America/Chicago', time)) < {close_hour}
+    GROUP BY day
+"""
+
+
+def daily_weather(hours):
+    return DAILY_WEATHER.format(hours=hours, open_hour=OPEN_HOURS[0], close_hour=OPEN_HOURS[1])
+
+
+def fetch_forecast(days=FORECAST_DAYS):
+    """Hourly forecast intervals ({'startTime', 'values'}) from now to the end of the forecast window"""
+    params = {
+        "location": LOCATION,
+        "fields": [field for field, _ in FORECAST_FIELDS],
+        "timesteps": ["1h"],
+        "startTime": "now",
+        "endTime": f"nowPlus{min(days + 1, 5)}d",
+        "units": "imperial",
+        "timezone": "America/Chicago"
+    }
+    headers = {
+        "content-type": "application/json",
+        "apikey": f'{API_KEY}'
+    }
+    # Forecasts change every hour, so the response is only reused for the cache TTL
+    today = datetime.now().date()
+    response = get_client('tomorrow').post(
+        "/v4/timelines", json=params, headers=headers, validate=lambda r: 'data' in r.json(),
+        window=(today, today + timedelta(days=days)),
+    )
+    timelines = response.json()['data'].get('timelines') or []
+    return [interval for timeline in timelines if timeline.get('timestep', '1h') == '1h'
+            for interval in timeline.get('intervals', [])]
+
+
+def score_forecast(intervals):
+    """Columns of weather_forecast for the intervals, scored in one vectorised batch"""
+    columns = {
+        'time': [datetime.fromisoformat(i['startTime'].replace('Z', '+00:00')) for i in intervals],
+        'location': [LOCATION] * len(intervals),
+    }
+    for field, column in FORECAST_FIELDS:
+        columns[column] = np.array(
+            [np.nan if i['values'].get(field) is None else i['values'][field] for i in intervals], dtype=np.float64
+        )
+    columns['zoo_weather_score'], columns['condition_rating'] = score_weather(
+        columns['temperature'], columns['humidity'], columns['rain_intensity'],
+        columns['wind_speed'], columns['cloud_cover'], columns['uv_index'],
+    )
+    columns['fetched_at'] = [datetime.now(timezone.utc)] * len(intervals)
+    return columns
+
+
+def write_forecast_hours(con, columns):
+    """Upsert the scored forecast hours into weather.weather_forecast; returns the number of hours"""
+    import pandas as pd
+
+    hours = pd.DataFrame(columns)
+    con.register('forecast_hours', hours)
+    try:
+        con.execute("INSERT OR REPLACE INTO weather.weather_forecast BY NAME SELECT * FROM forecast_hours;")
+    finally:
+        con.unregister('forecast_hours')
+    return len(hours)
+
+
+def table_exists(con, schema, table):
+    return con.execute("""
+        SELECT COUNT(*) FROM duckdb_tables() WHERE NOT temporary AND schema_name = ? AND table_name = ?;
+    """, [schema, table]).fetchone()[0] > 0
+
+
+def training_data(con, today):
+    """(days, visitors, weather) for every closed day with gate counts; weather is (score, rain share), NaN if unknown"""
+    if not table_exists(con, 'gate', 'GateCountDaily'):
+        return [], np.array([]), np.empty((0, 2))
+    observed = daily_weather(OBSERVED_HOURS) if table_exists(con, 'weather', 'weather_realtime') \
+        and table_exists(con, 'weather', 'zoo_weather_scores') else None
+    sources = [f"({observed})"] if observed else []
+    sources.append(f"({daily_weather(FORECAST_HOURS)})")
+    # Observed weather wins over a forecast for the same day
+    weather = " UNION ALL ".join(f"SELECT *, {rank} AS source FROM {sql}" for rank, sql in enumerate(sources))
+    rows = con.execute(f"""
+        WITH visits AS (
+            SELECT Date AS day, SUM(Ingress) AS visitors
+            FROM gate.GateCountDaily
+            WHERE Date < ?
+            GROUP BY Date
+            HAVING SUM(Ingress) > 0
+        ),
+        weather AS (
+            SELECT day, arg_min(zoo_weather_score, source) AS zoo_weather_score,
+                   arg_min(rain_share, source) AS rain_share
+            FROM ({weather})
+            GROUP BY day
+        )
+        SELECT v.day, v.visitors, w.zoo_weather_score, w.rain_share
+        FROM visits v
+        LEFT JOIN weather w USING (day)
+        ORDER BY v.day;
+    """, [today]).fetchall()
+    days = [row[0] for row in rows]
+    visitors = np.array([row[1] for row in rows], dtype=np.float64)
+    weather = np.array([[np.nan if v is None else v for v in row[2:]] for row in rows], dtype=np.float64).reshape(-1, 2)
+    return days, visitors, weather
+
+
+def design(days, weather=None):
+    """Model inputs: intercept, Monday..Saturday indicators, time of year and optionally the weather"""
+    weekday = np.array([d.weekday() for d in days])
+    season = 2 * np.pi * np.array([d.timetuple().tm_yday for d in days]) / 365.25
+    columns = [np.ones(len(days))] + [(weekday == i).astype(np.float64) for i in range(6)]
+    columns += [np.sin(season), np.cos(season)]
+    if weather is not None:
+        score = weather[:, 0] / 100
+        columns += [score, score ** 2, weather[:, 1]]
+    return np.column_stack(columns)
+
+
+class AttendanceModel:
+    """Least-squares fit of log attendance; predict() returns expected, low and high visitor counts"""
+
+    def __init__(self, kind, coef, sigma, training_days):
+        self.kind = kind
+        self.coef = coef
+        self.sigma = sigma
+        self.training_days = training_days
+
+    def predict(self, days, weather):
+        x = design(days, weather if self.kind == 'weather' else None)
+        mean = x @ self.coef
+        return np.expm1(mean), np.expm1(mean - INTERVAL_Z * self.sigma), np.expm1(mean + INTERVAL_Z * self.sigma)
+
+
+def fit_model(days, visitors, weather):
+    """Fit the weather model if there is enough weather history, else the calendar model"""
+    if len(days) < MIN_HISTORY_DAYS:
+        raise ValueError(f"Need at least {MIN_HISTORY_DAYS} days of gate counts to forecast attendance, have {len(days)}")
+    known = ~np.isnan(weather).any(axis=1)
+    if known.sum() >= MIN_WEATHER_DAYS:
+        kind = 'weather'
+        days = [d for d, k in zip(days, known) if k]
+        x, y = design(days, weather[known]), np.log1p(visitors[known])
+    else:
+        kind = 'calendar'
+        x, y = design(days), np.log1p(visitors)
+    # Ridge penalty as extra rows of the least-squares problem; the intercept is not shrunk
+    penalty = np.sqrt(RIDGE) * np.eye(x.shape[1])[1:]
+    coef = np.linalg.lstsq(np.vstack([x, penalty]), np.concatenate([y, np.zeros(len(penalty))]), rcond=None)[0]
+    residuals = y - x @ coef
+    sigma = float(np.sqrt(residuals @ residuals / max(1, len(y) - x.shape[1])))
+    return AttendanceModel(kind, coef, sigma, len(y))
+
+
+def upcoming_weather(con, first_day, last_day):
+    """Daily forecast weather for first_day..last_day, for days the forecast covers for at least half the opening hours"""
+    rows = con.execute(f"""
+        SELECT day, zoo_weather_score, rain_share, max_temperature, readings
+        FROM ({daily_weather(FORECAST_HOURS)})
+        WHERE day BETWEEN ? AND ? AND readings >= ?
+        ORDER BY day;
+    """, [first_day, last_day, (OPEN_HOURS[1] - OPEN_HOURS[0]) / 2]).fetchall()
+    return rows
+
+
+def write_attendance_forecast(con, model, rows):
+    """Upsert one weather.attendance_forecast row per forecast day; returns the number of days"""
+    if not rows:
+        return 0
+    days = [row[0] for row in rows]
+    weather = np.array([row[1:3] for row in rows], dtype=np.float64)
+    expected, low, high = model.predict(days, weather)
+    ratings = rate_scores(weather[:, 0])
+    generated_at = datetime.now()
+    con.executemany("""
+        INSERT OR REPLACE INTO weather.attendance_forecast VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+    """, [
+        (day, round(e), round(lo), round(hi), round(score, 1), str(rating), max_temperature, rain_share,
+         readings, model.kind, model.training_days, generated_at)
+        for (day, score, rain_share, max_temperature, readings), e, lo, hi, rating
+        in zip(rows, expected, low, high, ratings)
+    ])
+    return len(rows)
+
+
+def update_attendance_forecast(days=FORECAST_DAYS):
+    """Fetch and score the hourly forecast, refit the attendance model and rewrite the upcoming days.
+
+    Returns the number of days forecast.
+    """
+    if not API_KEY:
+        raise ValueError("API Key not found")
+    today = datetime.now().date()
+    with PipelineRun('attendance_forecast') as run:
+        with run.stage('fetch') as counts:
+            intervals = fetch_forecast(days)
+            counts.rows = len(intervals)
+        with run.stage('score') as counts:
+            columns = score_forecast(intervals)
+            counts.rows = len(intervals)
+
+        con = connect_store('weather')
+        try:
+            con.execute(FORECAST_DDL)
+            with run.stage('store_hours') as counts:
+                counts.rows = write_forecast_hours(con, columns)
+            with run.stage('fit') as counts:
+                history = training_data(con, today)
+                model = fit_model(*history)
+                counts.rows = model.training_days
+            with run.stage('write') as counts:
+                upcoming = upcoming_weather(con, today + timedelta(days=1), today + timedelta(days=days))
+                counts.rows = run.rows = written = write_attendance_forecast(con, model, upcoming)
+        finally:
+            con.close()
+    print(f"Attendance forecast for {written} days ({model.kind} model, {model.training_days} training days, "
+          f"{len(intervals)} forecast hours)")
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Forecast attendance for the coming days from the Tomorrow.io hourly forecast")
+    parser.add_argument('--days', type=int, default=FORECAST_DAYS, help="days ahead to forecast (at most 4)")
+    parser.add_argument('--show', action='store_true', help="only print the stored forecast")
+    args = parser.parse_args()
+
+    if not args.show:
+        update_attendance_forecast(min(args.days, FORECAST_DAYS))
+    con = connect_store(read_only=True)
+    try:
+        print_attendance_forecast(con)
+    finally:
+        con.close()
@@ -1,11 +1,15 @@
 # This API call does not work with basic API key, should work with pro plan(?).
 #===========================================================================#
 import dlt
-from dlt.sources.helpers import requests
 from datetime import datetime, timedelta, timezone
 import os
+import sys
 from dotenv import load_dotenv
-import duckdb
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from ApiClient import get_client
+from ZooStore import ensure_store
+from PipelineRuns import PipelineRun
 
 load_dotenv()
 
@@ -13,10 +17,6 @@ API_KEY = os.getenv('API_KEY')
 LOCATION = "38.6355,-90.2905"
 
 
-if not API_KEY:
-    raise ValueError("API Key not found")
-
-
 @dlt.resource(
     write_disposition="replace",
     primary_key="time"
@@ -24,7 +24,7 @@ if not API_KEY:
 
 def weather_history():
     """Fetch past 7 days of weather data from Tomorrow.io"""
-    url = "https://api.tomorrow.io/v4/timelines"
+    url = "/v4/timelines"
 
     end_time = datetime.now(timezone.utc)
     start_time = end_time - timedelta(days=7)
@@ -49,8 +49,7 @@ def weather_history():
         "apikey": f'{API_KEY}'
     }
 
-    response = requests.post(url, json=params, headers=headers)
-    response.raise_for_status()
+    response = get_client('tomorrow').post(url, json=params, headers=headers, validate=lambda r: 'data' in r.json())
     data = response.json()
 
     print(f"Response keys: {data.keys()}")
@@ -58,7 +57,7 @@ def weather_history():
     print(f"Start time: {start_time.isoformat()}")
     print(f"End time: {end_time.isoformat()}")
 
-    if 'data' in data and 'timelines' in data:
+    if 'data' in data and 'timelines' in data['data']:
         timelines = data['data']['timelines']
         print(f"Number of timelines: {len(timelines)}")
 
@@ -83,20 +82,29 @@ def weather_history():
         print("Unexpected response structure:, {data}")
 
 
-pipeline = dlt.pipeline(
-    pipeline_name="tomorrow_zoo_weather",
-    destination="duckdb",
-    dataset_name="weather",
-    dev_mode=False, 
-)
+def load_past_week():
+    """Load the past week of hourly weather into weather.weather_history in the zoo store"""
+    if not API_KEY:
+        raise ValueError("API Key not found")
+    pipeline = dlt.pipeline(
+        pipeline_name="tomorrow_zoo_weather",
+        destination=dlt.destinations.duckdb(ensure_store()),
+        dataset_name="weather",
+        dev_mode=False, 
+    )
+    # The request is made inside the dlt resource, so fetching is part of the load stage here
+    with PipelineRun('weather_past_week') as run:
+        with run.stage('dlt_load'):
+            info = pipeline.run(weather_history(), table_name='weather_history')
+    print(f"Loaded history: {info}")
+   
+    print(f"\nData loaded to: {pipeline.dataset_name}")
+    print(f"Database location: {ensure_store()}")
+    return info
 
 if __name__ == "__main__":
     try:
-        info = pipeline.run(weather_history(), table_name='weather_history')
-        print(f"Loaded history: {info}")
-       
-        print(f"\nData loaded to: {pipeline.dataset_name}")
-        print(f"Database location: {pipeline.pipeline_name}.duckdb")
+        load_past_week()
 
     except Exception as e:
         print(f"Error occurred: {e}")
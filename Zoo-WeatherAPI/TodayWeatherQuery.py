@@ -1,69 +1,92 @@
-import duckdb
-import pandas as pd
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from ZooStore import connect_store, print_query
 
 def query_weather():
-    """Query both weather databases and display results"""
-    
-    # Query realtime weather data
-    con_realtime = duckdb.connect('tomorrow_zoo_weather_realtime.duckdb', read_only=True)
-    
-    print("=" * 70)
-    print("Latest Weather Data (Realtime)")
-    print("=" * 70)
-    
-    df_realtime = con_realtime.execute("""
-        SELECT
-            time,
-            location,
-            values__temperature as temp_f,
-            values__temperature_apparent as feels_like,
-            values__humidity as humidity,
-            values__wind_speed as wind_speed,
-            values__weather_code as weather_code,
-            values__precipitation_probability as precip_chance
-        FROM weather.weather_realtime
-        ORDER BY time DESC
-        LIMIT 10
-    """).fetchdf()
-    
-    print(df_realtime.to_string())
-    print()
-    
-    con_realtime.close()
-    
-    # Query zoo weather scores
-    con_scores = duckdb.connect('tomorrow_zoo_weather_scores.duckdb', read_only=True)
-    
-    print("=" * 70)
-    print("Zoo Weather Scores")
-    print("=" * 70)
+    """Query the weather schema of the zoo store and display results"""
     
-    df_scores = con_scores.execute("""
-        SELECT
-            time,
-            location,
-            zoo_weather_score,
-            condition_rating
-        FROM weather.zoo_weather_scores
-        ORDER BY time DESC
-        LIMIT 10
-    """).fetchdf()
-    
-    print(df_scores.to_string())
-    print()
-    
-    con_scores.close()
+    con = connect_store('weather', read_only=True)
+    try:
+        # Query realtime weather data
+
+        print("=" * 70)
+        print("Latest Weather Data (Realtime)")
+        print("=" * 70)
+
+        realtime = print_query(con, """
+            SELECT
+                time,
+                location,
+                values__temperature as temp_f,
+                values__temperature_apparent as feels_like,
+                values__humidity as humidity,
+                values__wind_speed as wind_speed,
+                values__weather_code as weather_code,
+                values__precipitation_probability as precip_chance
+            FROM weather.weather_realtime
+            ORDER BY time DESC
+            LIMIT 10
+        """)
+        print()
+
+        # Query zoo weather scores
+
+        print("=" * 70)
+        print("Zoo Weather Scores")
+        print("=" * 70)
+
+        scores = print_query(con, """
+            SELECT
+                time,
+                location,
+                zoo_weather_score,
+                condition_rating
+            FROM weather.zoo_weather_scores
+            ORDER BY time DESC
+            LIMIT 10
+        """)
+        print()
+    finally:
+        con.close()
     
     # Display summary
     print("=" * 70)
     print("Summary")
     print("=" * 70)
-    print(f"Realtime records: {len(df_realtime)}")
-    print(f"Score records: {len(df_scores)}")
+    print(f"Realtime records: {len(realtime)}")
+    print(f"Score records: {len(scores)}")
     
-    if not df_scores.empty:
-        print(f"Current zoo weather score: {df_scores.iloc[0]['zoo_weather_score']}")
-        print(f"Current condition rating: {df_scores.iloc[0]['condition_rating']}")
+    if scores:
+        print(f"Current zoo weather score: {scores[0][2]}")
+        print(f"Current condition rating: {scores[0][3]}")
+
+def print_attendance_forecast(con):
+    """Print the upcoming days of weather.attendance_forecast (written by AttendanceForecast.py)"""
+    exists = con.execute("""
+        SELECT COUNT(*) FROM duckdb_tables()
+        WHERE schema_name = 'weather' AND table_name = 'attendance_forecast';
+    """).fetchone()[0]
+    if not exists:
+        print("No attendance forecast yet; run AttendanceForecast.py")
+        return []
+    return print_query(con, """
+        SELECT
+            forecast_date,
+            strftime(forecast_date, '%a') AS day,
+            expected_visitors,
+            low_visitors || '-' || high_visitors AS likely_range,
+            zoo_weather_score,
+            condition_rating,
+            round(max_temperature) AS max_temp_f,
+            round(rain_share * 100) AS rain_pct,
+            model,
+            strftime(generated_at, '%Y-%m-%d %H:%M') AS generated
+        FROM weather.attendance_forecast
+        WHERE forecast_date >= current_date
+        ORDER BY forecast_date;
+    """)
 
 if __name__ == "__main__":
     query_weather()
\ No newline at end of file
@@ -0,0 +1,467 @@
+"""Zoo weather score engine.
+
+The same scoring rules in two forms that must agree row for row:
+  * score_weather()  - NumPy, vectorised over arrays (forecasts, historical backfills, ...)
+  * install_macros() - DuckDB macros, so SQL computes the total once per row
+
+Inputs follow the Tomorrow.io realtime fields: temperature (F), humidity (%), rain intensity (in/hr),
+wind speed (mph), cloud cover (%) and UV index. Missing values are NaN in NumPy and NULL in SQL and
+are treated the same way by both (see the COALESCE()/np.nan_to_num() calls).
+
+Run `python ZooWeatherScore.py --check` to compare the two implementations on random and edge-case inputs,
+check both against a fixed set of pinned scores and check that score_new_observations() leaves scored rows alone.
+"""
+import argparse
+
+import numpy as np
+
+# (minimum clamped score, rating), checked top to bottom
+RATINGS = [
+    (95, 'Perfect'),
+    (90, 'Outstanding'),
+    (85, 'Excellent'),
+    (80, 'Very Good'),
+    (75, 'Good'),
+    (70, 'Pleasant'),
+    (65, 'Acceptable'),
+    (60, 'Fair'),
+    (55, 'Tolerable'),
+    (50, 'Mediocre'),
+    (45, 'Subpar'),
+    (40, 'Poor'),
+    (35, 'Bad'),
+    (30, 'Very Bad'),
+    (25, 'Unpleasant'),
+    (20, 'Miserable'),
+    (15, 'Severe'),
+    (10, 'Extreme'),
+]
+LOWEST_RATING = 'Dangerous'
+
+SCORE_MACROS = """
+CREATE OR REPLACE MACRO zoo_weather_total(temp, humidity, rain, wind, cloud, uv) AS (
+    100.0
+
+    -- MORE PUNISHING TEMPERATURE PENALTIES
+    + CASE
+        WHEN temp < 20 THEN -80
+        WHEN temp < 32 THEN -70
+        WHEN temp < 40 THEN -55
+        WHEN temp < 50 THEN (50 - temp) * -4.0
+        WHEN temp < 60 THEN (60 - temp) * -2.5
+        WHEN temp BETWEEN 60 AND 72 THEN 0
+        WHEN temp <= 78 THEN (temp - 72) * -1.5
+        WHEN temp <= 85 THEN -9 + (temp - 78) * -3.0
+        WHEN temp <= 92 THEN -30 + (temp - 85) * -4.5
+        WHEN temp <= 100 THEN -61.5 + (temp - 92) * -5.5
+        ELSE -105.5 + (temp - 100) * -7.0
+      END
+
+    -- MORE PUNISHING HUMIDITY PENALTIES
+    + CASE
+        WHEN temp > 90 AND humidity > 80 THEN -30
+        WHEN temp > 90 AND humidity > 70 THEN -22
+        WHEN temp > 90 AND humidity > 60 THEN -15
+        WHEN temp > 80 AND humidity > 80 THEN -25
+        WHEN temp > 80 AND humidity > 70 THEN -18
+        WHEN temp > 80 AND humidity > 60 THEN -12
+        WHEN temp < 40 AND humidity > 80 THEN -15
+        WHEN temp < 40 AND humidity > 70 THEN -10
+        WHEN temp < 50 AND humidity > 70 THEN -8
+        WHEN humidity < 15 THEN -12
+        WHEN humidity < 20 THEN -10
+        WHEN humidity < 30 THEN -6
+        ELSE 0
+      END
+
+    -- MORE PUNISHING PRECIPITATION PENALTIES
+    + CASE
+        WHEN COALESCE(rain, 0) = 0 THEN 0
+        WHEN rain < 0.25 THEN -12
+        WHEN rain < 0.5 THEN -18
+        WHEN rain < 1.0 THEN -28
+        WHEN rain < 1.5 THEN -38
+        WHEN rain < 3 THEN -50
+        WHEN rain < 6 THEN -65
+        WHEN rain < 10 THEN -80
+        ELSE -100
+      END
+
+    -- MORE PUNISHING WIND PENALTIES
+    + CASE
+        WHEN temp < 40 AND COALESCE(wind, 0) > 25 THEN -30
+        WHEN temp < 40 AND wind > 20 THEN -24
+        WHEN temp < 40 AND wind > 15 THEN -18
+        WHEN temp < 40 AND wind > 10 THEN -12
+        WHEN temp < 40 AND wind > 5 THEN -8
+        WHEN temp < 50 AND wind > 20 THEN -22
+        WHEN temp < 50 AND wind > 15 THEN -16
+        WHEN temp < 50 AND wind > 10 THEN -10
+        WHEN temp < 50 AND wind > 5 THEN -6
+        WHEN temp < 65 AND wind > 20 THEN -14
+        WHEN temp < 65 AND wind > 15 THEN -10
+        WHEN temp < 65 AND wind > 10 THEN -6
+        WHEN temp > 85 AND wind > 15 THEN 10
+        WHEN temp > 85 AND wind > 10 THEN 8
+        WHEN temp > 85 AND wind > 5 THEN 5
+        WHEN temp > 85 AND wind <= 5 THEN -8
+        WHEN temp > 78 AND wind > 15 THEN 6
+        WHEN temp > 78 AND wind > 10 THEN 5
+        WHEN temp > 78 AND wind > 5 THEN 3
+        ELSE 0
+      END
+
+    -- MUCH MORE PUNISHING EXTREME WIND PENALTIES
+    + CASE
+        WHEN COALESCE(wind, 0) > 40 THEN -50
+        WHEN wind > 35 THEN -35
+        WHEN wind > 30 THEN -25
+        WHEN wind > 25 THEN -15
+        ELSE 0
+      END
+
+    -- MORE PUNISHING CLOUD COVER PENALTIES
+    + CASE
+        WHEN COALESCE(cloud, 0) < 10 AND temp > 85 THEN -18
+        WHEN cloud < 10 AND temp > 75 THEN -15
+        WHEN cloud < 10 AND temp > 65 THEN -8
+        WHEN cloud < 10 THEN 0
+        WHEN cloud BETWEEN 10 AND 29 THEN 2
+        WHEN cloud BETWEEN 30 AND 69 THEN 3
+        WHEN cloud BETWEEN 70 AND 84 THEN -6
+        WHEN cloud BETWEEN 85 AND 94 THEN -15
+        ELSE -25
+      END
+
+    -- MORE PUNISHING UV INDEX PENALTIES
+    + CASE
+        WHEN COALESCE(uv, 0) >= 11 THEN -25
+        WHEN uv >= 9 THEN -18
+        WHEN uv >= 7 THEN -12
+        WHEN uv >= 5 THEN -6
+        WHEN uv >= 3 THEN -2
+        ELSE 0
+      END
+
+    -- BONUSES (kept the same)
+    + CASE
+        WHEN temp BETWEEN 62 AND 70
+          AND humidity BETWEEN 40 AND 60
+          AND COALESCE(rain, 0) = 0
+        THEN 5
+        ELSE 0
+      END
+    + CASE
+        WHEN COALESCE(cloud, 0) BETWEEN 30 AND 60
+          AND COALESCE(rain, 0) = 0
+        THEN 3
+        ELSE 0
+      END
+    + CASE
+        WHEN temp BETWEEN 55 AND 65
+          AND COALESCE(wind, 0) < 8
+          AND COALESCE(rain, 0) = 0
+        THEN 2
+        ELSE 0
+      END
+);
+
+CREATE OR REPLACE MACRO zoo_weather_score(total) AS GREATEST(1, LEAST(100, ROUND(total, 1)));
+
+CREATE OR REPLACE MACRO zoo_weather_rating(total) AS CASE
+{rating_cases}
+    ELSE '{lowest}'
+END;
+"""
+
+# Columns of the dlt weather_realtime table fed into zoo_weather_total()
+REALTIME_COLUMNS = (
+    "values__temperature, values__humidity, values__rain_intensity, "
+    "values__wind_speed, values__cloud_cover, values__uv_index"
+)
+
+SCORES_DDL = """
+    CREATE TABLE IF NOT EXISTS {target} (
+        time TIMESTAMP WITH TIME ZONE,
+        location VARCHAR,
+        zoo_weather_score DOUBLE,
+        condition_rating VARCHAR
+    );
+"""
+
+
+def install_macros(con):
+    """Create (or replace) the zoo_weather_total/score/rating macros on a DuckDB connection"""
+    rating_cases = "\n".join(
+        f"    WHEN GREATEST(1, LEAST(100, total)) >= {threshold} THEN '{rating}'" for threshold, rating in RATINGS
+    )
+    con.execute(SCORE_MACROS.format(rating_cases=rating_cases, lowest=LOWEST_RATING))
+
+
+def _between(x, low, high):
+    return (x >= low) & (x <= high)
+
+
+def score_total(temp, humidity, rain, wind, cloud, uv):
+    """Unclamped weather score for arrays of observations (NaN = missing)"""
+    temp, humidity, rain, wind, cloud, uv = (
+        np.asarray(v, dtype=np.float64) for v in (temp, humidity, rain, wind, cloud, uv)
+    )
+    rain0, wind0, cloud0, uv0 = (np.nan_to_num(v, nan=0.0) for v in (rain, wind, cloud, uv))
+
+    temp_penalty = np.select(
+        [temp < 20, temp < 32, temp < 40, temp < 50, temp < 60, _between(temp, 60, 72),
+         temp <= 78, temp <= 85, temp <= 92, temp <= 100],
+        [-80, -70, -55, (50 - temp) * -4.0, (60 - temp) * -2.5, 0,
+         (temp - 72) * -1.5, -9 + (temp - 78) * -3.0, -30 + (temp - 85) * -4.5, -61.5 + (temp - 92) * -5.5],
+        default=-105.5 + (temp - 100) * -7.0,
+    )
+    humidity_penalty = np.select(
+        [(temp > 90) & (humidity > 80), (temp > 90) & (humidity > 70), (temp > 90) & (humidity > 60),
+         (temp > 80) & (humidity > 80), (temp > 80) & (humidity > 70), (temp > 80) & (humidity > 60),
+         (temp < 40) & (humidity > 80), (temp < 40) & (humidity > 70), (temp < 50) & (humidity > 70),
+         humidity < 15, humidity < 20, humidity < 30],
+        [-30, -22, -15, -25, -18, -12, -15, -10, -8, -12, -10, -6],
+        default=0,
+    )
+    precip_penalty = np.select(
+        [rain0 == 0, rain < 0.25, rain < 0.5, rain < 1.0, rain < 1.5, rain < 3, rain < 6, rain < 10],
+        [0, -12, -18, -28, -38, -50, -65, -80],
+        default=-100,
+    )
+    wind_effect = np.select(
+        [(temp < 40) & (wind0 > 25), (temp < 40) & (wind > 20), (temp < 40) & (wind > 15),
+         (temp < 40) & (wind > 10), (temp < 40) & (wind > 5),
+         (temp < 50) & (wind > 20), (temp < 50) & (wind > 15), (temp < 50) & (wind > 10), (temp < 50) & (wind > 5),
+         (temp < 65) & (wind > 20), (temp < 65) & (wind > 15), (temp < 65) & (wind > 10),
+         (temp > 85) & (wind > 15), (temp > 85) & (wind > 10), (temp > 85) & (wind > 5), (temp > 85) & (wind <= 5),
+         (temp > 78) & (wind > 15), (temp > 78) & (wind > 10), (temp > 78) & (wind > 5)],
+        [-30, -24, -18, -12, -8, -22, -16, -10, -6, -14, -10, -6, 10, 8, 5, -8, 6, 5, 3],
+        default=0,
+    )
+    extreme_wind_penalty = np.select(
+        [wind0 > 40, wind > 35, wind > 30, wind > 25],
+        [-50, -35, -25, -15],
+        default=0,
+    )
+    cloud_penalty = np.select(
+        [(cloud0 < 10) & (temp > 85), (cloud < 10) & (temp > 75), (cloud < 10) & (temp > 65), cloud < 10,
+         _between(cloud, 10, 29), _between(cloud, 30, 69), _between(cloud, 70, 84), _between(cloud, 85, 94)],
+        [-18, -15, -8, 0, 2, 3, -6, -15],
+        default=-25,
+    )
+    uv_penalty = np.select(
+        [uv0 >= 11, uv >= 9, uv >= 7, uv >= 5, uv >= 3],
+        [-25, -18, -12, -6, -2],
+        default=0,
+    )
+    perfect_day_bonus = np.where(_between(temp, 62, 70) & _between(humidity, 40, 60) & (rain0 == 0), 5, 0)
+    nice_clouds_bonus = np.where(_between(cloud0, 30, 60) & (rain0 == 0), 3, 0)
+    comfortable_cool_bonus = np.where(_between(temp, 55, 65) & (wind0 < 8) & (rain0 == 0), 2, 0)
+
+    # Same left-to-right order as the SQL so floating point sums match exactly
+    return (100.0 + temp_penalty + humidity_penalty + precip_penalty + wind_effect + extreme_wind_penalty
+            + cloud_penalty + uv_penalty + perfect_day_bonus + nice_clouds_bonus + comfortable_cool_bonus)
+
+
+def _clamp(x):
+    # GREATEST/LEAST skip NULLs in DuckDB, so a missing total clamps to 100
+    return np.where(np.isnan(x), 100.0, np.clip(x, 1, 100))
+
+
+def _round1(x):
+    # DuckDB ROUND(x, 1): round half away from zero on x * 10
+    scaled = x * 10
+    whole = np.trunc(scaled)
+    whole = whole + np.where(np.abs(scaled - whole) >= 0.5, np.sign(scaled), 0)
+    return whole / 10
+
+
+def rate_scores(total):
+    """Condition ratings for an array of totals or scores (e.g. a day's average score)"""
+    clamped = _clamp(np.asarray(total, dtype=np.float64))
+    return np.select(
+        [clamped >= threshold for threshold, _ in RATINGS],
+        [rating for _, rating in RATINGS],
+        default=LOWEST_RATING,
+    )
+
+
+def score_weather(temp, humidity, rain, wind, cloud, uv):
+    """Vectorised zoo weather score; returns (scores, ratings) arrays"""
+    total = score_total(temp, humidity, rain, wind, cloud, uv)
+    return _clamp(_round1(total)), rate_scores(total)
+
+
+def score_new_observations(con, source, target='weather.zoo_weather_scores'):
+    """Score the rows of source (a weather_realtime-shaped table) that are not yet in target.
+
+    Only new (time, location) pairs are scored, so repeated runs cost the size of the new data.
+    Returns the number of rows inserted.
+    """
+    install_macros(con)
+    con.execute(SCORES_DDL.format(target=target))
+    return con.execute(f"""
+        INSERT INTO {target}
+        SELECT time, location, zoo_weather_score(total), zoo_weather_rating(total)
+        FROM (
+            SELECT s.time, s.location, zoo_weather_total({REALTIME_COLUMNS}) AS total
+            FROM {source} s
+            ANTI JOIN {target} t ON t.time = s.time AND t.location IS NOT DISTINCT FROM s.location
+        )
+        ORDER BY time;
+    """).fetchone()[0]
+
+
+def rescore_all(con, source, target='weather.zoo_weather_scores'):
+    """Recompute the whole scores table, e.g. after the scoring rules change"""
+    con.execute(f"DROP TABLE IF EXISTS {target};")
+    return score_new_observations(con, source, target)
+
+
+def check_agreement(rows=200_000, seed=0):
+    """Score random and edge-case inputs with NumPy and with the DuckDB macros; returns mismatching rows"""
+    import duckdb
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    edges = {
+        'temp': [19.9, 20, 32, 40, 49.5, 50, 55, 59.9, 60, 62, 65, 70, 72, 72.5, 78, 78.1, 85, 85.5, 90, 92, 100, 104.3],
+        'humidity': [0, 14, 15, 19, 20, 29, 30, 40, 60, 61, 70, 71, 80, 81, 100],
+        'rain': [0, 0.1, 0.25, 0.49, 0.5, 1, 1.5, 2.9, 3, 6, 10, 12],
+        'wind': [0, 4.9, 5, 5.1, 7.9, 8, 10, 15, 20, 25, 30, 35, 40, 41],
+        'cloud': [0, 9.9, 10, 29, 29.5, 30, 60, 69, 69.5, 70, 84, 85, 94, 94.5, 100],
+        'uv': [0, 2, 3, 5, 7, 9, 11, 12],
+    }
+    ranges = {'temp': (-10, 115), 'humidity': (0, 100), 'rain': (0, 12), 'wind': (0, 50), 'cloud': (0, 100), 'uv': (0, 12)}
+    data = {}
+    for name, (low, high) in ranges.items():
+        scale = 10.0 ** rng.integers(0, 3, rows)  # whole numbers and 1-2 decimals, like the API
+        values = np.round(rng.uniform(low, high, rows) * scale) / scale
+        pick = rng.random(rows) < 0.3
+        values[pick] = rng.choice(edges[name], pick.sum())
+        values[rng.random(rows) < 0.02] = np.nan  # missing readings
+        data[name] = values
+    df = pd.DataFrame(data)
+
+    score, rating = score_weather(df.temp, df.humidity, df.rain, df.wind, df.cloud, df.uv)
+
+    con = duckdb.connect()
+    install_macros(con)
+    sql = con.execute("""
+        SELECT zoo_weather_score(total) AS score, zoo_weather_rating(total) AS rating
+        FROM (SELECT zoo_weather_total(temp, humidity, rain, wind, cloud, uv) AS total FROM df)
+    """).fetchdf()
+    con.close()
+
+    mismatch = (sql.score.to_numpy() != score) | (sql.rating.to_numpy() != rating)
+    return df[mismatch].assign(numpy_score=score[mismatch], sql_score=sql.score[mismatch],
+                               numpy_rating=rating[mismatch], sql_rating=sql.rating[mismatch])
+
+
+# (temp, humidity, rain, wind, cloud, uv, score, rating) on the band edges; None is a missing reading
+PINNED_SCORES = [
+    (19.9, 50, 0, 5, 50, 3, 24.0, 'Miserable'),
+    (20, 50, 0, 5, 50, 3, 34.0, 'Very Bad'),
+    (40, 75, 0.1, 21, 5, 1, 18.0, 'Severe'),
+    (50, 71, 0.25, 10, 50, 2, 60.0, 'Fair'),
+    (60, 45, 0, 7.9, 30, 4, 100.0, 'Perfect'),
+    (70, 60, 0, 8, 29.5, 6, 74.0, 'Pleasant'),
+    (72, 50, 0, 5, 10, 7, 90.0, 'Outstanding'),
+    (72.5, 29, 0.49, 4.9, 9.9, 9, 49.3, 'Subpar'),
+    (78, 61, 0.5, 15.1, 69.5, 11, 13.0, 'Extreme'),
+    (85, 81, 1.0, 5, 85, 8, 1.0, 'Dangerous'),
+    (104.3, 14, 10, 41, 0, 11, 1.0, 'Dangerous'),
+    (65, None, None, None, None, None, 77.0, 'Good'),
+    (None, 50, 0, 5, 50, 3, 100.0, 'Perfect'),
+    (None, None, None, None, None, None, 100.0, 'Perfect'),
+    (55, 50, None, 7, None, 0, 64.5, 'Fair'),
+    (88, 65, 0.3, None, 5, None, 8.5, 'Dangerous'),
+]
+
+
+def check_pinned_scores():
+    """Score PINNED_SCORES with NumPy and with the macros (missing readings as SQL NULLs); returns the problems"""
+    import duckdb
+
+    inputs = np.array([[np.nan if v is None else v for v in case[:6]] for case in PINNED_SCORES]).T
+    score, rating = score_weather(*inputs)
+    con = duckdb.connect()
+    install_macros(con)
+    values = ", ".join(
+        "(" + ", ".join([str(i)] + ["NULL" if v is None else f"{v}::DOUBLE" for v in case[:6]]) + ")"
+        for i, case in enumerate(PINNED_SCORES)
+    )
+    sql = con.execute(f"""
+        SELECT zoo_weather_score(total), zoo_weather_rating(total)
+        FROM (
+            SELECT i, zoo_weather_total(temp, humidity, rain, wind, cloud, uv) AS total
+            FROM (VALUES {values}) v(i, temp, humidity, rain, wind, cloud, uv)
+        )
+        ORDER BY i;
+    """).fetchall()
+    con.close()
+    problems = []
+    for case, numpy_score, numpy_rating, sql_result in zip(PINNED_SCORES, score, rating, sql):
+        expected = tuple(case[6:])
+        numpy_result = (float(numpy_score), str(numpy_rating))
+        if numpy_result != expected or tuple(sql_result) != expected:
+            problems.append(f"{case[:6]}: expected {expected}, NumPy {numpy_result}, SQL {sql_result}")
+    return problems
+
+
+def check_no_rescore():
+    """Run score_new_observations() twice over a growing table; returns the problems"""
+    import duckdb
+
+    con = duckdb.connect()
+    con.execute("""
+        CREATE TABLE realtime (
+            time TIMESTAMP WITH TIME ZONE, location VARCHAR, values__temperature DOUBLE, values__humidity DOUBLE,
+            values__rain_intensity DOUBLE, values__wind_speed DOUBLE, values__cloud_cover DOUBLE, values__uv_index DOUBLE
+        );
+        INSERT INTO realtime VALUES
+            ('2026-06-01 10:00:00+00', 'zoo', 70, 50, 0, 5, 40, 3),
+            ('2026-06-01 10:10:00+00', 'zoo', 88, 65, 0.3, NULL, 5, NULL),
+            ('2026-06-01 10:00:00+00', NULL, 55, 50, NULL, 7, NULL, 0);
+    """)
+    problems = []
+    first = score_new_observations(con, 'realtime', 'scores')
+    if first != 3:
+        problems.append(f"first run scored {first} rows, expected 3")
+    # A stored score that a rescore would overwrite, and one new observation
+    con.execute("UPDATE scores SET zoo_weather_score = -1;")
+    con.execute("INSERT INTO realtime VALUES ('2026-06-01 10:20:00+00', 'zoo', 71, 50, 0, 5, 40, 3);")
+    second = score_new_observations(con, 'realtime', 'scores')
+    if second != 1:
+        problems.append(f"second run scored {second} rows, expected only the new one")
+    kept, total = con.execute("SELECT COUNT(*) FILTER (WHERE zoo_weather_score = -1), COUNT(*) FROM scores;").fetchone()
+    if (kept, total) != (3, 4):
+        problems.append(f"{kept} of 3 scored rows kept their score, {total} rows in all (expected 4)")
+    con.close()
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Zoo weather score engine")
+    parser.add_argument('--check', action='store_true', help="verify the NumPy and DuckDB implementations agree")
+    parser.add_argument('--rows', type=int, default=200_000)
+    args = parser.parse_args()
+
+    if args.check:
+        failed = False
+        bad = check_agreement(args.rows)
+        if bad.empty:
+            print(f"NumPy and DuckDB scores agree on {args.rows:,} rows")
+        else:
+            print(f"{len(bad):,} of {args.rows:,} rows disagree:")
+            print(bad.head(20).to_string())
+            failed = True
+        for name, check in (('pinned scores', check_pinned_scores), ('incremental scoring', check_no_rescore)):
+            problems = check()
+            print(f"{name}: " + ("ok" if not problems else f"{len(problems)} problem(s)"))
+            for problem in problems:
+                print(f"  {problem}")
+            failed = failed or bool(problems)
+        if failed:
+            raise SystemExit(1)